@@ -2,8 +2,6 @@ import numpy        as np
 import scipy.signal as signal
 import scipy.stats  as stats
 
-from functools import wraps
-
 from .. core.core_functions import to_col_vector
 
 from ..types.symbols import BlsMode
@@ -23,38 +21,113 @@ def scipy_mode(x, axis=0):
     return m
 
 
-def mode(wfs, axis=0):
+def _wf_mode(wf):
+    positive = wf > 0
+    return np.bincount(wf[positive]).argmax() if np.count_nonzero(positive) else 0
+
+
+def _window_modes(wfs, width):
+    """
+    Mode of the positive samples of each row of `wfs`,
+    with a single bincount for all rows. Only the values
+    in a window of `width` adc above the lowest positive
+    sample of each row are counted. The result is exact
+    if there are fewer samples above the window than the
+    counts of the mode found inside it; otherwise the row
+    is recomputed with a full bincount.
+    """
+    nrows  = len(wfs)
+    nbins  = width + 2
+    dtype  = np.int32 if wfs.dtype.itemsize < 4 else np.int64
+    lowest = wfs.min(axis=1, where=wfs > 0, initial=np.iinfo(wfs.dtype).max).astype(dtype)
+
+    # bin 0 collects the non-positive samples and bin
+    # width + 1 the samples above the window
+    index  = np.subtract(wfs, (lowest - 1)[:, np.newaxis], dtype=dtype)
+    np.clip(index, 0, nbins - 1, out=index)
+    index += np.arange(0, nrows * nbins, nbins, dtype=dtype)[:, np.newaxis]
+    counts = np.bincount(index.ravel(), minlength=nrows * nbins).reshape(nrows, nbins)
+
+    window = counts[:, 1:-1]
+    modes  = window.argmax(axis=1)
+    n_mode = window[np.arange(nrows), modes]
+    modes += lowest
+    for row in np.flatnonzero(counts[:, -1] > n_mode):
+        modes[row] = _wf_mode(wfs[row])
+    modes[n_mode == 0] = 0
+    return modes
+
+
+def mode(wfs, axis=0, *, window=256, chunk_size=256):
     """
     A fast calculation of the mode: it runs 10 times
     faster than the SciPy version but only applies to
     positive waveforms.
+
+    Integer waveforms are processed `chunk_size`
+    sensors at a time with one bincount for all of
+    them (see `_window_modes`).
     """
-    def wf_mode(wf):
-        positive = wf > 0
-        return np.bincount(wf[positive]).argmax() if np.count_nonzero(positive) else 0
-    return np.apply_along_axis(wf_mode, axis, wfs).astype(float)
+    wfs = np.asanyarray(wfs)
+    if not np.can_cast(wfs.dtype, np.int64) or wfs.dtype == np.bool_:
+        return np.apply_along_axis(_wf_mode, axis, wfs).astype(float)
+
+    wfs   = np.moveaxis(wfs, axis, -1)
+    rows  = wfs.reshape(-1, wfs.shape[-1])
+    modes = np.concatenate([_window_modes(rows[i:i + chunk_size], window)
+                            for i in range(0, len(rows), chunk_size)] or [[]])
+    return modes.reshape(wfs.shape[:-1]).astype(float)
 
 
-def zero_masked(fn):
+def mean(wfs, axis=None):
+    """
+    Mean of the non-zero samples, to protect ZS mode.
+    Rows without non-zero samples yield 0.
+    Floating point input keeps its dtype.
     """
-    protection for mean and median
-    so that we get the correct answer in case of
-    zero suppressed data
+    wfs    = np.asanyarray(wfs)
+    dtype  = wfs.dtype if np.issubdtype(wfs.dtype, np.floating) else float
+    sums   = wfs.sum(axis=axis).astype(dtype, copy=False)
+    counts = np.count_nonzero(wfs, axis=axis)
+    return np.divide(sums, counts, out=np.zeros(np.shape(sums), dtype=dtype), where=counts > 0)
+
+
+def median(wfs, axis=None):
     """
-    @wraps(fn)
-    def proxy(wfs, *args, **kwds):
-        mask_wfs = np.ma.masked_where(wfs == 0, wfs)
-        return fn(mask_wfs, *args, **kwds).filled(0)
-    proxy.__doc__ = "Masked version to protect ZS mode \n\n" + proxy.__doc__
-    return proxy
+    Median of the non-zero samples, to protect ZS mode.
+    Rows without non-zero samples yield 0.
+    Floating point input keeps its dtype.
+
+    After sorting, the zeros of each row form a block
+    between the negative and the positive samples, so the
+    k-th non-zero sample is found by skipping that block.
+    """
+    wfs = np.asanyarray(wfs)
+    if axis is None:
+        wfs, axis = wfs.ravel(), 0
+
+    wfs        = np.moveaxis(wfs, axis, -1)
+    n_negative = np.count_nonzero(wfs < 0, axis=-1)[..., np.newaxis]
+    n_zero     = np.count_nonzero(wfs == 0, axis=-1)[..., np.newaxis]
+    n_nonzero  = wfs.shape[-1] - n_zero
+
+    # lower and upper central non-zero samples
+    high    = n_nonzero // 2
+    low     = np.where(n_nonzero % 2 == 1, high, high - 1)
+    central = np.concatenate([low, high], axis=-1)
+    central = np.where(central < n_negative, central, central + n_zero)
+    central = np.clip(central, 0, max(wfs.shape[-1] - 1, 0))
 
-median = zero_masked(np.ma.median)
-mean   = zero_masked(np.ma.mean)
+    values  = np.take_along_axis(np.sort(wfs, axis=-1), central, axis=-1)
+    medians = values.sum(axis=-1) / 2
+    dtype   = wfs.dtype if np.issubdtype(wfs.dtype, np.floating) else float
+    return np.where(n_nonzero[..., 0] > 0, medians, 0).astype(dtype, copy=False)
 
 
-def means  (wfs): return to_col_vector(mean  (wfs, axis=1))
-def medians(wfs): return to_col_vector(median(wfs, axis=1))
-def modes  (wfs): return to_col_vector(mode  (wfs, axis=1))
+# These also accept a stack of events with shape (k, n, m)
+def means  (wfs): return mean  (wfs, axis=-1)[..., np.newaxis]
+def medians(wfs): return median(wfs, axis=-1)[..., np.newaxis]
+def modes  (wfs): return mode  (wfs, axis=-1)[..., np.newaxis]
 
 
 def subtract_baseline(wfs, *, bls_mode=BlsMode.mean):
@@ -64,8 +137,8 @@ def subtract_baseline(wfs, *, bls_mode=BlsMode.mean):
 
     Parameters
     ----------
-    wfs: np.ndarray with shape (n, m)
-        Waveforms with baseline.
+    wfs: np.ndarray with shape (n, m) or (k, n, m)
+        Waveforms with baseline, optionally stacked for k events.
 
     Keyword-only parameters
     -----------------------
@@ -74,14 +147,14 @@ def subtract_baseline(wfs, *, bls_mode=BlsMode.mean):
 
     Returns
     -------
-    bls: np.ndarray with shape (n, m)
+    bls: np.ndarray with the same shape as `wfs`
         Baseline-subtracted waveforms.
     """
 
     if   bls_mode is BlsMode.mean     : return wfs - means     (wfs)
     elif bls_mode is BlsMode.median   : return wfs - medians   (wfs)
     elif bls_mode is BlsMode.mode     : return wfs - modes     (wfs)
-    elif bls_mode is BlsMode.scipymode: return wfs - scipy_mode(wfs, axis=1)
+    elif bls_mode is BlsMode.scipymode: return wfs - scipy_mode(wfs, axis=-1)
     else:
         raise TypeError(f"Unrecognized baseline subtraction option: {bls_mode}")
 
@@ -107,6 +180,8 @@ def calibrate_pmts(cwfs, adc_to_pes, n_maw=100, thr_maw=3):
     This function is called for PMT waveforms that have
     already been baseline restored and pedestal subtracted.
     It computes the calibrated waveforms and its sensor sum.
+    The waveforms may be stacked for several events, with
+    shape (events, sensors, samples).
     It also computes the calibrated waveforms and sensor
     sum for elements of the waveforms above some value
     (thr_maw) over a MAW that follows the waveform. These
@@ -115,14 +190,14 @@ def calibrate_pmts(cwfs, adc_to_pes, n_maw=100, thr_maw=3):
     without the MAW should be applied for S2 searches).
     """
     window      = np.full(n_maw, 1 / n_maw)
-    maw         = signal.lfilter(window, 1, cwfs, axis=1)
+    maw         = signal.lfilter(window, 1, cwfs, axis=-1)
 
     # ccwfs stands for calibrated corrected waveforms
     ccwfs       = calibrate_wfs(cwfs, adc_to_pes)
     ccwfs_maw   = np.where(cwfs >= maw + thr_maw, ccwfs, 0)
 
-    cwf_sum     = np.sum(ccwfs    , axis=0)
-    cwf_sum_maw = np.sum(ccwfs_maw, axis=0)
+    cwf_sum     = np.sum(ccwfs    , axis=-2)
+    cwf_sum_maw = np.sum(ccwfs_maw, axis=-2)
     return ccwfs, ccwfs_maw, cwf_sum, cwf_sum_maw
 
 
@@ -131,7 +206,7 @@ def pmt_subtract_maw(cwfs, n_maw=100):
     Subtract a MAW from the input waveforms.
     """
     window = np.full(n_maw, 1 / n_maw)
-    maw    = signal.lfilter(window, 1, cwfs, axis=1)
+    maw    = signal.lfilter(window, 1, cwfs, axis=-1)
 
     return cwfs - maw
 
@@ -139,9 +214,10 @@ def pmt_subtract_maw(cwfs, n_maw=100):
 def calibrate_sipms(sipm_wfs, adc_to_pes, thr, *, bls_mode=BlsMode.mode):
     """
     Subtracts the baseline, calibrates waveforms to pes
-    and suppresses values below `thr` (in pes).
+    and suppresses values below `thr` (in pes). The
+    waveforms may be stacked for several events.
     """
-    thr  = to_col_vector(np.full(sipm_wfs.shape[0], thr))
+    thr  = to_col_vector(np.full(sipm_wfs.shape[-2], thr))
     bls  = subtract_baseline(sipm_wfs, bls_mode=bls_mode)
     cwfs = calibrate_wfs(bls, adc_to_pes)
     return np.where(cwfs > thr, cwfs, 0)
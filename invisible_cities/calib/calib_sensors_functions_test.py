@@ -9,6 +9,11 @@ from pytest import mark
 from pytest import raises
 from flaky  import flaky
 
+from hypothesis             import given
+from hypothesis.strategies  import integers
+from hypothesis.strategies  import sampled_from
+from hypothesis.extra.numpy import arrays
+
 from .. core.testing_utils import all_elements_close
 
 from .          import calib_sensors_functions as csf
@@ -238,6 +243,78 @@ def test_calibrate_sipms_individual_thresholds(toy_sipm_signal):
         assert actual == approx(expected)
 
 
+@mark.parametrize("bls_mode", BlsMode)
+def test_stacked_events_same_as_one_at_a_time(bls_mode):
+    n_events, n_sensors, n_samples = 3, 4, 50
+    wfs        = np.random.randint(0, 100, size=(n_events, n_sensors, n_samples)).astype(np.int16)
+    adc_to_pes = np.array([20., 0., 15., 10.])
+    thr        = np.array([ 1., 2.,  0.,  3.])
+
+    got_bls  = csf.subtract_baseline(wfs, bls_mode=bls_mode)
+    got_pmts = csf.calibrate_pmts   (wfs, adc_to_pes, n_maw=10, thr_maw=5)
+    got_sims = csf.calibrate_sipms  (wfs, adc_to_pes, thr     , bls_mode=bls_mode)
+    for i, event_wfs in enumerate(wfs):
+        assert np.allclose(got_bls [i], csf.subtract_baseline(event_wfs, bls_mode=bls_mode))
+        assert np.allclose(got_sims[i], csf.calibrate_sipms  (event_wfs, adc_to_pes, thr, bls_mode=bls_mode))
+        for got, expected in zip(got_pmts, csf.calibrate_pmts(event_wfs, adc_to_pes, n_maw=10, thr_maw=5)):
+            assert np.allclose(got[i], expected)
+
+
+def per_sensor_mode(wf):
+    positive = wf > 0
+    return np.bincount(wf[positive]).argmax() if np.count_nonzero(positive) else 0
+
+
+def zero_masked_reference(fn, wfs, axis):
+    return np.ma.filled(fn(np.ma.masked_where(wfs == 0, wfs), axis=axis), 0)
+
+
+@given(arrays(sampled_from([np.int16, np.int32, np.int64]),
+              (3, 4, 30), elements=integers(-3, 600)),
+       integers(0, 2), integers(1, 20), integers(1, 5))
+def test_mode_same_as_per_sensor_bincount(wfs, axis, window, chunk_size):
+    expected = np.apply_along_axis(per_sensor_mode, axis, wfs)
+    got      = csf.mode(wfs, axis=axis, window=window, chunk_size=chunk_size)
+    assert np.array_equal(got, expected)
+
+
+@mark.parametrize("fn masked_fn".split(),
+                  ((csf.mean  , np.ma.mean  ),
+                   (csf.median, np.ma.median)))
+@given(wfs  = arrays(sampled_from([np.int16, np.int64, np.float64]),
+                     (3, 4, 30), elements=integers(-50, 50)),
+       axis = integers(0, 2))
+def test_zero_masked_estimators_same_as_masked_arrays(fn, masked_fn, wfs, axis):
+    expected = zero_masked_reference(masked_fn, wfs, axis)
+    got      = fn(wfs, axis=axis)
+    assert got.dtype == expected.dtype
+    assert np.array_equal(got, expected)
+
+
+@mark.parametrize("fn"  , (csf.mean, csf.median))
+@mark.parametrize("axis", (None, 0, 1))
+def test_zero_masked_estimators_keep_float32(fn, axis):
+    wfs = np.array([[0, 1, 2, 4],
+                    [0, 0, 0, 0]], dtype=np.float32)
+    assert fn(wfs, axis=axis).dtype == np.float32
+
+
+@mark.parametrize("fn", (csf.mode, csf.mean, csf.median))
+def test_baseline_estimators_all_zero_and_negative_sensors(fn):
+    wfs = np.array([[ 0,  0,  0,  0,  0],
+                    [-1, -2,  0, -2,  0],
+                    [-3,  0,  5,  5,  2]], dtype=np.int16)
+    expected = {csf.mode  : [0,  0 , 5 ],
+                csf.mean  : [0, -5/3, 9/4],
+                csf.median: [0, -2 , 3.5]}[fn]
+    assert np.allclose(fn(wfs, axis=1), expected)
+
+
+def test_mode_outside_window_falls_back_to_full_count():
+    wf  = np.array([1, 2, 2] + [900] * 5, dtype=np.int16)
+    assert csf.mode(wf[np.newaxis], axis=1, window=10) == 900
+
+
 def test_wf_baseline_subtracted_is_close_to_zero(gaussian_sipm_signal):
     sipm_wfs, adc_to_pes = gaussian_sipm_signal
     bls_wf = csf.subtract_baseline_and_calibrate(sipm_wfs, adc_to_pes)
@@ -24,7 +24,7 @@ The workflow of Beersheba can be summarized as:
     redistribution
   - Drops isolated sensors (*)
   - Normalizes charge within each S2 peak
-  - For each slice
+  - For each slice (all the slices of an S2 are processed together)
     - Interpolates the hits to obtain a continuous image (real_image)
     - Generate a flat charge distribution as a seed
     - Do the following until a maximum number of iterations is reached
@@ -66,12 +66,12 @@ from .. dataflow.dataflow      import pipe
 
 from .. database.load_db       import DataSiPM
 
-from .. reco.deconv_functions  import find_nearest
+from .. reco.deconv_functions  import PSFLibrary
 from .. reco.deconv_functions  import cut_and_redistribute_df
 from .. reco.deconv_functions  import drop_isolated_sensors
 from .. reco.deconv_functions  import drop_isolated_clusters
-from .. reco.deconv_functions  import deconvolve
-from .. reco.deconv_functions  import richardson_lucy
+from .. reco.deconv_functions  import deconvolve_slices
+from .. reco.deconv_functions  import richardson_lucy_stack
 from .. reco.deconv_functions  import no_satellite_killer
 
 from .. io.run_and_event_io    import run_and_event_writer
@@ -112,7 +112,8 @@ def deconvolve_signal(det_db           : pd.DataFrame,
                       n_dim            : Optional[int]=2,
                       cut_type         : Optional[CutType]=CutType.abs,
                       inter_method     : Optional[InterpolationMethod]=InterpolationMethod.cubic,
-                      n_iterations_g   : Optional[int]=0):
+                      n_iterations_g   : Optional[int]=0,
+                      regular_grid     : Optional[bool]=False):
     """
     Applies Lucy Richardson deconvolution to SiPM response with a
     given set of PSFs and parameters.
@@ -141,6 +142,9 @@ def deconvolve_signal(det_db           : pd.DataFrame,
                         `rel`: cut on the relative value (to the max) of the hits.
     inter_method     : Interpolation method (`nointerpolation`, `nearest`, `linear` or `cubic`).
     n_iterations_g   : Number of Lucy-Richardson iterations for gaussian in 'separate mode'
+    regular_grid     : Interpolate the hits as a regular grid instead of with
+                       scattered-data interpolation (griddata). Faster, but
+                       `linear` and `cubic` give slightly different images.
 
     Returns
     ----------
@@ -154,13 +158,14 @@ def deconvolve_signal(det_db           : pd.DataFrame,
     bin_size      = np.asarray(bin_size               )
     diffusion     = np.asarray(diffusion              )
 
-    psfs          = load_dst(psf_fname, 'PSF', 'PSFs')
+    psfs          = PSFLibrary(load_dst(psf_fname, 'PSF', 'PSFs'), n_dim)
     det_grid      = [np.arange(det_db[var].min() + bs/2, det_db[var].max() - bs/2 + np.finfo(np.float32).eps, bs)
                      for var, bs in zip(dimensions, bin_size)]
-    deconvolution = deconvolve(n_iterations, iteration_tol,
-                               sample_width, det_grid,
-                               **satellite_params,
-                               inter_method = inter_method)
+    deconvolution = deconvolve_slices(n_iterations, iteration_tol,
+                                      sample_width, det_grid,
+                                      **satellite_params,
+                                      inter_method = inter_method,
+                                      regular_grid = regular_grid)
 
     if not isinstance(energy_type , HitEnergy          ):
         raise ValueError(f'energy_type {energy_type} is not a valid energy type.')
@@ -171,41 +176,45 @@ def deconvolve_signal(det_db           : pd.DataFrame,
     if not isinstance(deconv_mode , DeconvolutionMode  ):
         raise ValueError(f'deconv_mode {deconv_mode} is not a valid deconvolution mode.')
 
-    def deconvolve_hits(df, z):
+    def select_psf(df, z):
         '''
-        Given an slice, applies deconvolution using the PSF
-        associated to the passed z.
+        Selects the PSF sector associated to the passed z and to
+        the peak position of the slice.
+        '''
+        zz = z if deconv_mode is DeconvolutionMode.joint else 0
+        return psfs.sector(df.Xpeak.iloc[0], df.Ypeak.iloc[0], zz)
+
+    def deconvolve_hits(hits):
+        '''
+        Given an S2, applies deconvolution to all its slices at once,
+        each one using the PSF associated to its z.
 
         Parameters
         ----------
-        df : Original input dataframe for the deconvolution (single slice cdst)
-        z  : Longitudinal position of the slice.
+        hits : Original input dataframe for the deconvolution (S2 cdst)
         Returns
         ----------
-        Dataframe with the deconvolved slice.
+        Dataframe with the deconvolved S2.
         '''
-        xx, yy = df.Xpeak.unique(), df.Ypeak.unique()
-        zz     = z if deconv_mode is DeconvolutionMode.joint else 0
-        psf = psfs.loc[(psfs.z == find_nearest(psfs.z, zz)) &
-                       (psfs.x == find_nearest(psfs.x, xx)) &
-                       (psfs.y == find_nearest(psfs.y, yy)) , :]
+        zs, slices = zip(*hits.groupby("Z"))
+        sectors    = list(map(select_psf, slices, zs))
+        data       = [tuple(df.loc[:, dimensions].values.T) for df in slices]
+        weights    = [df.NormQ.values                       for df in slices]
 
-        deconv_image, pos = deconvolution(tuple(df.loc[:, dimensions].values.T), df.NormQ.values, psf)
+        deconv_images, pos = deconvolution(data, weights, psfs, sectors)
 
         if   deconv_mode is DeconvolutionMode.joint:
             pass
         elif deconv_mode is DeconvolutionMode.separate:
-            dist         = multivariate_normal(np.zeros(n_dim), diffusion**2 * z * units.mm / units.cm) #Z is in mm in cdst
-            cols         = tuple(f"{v.lower()}r" for v in dimensions)
-            psf_cols     = psf.loc[:, cols]
-            gaus         = dist.pdf(psf_cols.values)
-            psf          = gaus.reshape(psf_cols.nunique())
-            deconv_image = nan_to_num(richardson_lucy(deconv_image, psf,
-                                                      iterations = n_iterations_g,
-                                                      iter_thr = iteration_tol,
-                                                      **satellite_params))
-
-        return create_deconvolution_df(df, deconv_image.flatten(), pos, cut_type, e_cut, n_dim)
+            gaus          = [multivariate_normal(np.zeros(n_dim), diffusion**2 * z * units.mm / units.cm) #Z is in mm in cdst
+                             .pdf(psfs.coordinates(sector)).reshape(psfs.shape) for z, sector in zip(zs, sectors)]
+            deconv_images = list(map(nan_to_num, richardson_lucy_stack(deconv_images, gaus,
+                                                                       iterations = n_iterations_g,
+                                                                       iter_thr   = iteration_tol,
+                                                                       **satellite_params)))
+
+        return pd.concat([create_deconvolution_df(df, deconv_image.flatten(), p, cut_type, e_cut, n_dim)
+                          for df, deconv_image, p in zip(slices, deconv_images, pos)], ignore_index=True)
 
     def apply_deconvolution(df):
         '''
@@ -224,7 +233,7 @@ def deconvolve_signal(det_db           : pd.DataFrame,
         df.loc[:, "NormQ"] = np.nan
         for peak, hits in df.groupby("npeak"):
             hits.loc[:, "NormQ"] = hits.loc[:, 'Q'] / hits.loc[:, 'Q'].sum()
-            deconvolved_hits = pd.concat([deconvolve_hits(df_z, z) for z, df_z in hits.groupby("Z")], ignore_index=True)
+            deconvolved_hits = deconvolve_hits(hits)
             deconvolved_hits = deconvolved_hits.assign(npeak=peak, Xpeak=hits.Xpeak.iloc[0], Ypeak=hits.Ypeak.iloc[0])
             distribute_energy(deconvolved_hits, hits, energy_type)
             deco_dst.append(deconvolved_hits)
@@ -330,18 +339,18 @@ def drop_isolated( distance   : List[float],
     
     # distance is XY -> N
     if   len(distance) == 2:
-        drop = drop_isolated_sensors(distance, redist_var)
+        drop = drop_isolated_sensors(distance, redist_var, ['event', 'npeak'])
     elif len(distance) == 3:
         if nhits is None:
             raise TypeError(f"Applying 3-dimensional dropping of isolated hits requires parameter nhits which is missing.")    
         else:
-            drop = drop_isolated_clusters(distance, nhits, redist_var)
+            drop = drop_isolated_clusters(distance, nhits, redist_var, ['event', 'npeak'])
     else:
         raise ValueError(f"Invalid drop_dist parameter: expected 2 or 3 entries, but got {len(distance)}.")
 
 
     def drop_isolated(df): # df shall be an event cdst
-        df = df.groupby(['event', 'npeak']).apply(drop).reset_index(drop=True)
+        df = drop(df).reset_index(drop=True)
 
         return df
 
@@ -445,6 +454,13 @@ def beersheba( files_in         : OneOrManyFiles
             'cubic' not supported for 3D deconvolution.
         n_iterations_g       : int
             Number of Lucy-Richardson iterations for gaussian in 'separate mode'
+        regular_grid         : bool, optional
+            Interpolate the sensors as a regular grid, one axis at a time,
+            instead of with scattered-data interpolation (griddata, default).
+            The interpolation of each slice runs ~15-40 times faster with
+            `nearest`, which gives the same result, and ~6-11 times faster
+            with `linear` and ~8-11 times with `cubic`, which give images
+            that differ by a few percent of their maximum.
     satellite_params : dict, None
         satellite_start_iter : int
             Iteration no. when satellite killer starts being used.
@@ -18,6 +18,7 @@ from .. core.testing_utils import ignore_warning
 from .. types.symbols      import HitEnergy
 from .. types.symbols      import DeconvolutionMode
 from .. types.symbols      import CutType
+from .. types.symbols      import InterpolationMethod
 
 
 def test_create_deconvolution_df(ICDATADIR):
@@ -142,6 +143,33 @@ def test_beersheba_exact_result_with_satkill( ICDATADIR
                 assert_tables_equality(got, expected, rtol=1e-6)
 
 
+@ignore_warning.no_config_group
+@ignore_warning.str_length
+@ignore_warning.not_kdst
+@mark.parametrize("inter_method", ( InterpolationMethod.nearest
+                                  , InterpolationMethod.linear
+                                  , InterpolationMethod.cubic))
+def test_beersheba_regular_grid(beersheba_config, inter_method, config_tmpdir):
+    # the regular grid interpolation gives the same images as griddata
+    # only for `nearest`, but the energy of each event is preserved
+    outputs = {}
+    for regular_grid in (False, True):
+        path_out = os.path.join(config_tmpdir, f"beersheba_regular_grid_{regular_grid}.h5")
+        beersheba_config['deconv_params'].update(dict( inter_method = inter_method
+                                                     , regular_grid = regular_grid
+                                                     , n_iterations = 10))
+        beersheba_config.update(dict(file_out = path_out, event_range = 2))
+        beersheba(**beersheba_config)
+        outputs[regular_grid] = dio.load_dst(path_out, "DECO", "Events")
+
+    griddata, regular = outputs[False], outputs[True]
+    if inter_method is InterpolationMethod.nearest:
+        assert_dataframes_close(regular, griddata)
+    else:
+        assert np.allclose(regular .groupby("event").E.sum(),
+                           griddata.groupby("event").E.sum(), rtol=1e-6)
+
+
 @mark.parametrize("ndim", (1, 3))
 def test_beersheba_only_ndim_2_is_valid(beersheba_config, ndim, config_tmpdir):
     path_out = os.path.join(config_tmpdir, "beersheba_only_ndim_2_is_valid.h5")
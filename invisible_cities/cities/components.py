@@ -1,13 +1,17 @@
 from functools       import wraps
 from functools       import partial
+from importlib       import import_module
 from collections.abc import Sequence
 from argparse        import Namespace
 from glob            import glob
 from os.path         import expandvars
 from itertools       import count
 from itertools       import repeat
+from itertools       import chain
+from concurrent.futures import ProcessPoolExecutor
 from typing          import Callable
 from typing          import Iterator
+from typing          import Iterable
 from typing          import Mapping
 from typing          import Generator
 from typing          import List
@@ -20,6 +24,7 @@ from typing          import Optional
 import tables as tb
 import numpy  as np
 import pandas as pd
+import tempfile
 import warnings
 import math
 import os
@@ -42,6 +47,7 @@ from .. core   .exceptions        import InvalidInputFileStructure
 from .. core   .exceptions        import          SensorIDMismatch
 from .. core   .configure         import          event_range_help
 from .. core   .configure         import         check_annotations
+from .. core   .configure         import            EventRangeType
 from .. core   .random_sampling   import              NoiseSampler
 from .. detsim                    import          buffer_functions as  bf
 from .. detsim                    import          sensor_functions as  sf
@@ -140,16 +146,260 @@ def city(city_function):
         conf.event_range  = event_range(conf)
         # TODO There were deamons! self.daemons = tuple(map(summon_daemon, kwds.get('daemons', [])))
 
+        n_workers = getattr(conf, 'n_workers', 1)
+        profile   = getattr(conf, 'profile'  , False)
+        if hasattr(conf, 'n_workers'):         del conf.n_workers
+        if hasattr(conf, 'profile'):           del conf.profile
+
+        if n_workers > 1 and city_function.__name__ not in CITY_EVENT_NODES:
+            warnings.warn(f"{city_function.__name__} cannot be run in parallel. Ignoring n_workers.", UserWarning)
+            n_workers = 1
+
         args   = vars(conf)
-        result = check_annotations(city_function)(**args)
+        shards = city_shards(conf.files_in, conf.event_range, n_workers)
+        if len(shards) > 1:
+            result = run_city_in_parallel(city_function, args, shards, profile)
+        else:
+            result = run_city(city_function, args, profile)
+        if profile and isinstance(result, Namespace):
+            result.profile = merge_stage_profiles(result.profile)
         if os.path.exists(conf.file_out):
             write_city_configuration(conf.file_out, city_function.__name__, args)
+            if profile and isinstance(result, Namespace):
+                write_city_profile(conf.file_out, result.profile)
             copy_cities_configuration(conf.files_in[0], conf.file_out)
             index_tables(conf.file_out)
         return result
     return proxy
 
 
+def city_shards(files_in    : List[str],
+                event_range : EventRangeType,
+                n_workers   : int) -> List[Tuple[List[str], EventRangeType]]:
+    """
+    Split the input of a city in at most `n_workers` shards, each one
+    given by its input files and event range. Processing the shards
+    one after the other gives the same events, in the same order, as
+    processing the whole input.
+
+    Several input files are split in groups of consecutive files when
+    all their events are processed. A single input file is split in
+    consecutive event ranges when the range is bounded, as the number
+    of events in the file is not known beforehand. Otherwise the input
+    is not split and a warning is issued.
+    """
+    if n_workers <= 1:
+        return [(files_in, event_range)]
+
+    def not_split(reason):
+        warnings.warn(f"The input cannot be split: {reason}. Running in a single process.", UserWarning)
+        return [(files_in, event_range)]
+
+    if len(files_in) > 1:
+        if tuple(event_range) != (None,):
+            return not_split("an event range is given for several input files")
+        groups = np.array_split(np.arange(len(files_in)), min(n_workers, len(files_in)))
+        return [([files_in[i] for i in group], event_range) for group in groups]
+
+    start, stop = (0, *event_range) if len(event_range) == 1 else event_range
+    if stop is None:
+        return not_split("a single input file is given without an upper bound to the event range")
+
+    start  = 0 if start is None else start
+    edges  = np.linspace(start, stop, min(n_workers, max(stop - start, 1)) + 1).astype(int)
+    return [(files_in, (int(first), int(last))) for first, last in zip(edges[:-1], edges[1:])]
+
+
+def run_city(city_function : Callable,
+             args          : dict,
+             profile       : bool = False) -> Any:
+    """
+    Run a city with the given arguments. If `profile` is set, the cost
+    of each stage of its pipeline is recorded and, when the city returns
+    a Namespace, stored in its `profile` attribute as a DataFrame with
+    one row per stage.
+    """
+    if not profile:
+        return check_annotations(city_function)(**args)
+
+    with fl.profiling() as stages:
+        result = check_annotations(city_function)(**args)
+
+    if isinstance(result, Namespace):
+        result.profile = (pd.DataFrame(stages.summary(), columns=fl.StageProfile.__slots__)
+                            .rename(columns=dict(name="stage")))
+    return result
+
+
+def merge_stage_profiles(profile : pd.DataFrame) -> pd.DataFrame:
+    """
+    Combine the rows of a stage profile that belong to the same stage,
+    as it happens when a city runs in several processes. Counts and
+    times are added up, the increase in memory is the largest one.
+    """
+    return (profile.groupby("stage", sort=False)
+                   .agg(dict(items_in         = "sum",
+                             items_out        = "sum",
+                             wall_time        = "sum",
+                             cpu_time         = "sum",
+                             max_rss_increase = "max"))
+                   .reset_index())
+
+
+def write_city_profile(filename : str, profile : pd.DataFrame):
+    with tb.open_file(filename, "a") as file:
+        str_col_length = max(32, profile.stage.str.len().max())
+        df_writer(file, profile, "Profile", "stages", "cost of each stage of the city",
+                  str_col_length = str_col_length)
+
+
+def _run_city_shard(city_module, city_name, args, profile, seed):
+    # Forked workers inherit the state of the global random number
+    # generator, so each shard is given its own seed
+    seed = int(seed.generate_state(1)[0])
+    np.random.seed(seed)
+    if "random_seed" in args:
+        args = dict(args, random_seed=seed)
+    # The city is looked up by name, as the workers may not be forked
+    city_function = getattr(import_module(city_module), city_name).__wrapped__
+    return run_city(city_function, args, profile)
+
+
+def run_city_in_parallel(city_function : Callable,
+                         args          : dict,
+                         shards        : List[Tuple[List[str], EventRangeType]],
+                         profile       : bool = False) -> Any:
+    """
+    Run a city over each shard of its input in a pool of processes.
+    Each process writes to a temporary file and these are merged into
+    the output file, in the order of the shards. The results are merged
+    with `merge_city_results`.
+
+    The random number generator of each shard is seeded with a seed
+    derived from `random_seed`, if the city takes one, so that the
+    shards do not draw the same numbers. The output is reproducible
+    given the seed and the number of shards, but differs from that of
+    a single process.
+    """
+    file_out = args["file_out"]
+    out_dir  = os.path.dirname(os.path.abspath(file_out))
+    seeds    = np.random.SeedSequence(args.get("random_seed")).spawn(len(shards))
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+        shard_files_out = [os.path.join(tmp_dir, f"{i}_{os.path.basename(file_out)}")
+                           for i in range(len(shards))]
+
+        with ProcessPoolExecutor(len(shards)) as pool:
+            futures = [pool.submit(_run_city_shard, city_function.__module__, city_function.__name__,
+                                   dict(args, files_in=files_in, event_range=shard_range, file_out=shard_out),
+                                   profile, seed)
+                       for (files_in, shard_range), shard_out, seed in zip(shards, shard_files_out, seeds)]
+            results = [future.result() for future in futures]
+
+        shard_files_out = list(filter(os.path.exists, shard_files_out))
+        if shard_files_out:
+            merge_city_outputs(shard_files_out, file_out, CITY_EVENT_NODES[city_function.__name__])
+
+    return merge_city_results(results)
+
+
+def merge_city_results(results : List[Any]) -> Any:
+    """
+    Combine the results of a city run over several shards: numbers are
+    added up, sequences and arrays are concatenated. Other values are
+    collected in a list.
+    """
+    def merge(values):
+        first = values[0]
+        if   isinstance(first, (bool, np.bool_))      : return values
+        elif isinstance(first, (int, float, np.number)): return sum(values)
+        elif isinstance(first, (list, tuple))         : return list(chain.from_iterable(values))
+        elif isinstance(first, np.ndarray)            : return np.concatenate(values)
+        elif isinstance(first, pd.DataFrame)          : return pd.concat(values, ignore_index=True)
+        else                                          : return values
+
+    if isinstance(results[0], Namespace):
+        return Namespace(**{k: merge([getattr(r, k) for r in results]) for k in vars(results[0])})
+    if isinstance(results[0], dict):
+        return {k: merge([r[k] for r in results]) for k in results[0]}
+    return merge(results)
+
+
+# MC tables with rows for each event, as copied by `copy_mc_info`
+MC_EVENT_TABLES = ("/MC/hits", "/MC/particles", "/MC/sns_response", "/MC/generators", "/MC/event_mapping")
+
+# Nodes with rows for each event written by the cities that can be run
+# in parallel: tables and arrays, or groups containing only those.
+CITY_EVENT_NODES = dict(
+    detsim      = ("/Run", "/Filters", "/pmtrd", "/sipmrd"                       , *MC_EVENT_TABLES),
+    buffy       = ("/Run", "/Filters", "/pmtrd", "/sipmrd"                       , *MC_EVENT_TABLES),
+    diomira     = ("/Run", "/Filters", "/RD"                                     , *MC_EVENT_TABLES),
+    isidora     = ("/Run", "/BLR"                                                , *MC_EVENT_TABLES),
+    irene       = ("/Run", "/Filters", "/Trigger", "/PMAPS", "/PMAPSIndex"       , *MC_EVENT_TABLES),
+    hypathia    = ("/Run", "/Filters", "/Trigger", "/PMAPS", "/PMAPSIndex"       , *MC_EVENT_TABLES),
+    dorothea    = ("/Run", "/Filters", "/DST"                                    , *MC_EVENT_TABLES),
+    penthesilea = ("/Run", "/Filters", "/DST", "/RECO"                           , *MC_EVENT_TABLES),
+    sophronia   = ("/Run", "/Filters", "/DST", "/RECO"                           , *MC_EVENT_TABLES),
+    esmeralda   = ("/Run", "/Filters", "/DST", "/CHITS", "/Tracking", "/Summary" , *MC_EVENT_TABLES),
+    beersheba   = ("/Run", "/Filters", "/DST", "/CHITS", "/DECO"                 , *MC_EVENT_TABLES),
+    isaura      = ("/Run", "/Filters", "/DST", "/DECO" , "/Tracking", "/Summary" , *MC_EVENT_TABLES),
+)
+
+def merge_city_outputs(files_in    : List[str],
+                       file_out    : str      ,
+                       event_nodes : Tuple[str, ...]) -> None:
+    """
+    Merge several city output files into one, keeping the order of
+    the files.
+
+    The tables and arrays in `event_nodes`, or in the groups in
+    `event_nodes`, hold rows for each event and are concatenated. The
+    rows of the event index tables (PMAPSIndex) are shifted to point
+    to the merged tables. Any other node (sensor tables, MC
+    configuration, etc.) is copied from the first file that contains
+    it.
+    """
+    def is_per_event(leaf):
+        if not isinstance(leaf, (tb.Table, tb.EArray)): return False
+        path = leaf._v_pathname
+        return any(path == node or path.startswith(node + "/") for node in event_nodes)
+
+    def is_event_index(leaf):
+        return (isinstance(leaf, tb.Table)                     and
+                leaf._v_parent._v_pathname == "/PMAPSIndex"    and
+                {"event", "start", "stop"}.issubset(leaf.colnames))
+
+    with tb.open_file(file_out, "w") as h5out:
+        for filename in files_in:
+            with tb.open_file(filename, "r") as h5in:
+                nrows = {leaf._v_pathname: leaf.nrows for leaf in h5out.walk_nodes("/", "Leaf")}
+
+                for group in h5in.walk_groups():
+                    if group._v_pathname not in h5out:
+                        group._f_copy(h5out.get_node(group._v_parent._v_pathname), recursive=False)
+
+                for leaf in h5in.walk_nodes("/", "Leaf"):
+                    path = leaf._v_pathname
+                    if path not in h5out:
+                        leaf._f_copy(h5out.get_node(leaf._v_parent._v_pathname))
+                        continue
+
+                    if not is_per_event(leaf): continue
+
+                    offset = 0
+                    if is_event_index(leaf):
+                        data_path = f"/PMAPS/{leaf.name}"
+                        offset    = nrows.get(data_path, 0)
+
+                    merged    = h5out.get_node(path)
+                    chunksize = max(leaf.nrowsinbuf, 1)
+                    for start in range(0, leaf.nrows, chunksize):
+                        rows = leaf.read(start, start + chunksize)
+                        if offset:
+                            rows["start"] += offset
+                            rows["stop" ] += offset
+                        merged.append(rows)
+
+
 @check_annotations
 def create_timestamp(rate: float) -> float:
     """
@@ -329,6 +579,45 @@ def collect():
     return fl.reduce(append, initial=[])()
 
 
+def map_batch(op, *, args=None, out=None, item=None):
+    """
+    Like `fl.map` with `args` and `out`, but for the lists of events
+    produced by `fl.batch`. The values of `args` in all the events of
+    the batch are stacked along a new first axis and `op` is applied
+    once to the stacks. Each of its outputs is split back into the
+    events along the first axis. Batches whose events have values of
+    different shapes are processed one event at a time.
+    """
+    if item is not None:
+        if args is not None or out is not None:
+            raise ValueError("map_batch: use of `item` parameter excludes both `args` and `out`")
+        args = out = item
+
+    if isinstance(args, str): args = args,
+    merged_output = isinstance(out, str)
+    if merged_output        : out  = out ,
+
+    def apply(*values):
+        trans = op(*values)
+        return (trans,) if merged_output else trans
+
+    @wraps(op)
+    def map_batch(events):
+        values = [[event[arg] for event in events] for arg in args]
+        if all(len(set(np.shape(v) for v in vs)) == 1 for vs in values):
+            trans = apply(*map(np.stack, values))
+            for name, value in zip(out, trans):
+                for event, event_value in zip(events, value):
+                    event[name] = event_value
+        else:
+            for event, event_values in zip(events, zip(*values)):
+                for name, value in zip(out, apply(*event_values)):
+                    event[name] = value
+        return events
+
+    return fl.map(map_batch)
+
+
 @check_annotations
 def copy_mc_info(files_in     : List[str],
                  h5out        : tb.File  ,
@@ -427,13 +716,20 @@ def deconv_pmt(dbfile, run_number, n_baseline,
                selection=None, pedestal_function=csf.means):
     DataPMT    = load_db.DataPMT(dbfile, run_number = run_number)
     pmt_active = np.nonzero(DataPMT.Active.values)[0].tolist() if selection is None else selection
-    coeff_c    = DataPMT.coeff_c  .values.astype(np.double)
-    coeff_blr  = DataPMT.coeff_blr.values.astype(np.double)
+    n_active   = len(pmt_active)
+    # The selected waveforms take the coefficients in their position
+    coeff_c    = DataPMT.coeff_c  .values.astype(np.double)[:n_active]
+    coeff_blr  = DataPMT.coeff_blr.values.astype(np.double)[:n_active]
 
+    # RWF may be a stack of events with shape (events, sensors, samples)
     def deconv_pmt(RWF):
-        CWF = pedestal_function(RWF[:, :n_baseline]) - RWF
-        return np.array(tuple(map(blr.deconvolve_signal, CWF[pmt_active],
-                                  coeff_c              , coeff_blr      )))
+        CWF     = pedestal_function(RWF[..., :n_baseline]) - RWF
+        CWF     = np.ascontiguousarray(CWF[..., pmt_active, :], dtype=np.double)
+        signals = CWF.reshape(-1, CWF.shape[-1])
+        n_wfs   = signals.shape[0] // max(n_active, 1)
+        return blr.deconvolve_signals(signals,
+                                      np.tile(coeff_c  , n_wfs),
+                                      np.tile(coeff_blr, n_wfs)).reshape(CWF.shape)
     return deconv_pmt
 
 
@@ -1216,11 +1512,31 @@ def waveform_integrator(limits):
     return integrate_wfs
 
 
+def flushing_sink(writer, *, args):
+    """
+    Like `sink`, but calls `writer.flush` when the pipeline is
+    closed, so that the data buffered by the writer is written
+    before the output file is closed.
+    """
+    write = fl.sink(writer, args=args)
+
+    @fl.coroutine
+    def flushing_sink_loop():
+        with fl.closing(write):
+            try:
+                while True:
+                    write.send((yield))
+            except GeneratorExit:
+                writer.flush()
+                raise
+    return flushing_sink_loop()
+
+
 # Compound components
 def compute_and_write_pmaps(detector_db, run_number, pmt_samp_wid, sipm_samp_wid,
                   s1_lmax, s1_lmin, s1_rebin_stride, s1_stride, s1_tmax, s1_tmin,
                   s2_lmax, s2_lmin, s2_rebin_stride, s2_stride, s2_tmax, s2_tmin, thr_sipm_s2,
-                  h5out, sipm_rwf_to_cal=None):
+                  h5out, sipm_rwf_to_cal=None, pmap_buffer_size=1):
 
     # Filter events without signal over threshold
     indices_pass    = fl.map(check_nonempty_indices,
@@ -1240,12 +1556,12 @@ def compute_and_write_pmaps(detector_db, run_number, pmt_samp_wid, sipm_samp_wid
     empty_pmaps     = fl.count_filter(bool, args = "pmaps_pass")
 
     # Define writers...
-    write_pmap_         = pmap_writer        (h5out,              )
+    write_pmap_         = pmap_writer        (h5out, buffer_size=pmap_buffer_size)
     write_indx_filter_  = event_filter_writer(h5out, "s12_indices")
     write_pmap_filter_  = event_filter_writer(h5out, "empty_pmap" )
 
     # ... and make them sinks
-    write_pmap         = sink(write_pmap_        , args=(        "pmap", "event_number"))
+    write_pmap         = flushing_sink(write_pmap_, args=("pmap", "event_number"))
     write_indx_filter  = sink(write_indx_filter_ , args=("event_number", "indices_pass"))
     write_pmap_filter  = sink(write_pmap_filter_ , args=("event_number",   "pmaps_pass"))
 
@@ -1457,12 +1773,13 @@ def summary_writer(h5out):
 
 
 @check_annotations
-def track_blob_info_creator_extractor(vox_size         : Tuple[float, float, float],
-                                      strict_vox_size  : bool                      ,
-                                      energy_threshold : float                     ,
-                                      min_voxels       : int                       ,
-                                      blob_radius      : float                     ,
-                                      max_num_hits     : int
+def track_blob_info_creator_extractor(vox_size             : Tuple[float, float, float],
+                                      strict_vox_size      : bool                      ,
+                                      energy_threshold     : float                     ,
+                                      min_voxels           : int                       ,
+                                      blob_radius          : float                     ,
+                                      max_num_hits         : int                       ,
+                                      max_voxels_all_pairs : Optional[int] = None
                                      ) -> Callable:
     """
     For a given paolina parameters returns a function that extract tracks / blob information from a HitCollection.
@@ -1481,6 +1798,13 @@ def track_blob_info_creator_extractor(vox_size         : Tuple[float, float, flo
         after min_voxel number of voxels is reached no dropping will happen.
     blob_radius      : float
         radius of blob
+    max_num_hits     : int
+        maximum number of hits allowed per event to run paolina functions.
+    max_voxels_all_pairs : int, optional
+        if given, the extrema of tracks with more voxels are found with
+        a double sweep instead of the distances between all pairs of
+        voxels. This is faster but only exact for tree-like tracks.
+        By default, all tracks use the exact search.
 
     Returns
     ----------
@@ -1533,12 +1857,12 @@ def track_blob_info_creator_extractor(vox_size         : Tuple[float, float, flo
                 e     = [h.Ep for v in t.nodes() for h in v.hits]
                 ave_pos = np.average(pos, weights=e, axis=0)
                 ave_r   = np.average(r  , weights=e, axis=0)
-                distances = plf.shortest_paths(t)
-                extr1, extr2, length = plf.find_extrema_and_length(distances)
+                distances = plf.TrackDistances(t)
+                extr1, extr2, length = plf.track_extrema_and_length(t, max_voxels_all_pairs, distances)
                 extr1_pos = extr1.XYZ
                 extr2_pos = extr2.XYZ
 
-                e_blob1, e_blob2, hits_blob1, hits_blob2, blob_pos1, blob_pos2 = plf.blob_energies_hits_and_centres(t, blob_radius)
+                e_blob1, e_blob2, hits_blob1, hits_blob2, blob_pos1, blob_pos2 = plf.blob_energies_hits_and_centres(t, blob_radius, max_voxels_all_pairs, distances)
 
                 overlap = float(sum(h.Ep for h in set(hits_blob1).intersection(set(hits_blob2))))
                 list_of_vars = [hitc.event, tID, energy, length, numb_of_voxels,
@@ -1571,28 +1895,15 @@ def sort_hits(hitc):
 
 
 def hitc_to_df(hitc: HitCollection):
-    hits = []
-    for hit in hitc.hits:
-        hits.append(pd.DataFrame(dict( event    = hitc.event
-                                     , time     = hitc.time
-                                     , npeak    = hit .npeak
-                                     , Xpeak    = hit .Xpeak
-                                     , Ypeak    = hit .Ypeak
-                                     , nsipm    = hit .nsipm
-                                     , X        = hit .X
-                                     , Y        = hit .Y
-                                     , Xrms     = hit .Xrms
-                                     , Yrms     = hit .Yrms
-                                     , Z        = hit .Z
-                                     , Q        = hit .Q
-                                     , E        = hit .E
-                                     , Qc       = hit .Qc
-                                     , Ec       = hit .Ec
-                                     , track_id = hit .track_id
-                                     , Ep       = hit .Ep), index=[0]))
-    df = pd.concat(hits, ignore_index=True)
-    df = df.astype(dict(event=np.int64, npeak=np.uint16, nsipm=np.uint16, Qc=np.float64, Ec=np.float64, Ep=np.float64))
-    return df
+    columns = hitc.columns()
+    nhits   = len(columns["X"])
+    df      = dict( event = np.full(nhits, hitc.event, dtype=np.int64)
+                  , time  = np.full(nhits, hitc.time))
+    df.update(columns)
+    dtypes  = dict(npeak=np.uint16, nsipm=np.uint16, Qc=np.float64, Ec=np.float64, Ep=np.float64)
+    for name, dtype in dtypes.items():
+        df[name] = df[name].astype(dtype, copy=False)
+    return pd.DataFrame(df)
 
 
 def compute_and_write_tracks_info(paolina_params, h5out,
@@ -17,6 +17,7 @@ from .. core.configure     import configure
 from .. core.exceptions    import InvalidInputFileStructure
 from .. core.exceptions    import          SensorIDMismatch
 from .. core.exceptions    import              NoInputFiles
+from .. core.testing_utils import   assert_dataframes_close
 from .. core.testing_utils import    assert_tables_equality
 from .. core.testing_utils import            ignore_warning
 from .. core               import system_of_units as units
@@ -25,6 +26,8 @@ from .. evm.event_model    import Hit
 from .. evm.event_model    import HitCollection
 from .. types.ic_types     import xy
 from .. types.symbols      import WfType
+from .. io.run_and_event_io import run_and_event_writer
+from .. io.trigger_io       import trigger_writer
 from .. types.symbols      import EventRange as ER
 from .. types.symbols      import NormStrategy
 from .. types.symbols      import XYReco
@@ -33,9 +36,13 @@ from .  components import event_range
 from .  components import collect
 from .  components import copy_mc_info
 from .  components import wf_from_files
+from .  components import map_batch
 from .  components import pmap_from_files
 from .  components import compute_xy_position
 from .  components import city
+from .  components import city_shards
+from .  components import CITY_EVENT_NODES
+from .  components import merge_city_results
 from .  components import hits_and_kdst_from_files
 from .  components import mcsensors_from_file
 from .  components import create_timestamp
@@ -43,8 +50,11 @@ from .  components import check_max_time
 from .  components import hits_corrector
 from .  components import write_city_configuration
 from .  components import copy_cities_configuration
+from .  components import hitc_to_df
+from .  components import flushing_sink
 
 from .. dataflow   import dataflow as fl
+from .. io.pmaps_io import build_event_index
 
 from typing import Union
 
@@ -197,6 +207,253 @@ def test_city_keeps_input_file_ordering(ICDATADIR, config_tmpdir, order):
     assert result == files_in
 
 
+@mark.parametrize("files_in event_range n_workers expected".split(),
+                  ( (["a", "b", "c"], (None,)  , 1, [(["a", "b", "c"], (None,))])
+                  , (["a", "b", "c"], (None,)  , 2, [(["a", "b"], (None,)), (["c"], (None,))])
+                  , (["a", "b", "c"], (None,)  , 5, [(["a"], (None,)), (["b"], (None,)), (["c"], (None,))])
+                  , (["a"]          , (10,)    , 2, [(["a"], (0, 5)), (["a"], (5, 10))])
+                  , (["a"]          , (4, 10)  , 3, [(["a"], (4, 6)), (["a"], (6, 8)), (["a"], (8, 10))])
+                  , (["a"]          , (4, 6)   , 3, [(["a"], (4, 5)), (["a"], (5, 6))])
+                  ))
+def test_city_shards(files_in, event_range, n_workers, expected):
+    assert city_shards(files_in, event_range, n_workers) == expected
+
+
+@mark.parametrize("files_in event_range".split(),
+                  ( (["a", "b", "c"], (0, 10)  )
+                  , (["a"]          , (None,)  )
+                  , (["a"]          , (2, None))
+                  ))
+def test_city_shards_warns_when_input_is_not_split(files_in, event_range):
+    with warns(UserWarning, match="The input cannot be split"):
+        shards = city_shards(files_in, event_range, 2)
+    assert shards == [(files_in, event_range)]
+
+
+def test_merge_city_results():
+    results = [Namespace(events_in=2, evtnum_list=[0, 1], array=np.arange(2), flag=True),
+               Namespace(events_in=3, evtnum_list=[2, 3, 4], array=np.arange(3), flag=False)]
+    merged  = merge_city_results(results)
+    assert merged.events_in   == 5
+    assert merged.evtnum_list == [0, 1, 2, 3, 4]
+    assert merged.flag        == [True, False]
+    assert_equal(merged.array, [0, 1, 0, 1, 2])
+
+
+@city
+def dummy_sharded_city( files_in    : Union[str, list]
+                      , file_out    : str
+                      , event_range : tuple):
+    events = []
+    for filename in files_in:
+        with tb.open_file(filename) as file:
+            events.extend(file.root.events.read().tolist())
+    events = events[slice(*event_range)]
+
+    with tb.open_file(file_out, "w") as file:
+        run  = file.create_group(file.root, "Run")
+        file.create_table(run, "events" , np.array([(e, 10 * e) for e in events], dtype=[("evt_number", int), ("timestamp", float)]))
+        file.create_table(run, "runInfo", np.array([(-1,) for e in events], dtype=[("run_number", int)]))
+
+        sensors = file.create_group(file.root, "Sensors")
+        file.create_table(sensors, "DataPMT", np.array([(0, 1.5), (1, 2.5)], dtype=[("sensorID", int), ("coeff", float)]))
+
+        wfs = file.create_earray(file.root, "wfs", atom=tb.Int16Atom(), shape=(0, 3))
+        for e in events:
+            wfs.append(np.full((1, 3), e, dtype=np.int16))
+
+        pmaps  = file.create_group(file.root, "PMAPS")
+        peaks  = np.array([(e, p) for e in events for p in range(e % 3 + 1)], dtype=[("event", int), ("peak", int)]).reshape(-1)
+        file.create_table(pmaps, "S1", peaks)
+        index = file.create_group(file.root, "PMAPSIndex")
+        file.create_table(index, "S1", build_event_index(peaks["event"]))
+
+    return dict(events_in=len(events), evtnum_list=events)
+
+
+@ignore_warning.no_config_group
+@mark.parametrize("n_files event_range".split(),
+                  ( (4, (None,))
+                  , (3, (None,))
+                  , (1, (1, 9))
+                  , (1, (7,))
+                  ))
+def test_city_in_parallel_same_output_as_serial(config_tmpdir, monkeypatch, n_files, event_range):
+    monkeypatch.setitem(CITY_EVENT_NODES, "dummy_sharded_city", ("/Run", "/wfs", "/PMAPS", "/PMAPSIndex"))
+    files_in = []
+    for i in range(n_files):
+        filename = os.path.join(config_tmpdir, f"sharded_city_input_{n_files}_{i}.h5")
+        with tb.open_file(filename, "w") as file:
+            file.create_array(file.root, "events", np.arange(10 * i, 10 * i + 10))
+        files_in.append(filename)
+
+    file_serial   = os.path.join(config_tmpdir, f"sharded_city_serial_{n_files}_{event_range}.h5")
+    file_parallel = os.path.join(config_tmpdir, f"sharded_city_parallel_{n_files}_{event_range}.h5")
+
+    expected = dummy_sharded_city(files_in=files_in, file_out=file_serial  , event_range=event_range)
+    got      = dummy_sharded_city(files_in=files_in, file_out=file_parallel, event_range=event_range, n_workers=3)
+
+    assert got == expected
+
+    with tb.open_file(file_serial) as serial, tb.open_file(file_parallel) as parallel:
+        serial_leaves   = {leaf._v_pathname: leaf for leaf in serial  .walk_nodes("/", "Leaf")}
+        parallel_leaves = {leaf._v_pathname: leaf for leaf in parallel.walk_nodes("/", "Leaf")}
+        assert serial_leaves.keys() == parallel_leaves.keys()
+
+        for path, leaf in serial_leaves.items():
+            if path.startswith("/config"): continue
+            if isinstance(leaf, tb.Table): assert_tables_equality(parallel_leaves[path], leaf)
+            else                         : assert_equal(parallel_leaves[path].read(), leaf.read())
+
+
+@city
+def dummy_random_city( files_in    : Union[str, list]
+                     , file_out    : str
+                     , event_range : tuple
+                     , random_seed : int):
+    np.random.seed(random_seed)
+    start, stop = event_range
+    with tb.open_file(file_out, "w") as file:
+        run = file.create_group(file.root, "Run")
+        file.create_table(run, "events", np.array([(e, np.random.uniform()) for e in range(start, stop)],
+                                                  dtype=[("evt_number", int), ("noise", float)]))
+    return dict(events_in=stop - start)
+
+
+@ignore_warning.no_config_group
+def test_city_in_parallel_seeds_each_shard(config_tmpdir, monkeypatch):
+    monkeypatch.setitem(CITY_EVENT_NODES, "dummy_random_city", ("/Run",))
+    filename = os.path.join(config_tmpdir, "random_city_input.h5")
+    with tb.open_file(filename, "w") as file:
+        file.create_array(file.root, "events", np.arange(10))
+
+    noise = []
+    for i in range(2):
+        file_out = os.path.join(config_tmpdir, f"random_city_output_{i}.h5")
+        dummy_random_city(files_in=filename, file_out=file_out, event_range=(10,), random_seed=123, n_workers=2)
+        noise.append(pd.read_hdf(file_out, "/Run/events").noise.values)
+
+    # reproducible, but the shards do not draw the same numbers
+    assert_equal(noise[0], noise[1])
+    assert len(np.unique(noise[0])) == 10
+
+
+@ignore_warning.no_config_group
+def test_city_not_in_parallel_without_event_nodes(config_tmpdir):
+    filename = os.path.join(config_tmpdir, "unregistered_city_input.h5")
+    with tb.open_file(filename, "w") as file:
+        file.create_array(file.root, "events", np.arange(10))
+    file_out = os.path.join(config_tmpdir, "unregistered_city_output.h5")
+
+    with warns(UserWarning, match="cannot be run in parallel"):
+        result = dummy_pipeline_city(files_in=filename, file_out=file_out, event_range=(None,), n_workers=2)
+    assert result.events_in == 10
+
+
+@city
+def dummy_pipeline_city( files_in    : Union[str, list]
+                       , file_out    : str
+                       , event_range : tuple):
+    def events_in_files(files_in):
+        for filename in files_in:
+            with tb.open_file(filename) as file:
+                yield from ({"event": e} for e in file.root.events.read())
+
+    def double(event): return 2 * event
+    def is_odd(event): return event % 2 == 1
+
+    with tb.open_file(file_out, "w") as file:
+        file.create_array(file.root, "dummy", np.zeros(1))
+
+    count = fl.spy_count()
+    return fl.push(source = events_in_files(files_in),
+                   pipe   = fl.pipe(count.spy,
+                                    fl.map   (double, args="event", out="doubled"),
+                                    fl.filter(is_odd, args="event"),
+                                    fl.sink  (lambda _: None)),
+                   result = dict(events_in = count.future))
+
+
+@ignore_warning.no_config_group
+@mark.parametrize("n_workers", (1, 2))
+def test_city_profile(config_tmpdir, monkeypatch, n_workers):
+    monkeypatch.setitem(CITY_EVENT_NODES, "dummy_pipeline_city", ())
+    files_in = []
+    for i in range(2):
+        filename = os.path.join(config_tmpdir, f"profiled_city_input_{i}.h5")
+        with tb.open_file(filename, "w") as file:
+            file.create_array(file.root, "events", np.arange(10 * i, 10 * i + 10))
+        files_in.append(filename)
+    file_out = os.path.join(config_tmpdir, f"profiled_city_output_{n_workers}.h5")
+
+    result = dummy_pipeline_city(files_in=files_in, file_out=file_out, event_range=(None,),
+                                 n_workers=n_workers, profile=True)
+
+    assert result.events_in == 20
+    profile = result.profile.set_index("stage")
+    assert_equal(profile.loc[["map:double", "filter:is_odd", "sink:<lambda>"], "items_in" ].values, [20, 20, 10])
+    assert_equal(profile.loc[["map:double", "filter:is_odd", "sink:<lambda>"], "items_out"].values, [20, 10,  0])
+    assert np.all(profile.wall_time >= 0)
+
+    written = pd.read_hdf(file_out, "/Profile/stages")
+    assert_dataframes_close(written, result.profile)
+
+
+@ignore_warning.no_config_group
+def test_city_without_profile(config_tmpdir):
+    filename = os.path.join(config_tmpdir, "unprofiled_city_input.h5")
+    with tb.open_file(filename, "w") as file:
+        file.create_array(file.root, "events", np.arange(5))
+    file_out = os.path.join(config_tmpdir, "unprofiled_city_output.h5")
+
+    result = dummy_pipeline_city(files_in=filename, file_out=file_out, event_range=(None,))
+
+    assert not hasattr(result, "profile")
+    with tb.open_file(file_out) as file:
+        assert "Profile" not in file.root
+
+
+def test_map_batch_same_as_map():
+    def subtract_and_sum(wfs, baselines):
+        bls = wfs - baselines[..., np.newaxis]
+        return bls, bls.sum(axis=-2)
+
+    def events():
+        return [dict(wfs=np.arange(6).reshape(2, 3) * i, baselines=np.array([i, 2*i])) for i in range(5)]
+
+    expected = []
+    fl.push(source = events(),
+            pipe   = fl.pipe(fl.map(subtract_and_sum, args=("wfs", "baselines"), out=("bls", "sum")),
+                             fl.sink(expected.append)))
+
+    got = []
+    fl.push(source = events(),
+            pipe   = fl.pipe(fl.batch(2),
+                             map_batch(subtract_and_sum, args=("wfs", "baselines"), out=("bls", "sum")),
+                             fl.unbatch(),
+                             fl.sink(got.append)))
+
+    assert len(got) == len(expected)
+    for got_event, expected_event in zip(got, expected):
+        assert got_event.keys() == expected_event.keys()
+        for key in got_event:
+            assert_equal(got_event[key], expected_event[key])
+
+
+def test_map_batch_with_different_shapes():
+    events = [dict(wfs=np.ones((2, n))) for n in (3, 4, 3)]
+
+    got = []
+    fl.push(source = events,
+            pipe   = fl.pipe(fl.batch(3),
+                             map_batch(lambda wfs: 2 * wfs, item="wfs"),
+                             fl.unbatch(),
+                             fl.sink(got.append)))
+
+    for event, n in zip(got, (3, 4, 3)):
+        assert_equal(event["wfs"], np.full((2, n), 2.))
+
+
 def test_city_fails_if_bad_input_file(config_tmpdir, ICDATADIR):
     file_ok  = os.path.join(ICDATADIR, "electrons_40keV_z25_RWF.h5") # any file will do
     file_bad = "/this/file/does/not/exist.h5"
@@ -616,3 +873,46 @@ def test_copy_cities_configuration_warns_when_nothing_to_copy(ICDATADIR, config_
 
     with warns(UserWarning, match="Input file does not contain /config group"):
         copy_cities_configuration(filename1, filename2)
+
+
+def test_hitc_to_df_same_for_hits_and_columns():
+    hits = [Hit(i, Cluster(10. + i, xy(i, -i), xy(.5, .2), 5 + i, Qc=1.),
+                2. * i, 100. + i, xy(0., 1.), s2_energy_c=50., track_id=i % 2, Ep=40.)
+            for i in range(4)]
+    hitc = HitCollection(3, 1.5, hits)
+    df   = hitc_to_df(hitc)
+
+    assert list(df.columns) == ["event", "time", *HitCollection.hit_columns]
+    assert df.npeak.dtype == df.nsipm.dtype == np.uint16
+    assert np.all(df.event == 3) and np.all(df.time == 1.5)
+    assert np.allclose(df.E   , [h.E    for h in hits])
+    assert np.allclose(df.Xrms, [h.Xrms for h in hits])
+
+    from_columns = HitCollection.from_columns(3, 1.5, hitc.columns())
+    pd.testing.assert_frame_equal(hitc_to_df(from_columns), df)
+
+
+def test_flushing_sink_flushes_when_the_pipeline_is_closed():
+    written, flushed = [], []
+    def writer(a, b): written.append((a, b))
+    writer.flush = lambda: flushed.append(len(written))
+
+    data = [dict(a=i, b=-i, c=0) for i in range(3)]
+    fl.push(source = data,
+            pipe   = fl.pipe(fl.branch(flushing_sink(writer, args=("a", "b"))),
+                             fl.sink(lambda _: None)))
+
+    assert written == [(i, -i) for i in range(3)]
+    assert flushed == [3]
+
+
+def test_flushing_sink_is_profiled():
+    def writer(a): pass
+    writer.flush = lambda: None
+
+    with fl.profiling() as profile:
+        the_sink = flushing_sink(writer, args="a")
+    fl.push(source=[dict(a=i) for i in range(4)], pipe=the_sink)
+
+    stages = {stage["name"]: stage for stage in profile.summary()}
+    assert stages["sink:writer"]["items_in"] == 4
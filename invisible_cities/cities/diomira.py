@@ -168,10 +168,11 @@ def simulate_pmt_response(detector, run_number):
     single_pe_rms = datapmt.Sigma.values.astype(np.double)
     pe_resolution = compute_pe_resolution(single_pe_rms, adc_to_pes)
 
+    simulate_electronics = sf.PMTElectronicsSimulator(detector, run_number,
+                                                      adc_to_pes, pe_resolution)
+
     def simulate_pmt_response(pmtrd):
-        rwf, blr = sf.simulate_pmt_response(0, pmtrd[np.newaxis],
-                                            adc_to_pes, pe_resolution,
-                                            detector, run_number)
+        rwf, blr = simulate_electronics(pmtrd)
         return np.round(rwf).astype(np.int16), np.round(blr).astype(np.int16)
     return simulate_pmt_response
 
@@ -128,6 +128,10 @@ def esmeralda( files_in         : OneOrManyFiles
             radius of blob
         max_num_hits            : int
             maximum number of hits allowed per event to run paolina functions.
+        max_voxels_all_pairs    : int, optional
+            if given, the extrema of tracks with more voxels are found
+            with a double sweep, which is faster but only exact for
+            tree-like tracks. By default, all tracks use the exact search.
 
     corrections : dict
         filename   : str
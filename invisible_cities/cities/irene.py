@@ -41,6 +41,7 @@ from .  components import calibrate_pmts
 from .  components import calibrate_sipms
 from .  components import zero_suppress_wfs
 from .  components import wf_from_files
+from .  components import map_batch
 from .  components import get_number_of_active_pmts
 from .  components import compute_and_write_pmaps
 from .  components import get_actual_sipm_thr
@@ -68,21 +69,26 @@ def irene( files_in        : OneOrManyFiles
          , s2_rebin_stride : int  , s2_stride    : int
          , thr_csum_s2     : float, thr_sipm_s2  : float
          , pmt_samp_wid    : float, sipm_samp_wid: float
+         , batch_size      : int = 1
          ):
 
     sipm_thr = get_actual_sipm_thr(thr_sipm_type, thr_sipm, detector_db, run_number)
 
     #### Define data transformations
 
+    # With batch_size > 1 the waveforms of that many events are
+    # processed at once
+    map_wfs          = map_batch if batch_size > 1 else fl.map
+
     # Raw WaveForm to Corrected WaveForm
-    rwf_to_cwf       = fl.map(deconv_pmt(detector_db, run_number, n_baseline),
-                              args = "pmt",
-                              out  = "cwf")
+    rwf_to_cwf       = map_wfs(deconv_pmt(detector_db, run_number, n_baseline),
+                               args = "pmt",
+                               out  = "cwf")
 
     # Corrected WaveForm to Calibrated Corrected WaveForm
-    cwf_to_ccwf      = fl.map(calibrate_pmts(detector_db, run_number, n_maw, thr_maw),
-                              args = "cwf",
-                              out  = ("ccwfs", "ccwfs_maw", "cwf_sum", "cwf_sum_maw"))
+    cwf_to_ccwf      = map_wfs(calibrate_pmts(detector_db, run_number, n_maw, thr_maw),
+                               args = "cwf",
+                               out  = ("ccwfs", "ccwfs_maw", "cwf_sum", "cwf_sum_maw"))
 
     # Find where waveform is above threshold
     zero_suppress    = fl.map(zero_suppress_wfs(thr_csum_s1, thr_csum_s2),
@@ -90,8 +96,18 @@ def irene( files_in        : OneOrManyFiles
                               out  = ("s1_indices", "s2_indices", "s2_energies"))
 
     # Remove baseline and calibrate SiPMs
-    sipm_rwf_to_cal  = fl.map(calibrate_sipms(detector_db, run_number, sipm_thr),
-                              item = "sipm")
+    sipm_rwf_to_cal  = map_wfs(calibrate_sipms(detector_db, run_number, sipm_thr),
+                               item = "sipm")
+
+    if batch_size > 1:
+        # The SiPMs of all the events in the batch are calibrated
+        # before filtering the events
+        calibrate_wfs   = fl.pipe(fl.batch(batch_size),
+                                  rwf_to_cwf, cwf_to_ccwf, sipm_rwf_to_cal,
+                                  fl.unbatch())
+        sipm_rwf_to_cal = None
+    else:
+        calibrate_wfs   = fl.pipe(rwf_to_cwf, cwf_to_ccwf)
 
     event_count_in  = fl.spy_count()
     event_count_out = fl.spy_count()
@@ -121,8 +137,7 @@ def irene( files_in        : OneOrManyFiles
                       pipe   = pipe(fl.slice(*event_range, close_all=True),
                                     print_every(print_mod),
                                     event_count_in.spy,
-                                    rwf_to_cwf,
-                                    cwf_to_ccwf,
+                                    calibrate_wfs,
                                     zero_suppress,
                                     compute_pmaps,
                                     event_count_out.spy,
@@ -324,16 +324,18 @@ def test_irene_trigger_channels(config_tmpdir, ICDATADIR, s12params):
 
 
 @ignore_warning.no_config_group
-def test_irene_exact_result(ICDATADIR, output_tmpdir):
+@mark.parametrize("batch_size", (1, 2))
+def test_irene_exact_result(ICDATADIR, output_tmpdir, batch_size):
     file_in     = os.path.join(ICDATADIR    , "Kr83_nexus_v5_03_00_ACTIVE_7bar_3evts.RWF.h5")
-    file_out    = os.path.join(output_tmpdir,                        "exact_result_irene.h5")
+    file_out    = os.path.join(output_tmpdir, f"exact_result_irene_{batch_size}.h5")
     true_output = os.path.join(ICDATADIR    , "Kr83_nexus_v5_03_00_ACTIVE_7bar_3evts.NEWMC.PMP.h5")
 
     conf = configure("irene invisible_cities/config/irene.conf".split())
     conf.update(dict(run_number   = -6340,
                      files_in     = file_in,
                      file_out     = file_out,
-                     event_range  = all_events))
+                     event_range  = all_events,
+                     batch_size   = batch_size))
 
     irene(**conf)
 
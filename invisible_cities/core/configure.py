@@ -57,6 +57,8 @@ parser.add_argument("-o", '--file-out',     type=str,            help="output fi
 parser.add_argument("-e", '--event-range',  type=event_range,    help=event_range_help, nargs='*')
 parser.add_argument("-r", '--run-number',   type=int,            help="run number")
 parser.add_argument("-p", '--print-mod',    type=int,            help="print every this number of events")
+parser.add_argument("-w", '--workers',      type=int,            help="number of worker processes", dest="n_workers")
+parser.add_argument('--profile',            action='store_true', help="time each stage of the city", default=None)
 parser.add_argument("-v", dest='verbosity', action="count",      help="increase verbosity level", default=0)
 parser.add_argument('--print-config-only',  action='store_true', help='do not run the city')
 
@@ -372,6 +372,9 @@ def test_config_city_fails_without_output_file(simple_conf_file_name):
                    ('run_number' ,       '--run-number 24', 24),
                    ('print_mod'  ,                 '-p 25', 25),
                    ('print_mod'  ,        '--print-mod 26', 26),
+                   ('n_workers'  ,                  '-w 4',  4),
+                   ('n_workers'  ,          '--workers 5',  5),
+                   ('profile'    ,            '--profile', True),
                    ('event_range',                '-e all', [all]),
                    ('event_range',     '--event-range all', [all]),
                    ('event_range',                 '-e 27', [27]),
@@ -3,6 +3,8 @@ import numpy as np
 from scipy.signal import fftconvolve
 
 from typing       import       Tuple
+from typing       import    Optional
+from typing       import       Union
 
 from functools    import     partial
 from functools    import   lru_cache
@@ -27,6 +29,85 @@ def sample_discrete_distribution(bin_centres : np.array,
                             size = size)
 
 
+def random_generator(seed : Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None
+                     ) -> np.random.Generator:
+    """
+    Return a numpy Generator seeded with `seed`, which can be an int,
+    a SeedSequence or a Generator (returned as it is). Without a seed,
+    the Generator is seeded from numpy's global random state, so that
+    `np.random.seed` still makes the results reproducible.
+    """
+    if seed is None:
+        seed = np.random.randint(0, 2**32, dtype=np.int64)
+    return np.random.default_rng(seed)
+
+
+def cumulative_tables(bin_weights : np.array) -> np.array:
+    """
+    Normalized cumulative distribution of each row of `bin_weights`.
+    Rows without weight are left as zeros.
+    """
+    cdfs  = np.cumsum(bin_weights, axis=1, dtype=float)
+    total = cdfs[:, -1:]
+    return np.divide(cdfs, total, out=np.zeros_like(cdfs), where=total > 0)
+
+
+def guide_tables(cdfs : np.array) -> np.array:
+    """
+    Guide tables to speed up the inversion of the cumulative
+    distributions `cdfs` (see `cumulative_tables`). For each row, the
+    k-th entry is the index of the first bin whose cumulative
+    probability exceeds k / n_bins, so the search for a value u can
+    start there. The indices refer to the flattened `cdfs`.
+    """
+    n_rows, n_bins = cdfs.shape
+    # Slightly below k / n_bins so that rounding in the sampling
+    # never starts the search past the right bin
+    needles = np.nextafter(np.arange(n_bins) / n_bins, 0)
+    guides  = np.array([np.searchsorted(cdf, needles, side="right") for cdf in cdfs],
+                       dtype=np.intp).reshape(n_rows, n_bins)
+    guides += np.arange(n_rows)[:, np.newaxis] * n_bins
+    return np.minimum(guides, np.arange(1, n_rows + 1)[:, np.newaxis] * n_bins - 1)
+
+
+def sample_discrete_distributions(bin_centres : np.array,
+                                  cdfs        : np.array,
+                                  guides      : np.array,
+                                  size        : int,
+                                  rng         : np.random.Generator) -> np.array:
+    """
+    Take `size` samples of each of the distributions given by the
+    rows of `cdfs` at once, by inverting the cumulative distributions
+    with the help of their `guides` (see `cumulative_tables` and
+    `guide_tables`). Rows of zeros give zeros, like
+    `sample_discrete_distribution`.
+
+    Returns
+    -------
+    samples : np.array with shape (number of distributions, size)
+    """
+    n_rows, n_bins = cdfs.shape
+    empty   = cdfs[:, -1] == 0
+    u       = rng.random((n_rows, size))
+    buckets = (u * n_bins).astype(np.intp)
+    indices = np.take_along_axis(guides, buckets, axis=1).ravel()
+
+    # Advance to the first bin whose cumulative probability exceeds u.
+    # Only a few bins are ever skipped. The search stops at the first
+    # bin of empty rows.
+    u    = u.ravel()
+    cdfs = np.where(empty[:, np.newaxis], 1, cdfs).ravel()
+    todo = np.flatnonzero(cdfs[indices] <= u)
+    while todo.size:
+        indices[todo] += 1
+        todo = todo[cdfs[indices[todo]] <= u[todo]]
+
+    indices  = indices.reshape(n_rows, size) % n_bins
+    samples  = bin_centres[indices]
+    samples[empty] = 0
+    return samples
+
+
 def uniform_smearing(max_deviation : np.array,
                      size : Tuple = 1) -> np.array:
     return np.random.uniform(-max_deviation,
@@ -106,7 +187,8 @@ class NoiseSampler:
                  detector    : str,
                  run_number  : int,
                  sample_size : int = 1,
-                 smear       : bool = True):
+                 smear       : bool = True,
+                 seed        : Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None):
         """Sample a histogram as if it was a PDF.
 
         Parameters
@@ -119,6 +201,9 @@ class NoiseSampler:
             If True, the samples are uniformly smeared to simulate
             a continuous distribution. If False, the samples are
             always the center of the histograms' bins. Default is True.
+        seed: int, SeedSequence or Generator, optional
+            Seed of the random stream used by `sample`. By default
+            it is seeded from numpy's global random state.
 
         Attributes
         ---------
@@ -132,6 +217,8 @@ class NoiseSampler:
             Matrix holding the noise probabilities for each sensor.
             The sensors are arranged along the first dimension, while
             the other axis corresponds to the energy bins.
+        rng : numpy.random.Generator
+            Random stream used by `sample`.
         """
         (self.probs,
          self.xbins,
@@ -147,13 +234,13 @@ class NoiseSampler:
         self.baselines   = self.baselines[:, np.newaxis]
         self.dx          = np.diff(self.xbins)[0] * 0.5
 
-        self._sampler    = partial(sample_discrete_distribution,
-                                   self.xbins,
-                                   size = self.nsamples)
-        self._smearer    = partial(uniform_smearing,
-                                   max_deviation = self.dx,
-                                   size          = (self.nsensors,
-                                                    self.nsamples))
+        self._cdfs       = cumulative_tables(self.probs)
+        self._guides     = guide_tables     (self._cdfs)
+        self.seed(seed)
+
+    def seed(self, seed : Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None):
+        """Restart the random stream used by `sample` from `seed`."""
+        self.rng = random_generator(seed)
 
     def mask(self, array):
         """Set to 0 those rows corresponding to masked sensors"""
@@ -161,9 +248,10 @@ class NoiseSampler:
 
     def sample(self):
         """Take a set of samples from each pdf."""
-        sample  = np.apply_along_axis(self._sampler, 1, self.probs)
+        sample  = sample_discrete_distributions(self.xbins, self._cdfs, self._guides,
+                                                self.nsamples, self.rng)
         if self.smear:
-            sample += self._smearer()
+            sample += self.rng.uniform(-self.dx, self.dx, size=sample.shape)
         sample = self.adc_to_pes * sample + self.baselines
         return self.mask(sample)
 
@@ -1,5 +1,7 @@
 import numpy as np
 
+from scipy import stats
+
 from flaky  import   flaky
 from pytest import    mark
 from pytest import fixture
@@ -19,6 +21,10 @@ from ..types.symbols    import DarkModel
 from . random_sampling  import normalize_distribution
 from . random_sampling  import sample_discrete_distribution
 from . random_sampling  import uniform_smearing
+from . random_sampling  import random_generator
+from . random_sampling  import cumulative_tables
+from . random_sampling  import guide_tables
+from . random_sampling  import sample_discrete_distributions
 from . random_sampling  import inverse_cdf_index
 from . random_sampling  import inverse_cdf
 from . random_sampling  import pad_pdfs
@@ -86,6 +92,60 @@ def test_sample_discrete_distribution_invalid_input(distribution, nsamples):
     assert not np.any(samples)
 
 
+@given(valid_distributions(),
+       integers(min_value = 1, max_value = 10))
+def test_sample_discrete_distributions_valid_and_invalid_input(distribution, nsamples):
+    domain, frequencies = distribution
+    weights   = np.stack([frequencies, np.zeros_like(frequencies), frequencies[::-1]])
+    cdfs      = cumulative_tables(weights)
+    samples   = sample_discrete_distributions(domain, cdfs, guide_tables(cdfs),
+                                              nsamples, random_generator(nsamples))
+
+    assert samples.shape == (3, nsamples)
+    assert np.all(np.in1d(samples[0], domain[frequencies       > 0]))
+    assert not np.any(samples[1])
+    assert np.all(np.in1d(samples[2], domain[frequencies[::-1] > 0]))
+
+
+def test_sample_discrete_distributions_same_as_sample_discrete_distribution():
+    # Compare the number of samples in each bin with the one-at-a-time
+    # sampler for a few distributions, including one with empty bins
+    nsamples = 20000
+    domain   = np.linspace(-5, 5, 21)
+    weights  = np.stack([np.exp(-0.5 * domain**2),
+                         np.where(np.abs(domain) < 2, 1., 0.),
+                         np.linspace(0, 1, domain.size)])
+    weights  = np.apply_along_axis(normalize_distribution, 1, weights)
+
+    cdfs     = cumulative_tables(weights)
+    got      = sample_discrete_distributions(domain, cdfs, guide_tables(cdfs),
+                                             nsamples, random_generator(1234))
+    np.random.seed(4321)
+    expected = [sample_discrete_distribution(domain, w, nsamples) for w in weights]
+
+    for got_row, expected_row, w in zip(got, expected, weights):
+        got_counts      = np.array([np.count_nonzero(got_row      == x) for x in domain])
+        expected_counts = np.array([np.count_nonzero(expected_row == x) for x in domain])
+        assert np.all(got_counts[w == 0] == 0)
+
+        # Two-sample chi2 test over the populated bins
+        populated = got_counts + expected_counts > 0
+        chi2      = np.sum((got_counts - expected_counts)[populated]**2 /
+                           (got_counts + expected_counts)[populated])
+        assert stats.chi2.sf(chi2, np.count_nonzero(populated) - 1) > 1e-3
+
+
+def test_random_generator_is_reproducible():
+    assert random_generator(1).random() == random_generator(1).random()
+
+    np.random.seed(7); first  = random_generator().random()
+    np.random.seed(7); second = random_generator().random()
+    assert first == second
+
+    rng = np.random.default_rng()
+    assert random_generator(rng) is rng
+
+
 @given(floats(min_value = 1e-2,
               max_value = 1e+2),
        sensible_sizes)
@@ -331,3 +391,13 @@ def test_signal_to_noise_zero_sample_raises_error(noise_sampler):
     with raises(ValueError):
 
         noise_sampler.signal_to_noise(ids, qs, 0)
+
+
+def test_noise_sampler_seed_makes_samples_reproducible(dbnew, run_number):
+    sampler_1 = NoiseSampler(dbnew, run_number, 10, True, seed=123)
+    sampler_2 = NoiseSampler(dbnew, run_number, 10, True, seed=123)
+    first     = sampler_1.sample()
+    assert np.array_equal(first, sampler_2.sample())
+
+    sampler_1.seed(123)
+    assert np.array_equal(first, sampler_1.sample())
@@ -8,9 +8,18 @@
 import builtins
 import functools
 import itertools as it
+import multiprocessing
 import copy
+import os
+import resource
+import sys
+import time
 
 from collections import namedtuple
+from collections import deque
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from functools   import wraps
 from asyncio     import Future
 from contextlib  import contextmanager
@@ -40,6 +49,130 @@ def coroutine_send(generator_function):
     return proxy
 
 
+class StageProfile:
+    """
+    Cost of a pipeline stage: number of items received and sent
+    downstream, wall-clock and CPU time (in seconds) spent in the
+    stage's operation and increase of the peak resident memory of the
+    process (in bytes) while it was running.
+    """
+    __slots__ = "name items_in items_out wall_time cpu_time max_rss_increase".split()
+
+    def __init__(self, name):
+        self.name             = name
+        self.items_in         = 0
+        self.items_out        = 0
+        self.wall_time        = 0.
+        self.cpu_time         = 0.
+        self.max_rss_increase = 0
+
+
+def _max_rss():
+    # ru_maxrss is given in bytes on macOS and in kB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class Profile:
+    """
+    Collection of the StageProfiles of the `map`, `flatmap`, `filter`
+    and `sink` stages built inside a `profiling` context.
+    """
+    def __init__(self):
+        self.stages = []
+        self._names = Counter()
+
+    def add_stage(self, kind, op):
+        name = f"{kind}:{getattr(op, '__name__', type(op).__name__)}"
+        self._names[name] += 1
+        if self._names[name] > 1:
+            name += f"#{self._names[name]}"
+        stage = StageProfile(name)
+        self.stages.append(stage)
+        return stage
+
+    def wrap(self, kind, op):
+        stage = self.add_stage(kind, op)
+
+        def timed(function, *args):
+            rss0  = _max_rss()
+            wall0 = time.perf_counter()
+            cpu0  = time.process_time()
+            try:
+                return function(*args)
+            finally:
+                stage.wall_time        += time.perf_counter() - wall0
+                stage.cpu_time         += time.process_time() - cpu0
+                stage.max_rss_increase += _max_rss()          - rss0
+
+        if kind == "flatmap":
+            # The results are produced lazily, so the time spent
+            # generating each of them is also accounted for
+            @wraps(op)
+            def profiled_op(*args):
+                stage.items_in += 1
+                results = iter(timed(op, *args))
+                while True:
+                    try:
+                        result = timed(next, results)
+                    except StopIteration:
+                        return
+                    stage.items_out += 1
+                    yield result
+
+        elif kind == "filter":
+            @wraps(op)
+            def profiled_op(*args):
+                stage.items_in += 1
+                passed = timed(op, *args)
+                if passed:
+                    stage.items_out += 1
+                return passed
+
+        else:
+            sends = kind != "sink"
+            @wraps(op)
+            def profiled_op(*args):
+                stage.items_in  += 1
+                result = timed(op, *args)
+                stage.items_out += sends
+                return result
+
+        return profiled_op
+
+    def summary(self):
+        """
+        Return a list with one dictionary per stage, in order of
+        construction, containing the fields of its StageProfile.
+        """
+        return [{field: getattr(stage, field) for field in StageProfile.__slots__}
+                for stage in self.stages]
+
+
+# Profile collecting the stages that are being built, if any
+_profile = None
+
+@contextmanager
+def profiling():
+    """
+    Record the cost of each `map`, `flatmap`, `filter` and `sink`
+    stage built inside this context in the Profile it yields. Stages
+    built outside it are not instrumented at all.
+    """
+    global _profile
+    previous, _profile = _profile, Profile()
+    try:
+        yield _profile
+    finally:
+        _profile = previous
+
+
+def _profiled(kind, op):
+    if _profile is None or op is None:
+        return op
+    return _profile.wrap(kind, op)
+
+
 NoneType = type(None)
 
 def   _exactly_one(spec): return not isinstance(spec, (tuple, list, NoneType))
@@ -48,6 +181,7 @@ def _more_than_one(spec): return     isinstance(spec, (tuple, list)          )
 
 # TODO: improve ValueError message
 def map(op=None, *, args=None, out=None, item=None):
+    op = _profiled("map", op)
     if item is not None:
         if args is not None or out is not None:
             raise ValueError("dataflow.map: use of `item` parameter excludes both `args` and `out`")
@@ -82,7 +216,113 @@ def map(op=None, *, args=None, out=None, item=None):
     return coroutine(map_loop)
 
 
+# Operations run by parallel_map in worker processes. When the workers
+# are forked they inherit them, so `op` need not be picklable.
+_parallel_ops     = {}
+_parallel_op_keys = it.count()
+
+def _call_parallel_op(key, *values):
+    return _parallel_ops[key](*values)
+
+
+def parallel_map(op=None, *, args=None, out=None, item=None,
+                 workers=None, backend="process", max_in_flight=None,
+                 start_method=None):
+    """
+    Like `map`, but `op` is applied in a pool of `workers` processes
+    or threads, depending on `backend`. Up to `max_in_flight` items
+    (twice the number of workers by default) are processed at the same
+    time. The results are sent downstream in the order in which the
+    items arrived.
+
+    With the `process` backend, the workers are started with
+    `start_method` ("fork", "spawn" or "forkserver"; the platform
+    default if not given). Unless the workers are forked, `op` must be
+    picklable.
+
+    Exceptions raised by `op` (including StopPipeline) are raised when
+    the corresponding item is due to be sent downstream. When the
+    pipeline is closed, the items in flight are sent downstream before
+    closing it.
+    """
+    if item is not None:
+        if args is not None or out is not None:
+            raise ValueError("dataflow.parallel_map: use of `item` parameter excludes both `args` and `out`")
+        args = out = item
+
+    if backend not in ("process", "thread"):
+        raise ValueError(f"dataflow.parallel_map: unknown backend `{backend}`. Use `process` or `thread`")
+
+    workers       = workers       or os.cpu_count()
+    max_in_flight = max_in_flight or 2 * workers
+    if workers       < 1: raise ValueError("dataflow.parallel_map requires workers > 0")
+    if max_in_flight < 1: raise ValueError("dataflow.parallel_map requires max_in_flight > 0")
+
+    if args is None and out is None:
+        def get_values(data)        : return data,
+        def set_values(data, result): return result
+    else:
+        if _exactly_one(args):
+            args = args,
+
+        merged_output = _exactly_one(out)
+        if merged_output:
+            out = out,
+
+        def get_values(data):
+            return tuple(data[arg] for arg in args)
+
+        def set_values(data, trans):
+            if merged_output:
+                trans = trans,
+            for name, value in zip(out, trans):
+                data[name] = value
+            return data
+
+    def parallel_map_loop(target):
+        key = next(_parallel_op_keys)
+        if backend == "process":
+            context  = multiprocessing.get_context(start_method)
+            executor = ProcessPoolExecutor(workers, mp_context=context)
+            if context.get_start_method() == "fork":
+                _parallel_ops[key] = op
+                submit = functools.partial(executor.submit, _call_parallel_op, key)
+            else:
+                submit = functools.partial(executor.submit, op)
+        else:
+            executor = ThreadPoolExecutor(workers)
+            submit   = functools.partial(executor.submit, op)
+
+        in_flight = deque()
+        def send_oldest():
+            data, result = in_flight.popleft()
+            target.send(set_values(data, result.result()))
+
+        try:
+            with closing(target):
+                try:
+                    while True:
+                        data = yield
+                        in_flight.append((data, submit(*get_values(data))))
+                        while in_flight and (len(in_flight) >= max_in_flight or in_flight[0][1].done()):
+                            send_oldest()
+                except GeneratorExit:
+                    try:
+                        while in_flight:
+                            send_oldest()
+                    except StopPipeline:
+                        pass
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True)
+            _parallel_ops.pop(key, None)
+
+    return coroutine(parallel_map_loop)
+
+
 def flatmap(op=None, *, args=None, out=None, item=None):
+    op = _profiled("flatmap", op)
     if item is not None:
         if args is not None or out is not None:
             raise ValueError("dataflow.flatmap: use of `item` parameter excludes both `args` and `out`")
@@ -120,6 +360,7 @@ def flatmap(op=None, *, args=None, out=None, item=None):
 
 
 def filter(predicate, *, args=None):
+    predicate = _profiled("filter", predicate)
     if args is None:
         def filter_loop(target):
             with closing(target):
@@ -233,6 +474,7 @@ def RESULT(generator_function):
     return proxy
 
 def sink(effect, *, args=None):
+    effect = _profiled("sink", effect)
     if args is None:
         def sink_loop():
             while True:
@@ -352,6 +594,47 @@ def slice(*args, close_all=False):
     return slice_loop
 
 
+def batch(n):
+    """
+    Send downstream lists of `n` consecutive items. The remaining
+    items, if any, are sent as a shorter list when the pipeline is
+    closed.
+    """
+    if n < 1: raise ValueError("dataflow.batch requires n > 0")
+
+    @coroutine
+    def batch_loop(target):
+        with closing(target):
+            items = []
+            try:
+                while True:
+                    items.append((yield))
+                    if len(items) == n:
+                        target.send(items)
+                        items = []
+            except GeneratorExit:
+                if items:
+                    try:
+                        target.send(items)
+                    except StopPipeline:
+                        pass
+    return batch_loop
+
+
+def unbatch():
+    """
+    Send downstream, one at a time, the items of each sequence
+    received. Undoes `batch`.
+    """
+    @coroutine
+    def unbatch_loop(target):
+        with closing(target):
+            while True:
+                for item in (yield):
+                    target.send(item)
+    return unbatch_loop
+
+
 def implicit_pipes(seq):
     return tuple(builtins.map(if_tuple_make_pipe, seq))
 
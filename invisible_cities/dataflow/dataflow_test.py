@@ -68,6 +68,131 @@ def test_map():
     assert result == list(map(the_operation, the_source))
 
 
+@parametrize("backend", ("process", "thread"))
+def test_parallel_map(backend):
+
+    # 'parallel_map' applies the operation in a pool of processes or
+    # threads, but the results come out in the same order as with
+    # 'map', even if some items take longer than others. The operation
+    # can be a closure: the worker processes are forked.
+    import time
+    delays = [0.05, 0, 0.02, 0, 0.01, 0, 0, 0.03]
+    offset = 100
+
+    def the_operation(i):
+        time.sleep(delays[i])
+        return i + offset
+
+    result = []
+    df.push(source = range(len(delays)),
+            pipe   = df.parallel_map(the_operation, workers=3, backend=backend)(df.sink(result.append)))
+
+    assert result == [i + offset for i in range(len(delays))]
+
+
+@parametrize("backend", ("process", "thread"))
+def test_parallel_map_args_out(backend):
+    the_source = [dict(a=a, b=2*a) for a in range(20)]
+
+    result = []
+    df.push(source = the_source,
+            pipe   = df.pipe(df.parallel_map(lambda a, b: (a + b, a * b), args=("a", "b"), out=("sum", "prod"),
+                                             workers=2, backend=backend, max_in_flight=3),
+                             df.sink(result.append)))
+
+    assert [r["sum" ] for r in result] == [3 * a    for a in range(20)]
+    assert [r["prod"] for r in result] == [2 * a**2 for a in range(20)]
+
+
+def test_parallel_map_respects_max_in_flight():
+    import threading
+    import time
+    lock        = threading.Lock()
+    running     = 0
+    max_running = 0
+
+    def the_operation(n):
+        nonlocal running, max_running
+        with lock:
+            running    += 1
+            max_running = max(running, max_running)
+        time.sleep(0.01)
+        with lock:
+            running    -= 1
+        return n
+
+    result = []
+    df.push(source = range(30),
+            pipe   = df.parallel_map(the_operation, workers=8, backend="thread", max_in_flight=3)(df.sink(result.append)))
+
+    assert result == list(range(30))
+    assert max_running <= 3
+
+
+@parametrize("backend", ("process", "thread"))
+def test_parallel_map_raises_exceptions(backend):
+    def the_operation(n):
+        if n == 5: raise ZeroDivisionError
+        return n
+
+    result = []
+    with raises(ZeroDivisionError):
+        df.push(source = range(10),
+                pipe   = df.parallel_map(the_operation, workers=2, backend=backend)(df.sink(result.append)))
+
+    assert result == list(range(5))
+
+
+@parametrize("backend", ("process", "thread"))
+def test_parallel_map_stop_pipeline(backend):
+    def the_operation(n):
+        if n == 5: raise df.StopPipeline
+        return n
+
+    count = df.count()
+    df.push(source = range(10),
+            pipe   = df.parallel_map(the_operation, workers=2, backend=backend)(count.sink))
+
+    assert count.future.result() == 5
+
+
+def test_parallel_map_in_branch_and_fork():
+    square = lambda n: n * n
+
+    c1 = []; C1 = df.sink(c1.append)
+    c2 = []; C2 = df.sink(c2.append)
+    e1 = []; E1 = df.sink(e1.append)
+    e2 = []; E2 = df.sink(e2.append)
+
+    graph1 = df.pipe(df.map(square), df.fork(C1, E1))
+    graph2 = df.pipe(df.branch(df.parallel_map(square, workers=2), C2),
+                     df.parallel_map(square, workers=2, backend="thread"), E2)
+
+    the_source = list(range(25))
+    df.push(source=the_source, pipe=graph1)
+    df.push(source=the_source, pipe=graph2)
+
+    assert c1 == c2
+    assert e1 == e2
+
+
+def test_parallel_map_spawn():
+    # Spawned workers do not inherit the operation, so it must be picklable
+    the_source = list(range(-10, 10))
+    result = []
+    df.push(source = the_source,
+            pipe   = df.parallel_map(abs, workers=2, start_method="spawn")(df.sink(result.append)))
+
+    assert result == list(map(abs, the_source))
+
+
+@parametrize("kwargs", (dict(backend="gpu"), dict(workers=-1), dict(max_in_flight=-1),
+                        dict(item="a", args="b")))
+def test_parallel_map_raises_ValueError(kwargs):
+    with raises(ValueError):
+        df.parallel_map(abs, **kwargs)
+
+
 def test_pipe():
 
     # The basic syntax requires any element of a pipeline to be passed
@@ -493,6 +618,108 @@ def test_slice_null_close_all():
     assert result == the_source[specslice.start : specslice.stop : specslice.step]
 
 
+@parametrize("n", (1, 3, 4, 10, 11))
+def test_batch(n):
+    the_source = list(range(10))
+    result     = []
+    df.push(source = the_source,
+            pipe   = df.batch(n)(df.sink(result.append)))
+
+    assert result == [the_source[i:i+n] for i in range(0, len(the_source), n)]
+
+
+@parametrize("n", (1, 3, 4, 10, 11))
+def test_unbatch_undoes_batch(n):
+    the_source = list(range(10))
+    result     = []
+    df.push(source = the_source,
+            pipe   = df.pipe(df.batch(n), df.unbatch(), df.sink(result.append)))
+
+    assert result == the_source
+
+
+def test_batch_after_slice_with_close_all():
+    result = []
+    df.push(source = range(100),
+            pipe   = df.pipe(df.slice(5, close_all=True), df.batch(2), df.sink(result.append)))
+
+    assert result == [[0, 1], [2, 3], [4]]
+
+
+def test_batch_raises_ValueError():
+    with raises(ValueError):
+        df.batch(0)
+
+
+def test_profiling_records_every_stage():
+    def square (x): return x * x
+    def is_even(x): return x % 2 == 0
+    def repeat (x): return (x,) * 3
+
+    result = []
+    with df.profiling() as profile:
+        the_pipe = df.pipe(df.map    (square ),
+                           df.filter (is_even),
+                           df.flatmap(repeat ),
+                           df.map    (square ),
+                           df.sink   (result.append))
+
+    df.push(source=range(10), pipe=the_pipe)
+
+    summary = {stage["name"]: stage for stage in profile.summary()}
+    assert list(summary) == ["map:square", "filter:is_even", "flatmap:repeat", "map:square#2", "sink:append"]
+
+    n_items_in  = [10, 10, 5, 15, 15]
+    n_items_out = [10,  5, 15, 15, 0]
+    for stage, n_in, n_out in zip(summary.values(), n_items_in, n_items_out):
+        assert stage["items_in" ] == n_in
+        assert stage["items_out"] == n_out
+        assert stage["wall_time"] >= 0
+        assert stage["cpu_time" ] >= 0
+        assert stage["max_rss_increase"] >= 0
+
+    assert result == [x**4 for x in range(0, 10, 2) for _ in range(3)]
+
+
+def test_profiling_does_not_instrument_stages_built_outside():
+    def square(x): return x * x
+
+    unprofiled = df.map(square)
+    with df.profiling() as profile:
+        pass
+
+    result = []
+    df.push(source=range(5), pipe=unprofiled(df.sink(result.append)))
+
+    assert result          == [0, 1, 4, 9, 16]
+    assert profile.stages  == []
+    assert df._profile is None
+
+
+def test_profiling_measures_time_in_stage():
+    import time
+    def slow(x):
+        time.sleep(0.01)
+        return x
+
+    with df.profiling() as profile:
+        the_pipe = df.map(slow, args="a", out="b")(df.sink(lambda _: None))
+    df.push(source=[dict(a=1), dict(a=2)], pipe=the_pipe)
+
+    slow_stage, _ = profile.stages
+    assert slow_stage.items_in  == 2
+    assert slow_stage.wall_time >= 0.02
+    assert slow_stage.cpu_time  <  slow_stage.wall_time
+
+
+@parametrize("platform factor".split(), (("linux", 1024), ("darwin", 1)))
+def test_max_rss_in_bytes(monkeypatch, platform, factor):
+    from types import SimpleNamespace
+    monkeypatch.setattr(df.resource, "getrusage", lambda who: SimpleNamespace(ru_maxrss=123))
+    monkeypatch.setattr(df.sys     , "platform" , platform)
+    assert df._max_rss() == 123 * factor
+
+
 @parametrize('args',
              ((      -1,),
               (None, -1),
@@ -4,9 +4,12 @@ JJGC January 2017
 import numpy  as np
 import pandas as pd
 
+from scipy import signal
+
 from .. sierpe            import fee as FE
 from .. sierpe            import low_frequency_noise as lfn
 from .. reco              import wfm_functions as wfm
+from .. database          import load_db as DB
 
 
 def convert_channel_id_to_IC_id(data_frame, channel_ids):
@@ -77,6 +80,94 @@ def simulate_pmt_response(event, pmtrd, adc_to_pes, pe_resolution, detector_db='
     return np.array(RWF), np.array(BLRX)
 
 
+class PMTElectronicsSimulator:
+    """
+    Simulation of the energy plane response, like
+    `simulate_pmt_response`, for a given detector and run.
+
+    The front-end electronics model, the filter coefficients
+    and the low frequency noise spectra are computed once,
+    at construction. Calling the simulator with the MC
+    waveforms of an event, with shape (pmts, samples), or of
+    several events, with shape (events, pmts, samples),
+    processes all the PMTs at once and returns the raw
+    waveforms and the BLR waveforms (in adc), with shape
+    (..., pmts, decimated samples).
+    """
+    def __init__(self, detector_db, run_number, adc_to_pes, pe_resolution):
+        self.spe = FE.SPE()
+        self.fee = FE.FEE(detector_db, run_number,
+                          noise_FEEPMB_rms=FE.NOISE_I, noise_DAQ_rms=FE.NOISE_DAQ)
+
+        # normalize calibration constants from DB to MC value
+        self.norm          = np.asarray(adc_to_pes, dtype=float)[:, np.newaxis] / FE.ADC_TO_PES
+        self.pe_resolution = np.asarray(pe_resolution, dtype=float)
+        self.n_pmts        = len(self.pe_resolution)
+
+        self.fee_filters   = [FE.filter_fee(self.fee, pmt) for pmt in range(self.n_pmts)]
+        self.lpf_filter    = FE.filter_sfee_lpf(self.fee)
+        self.decimation    = int(FE.f_mc / FE.f_sample)
+
+        FE_mapping, self.FE_data = DB.PMTLowFrequencyNoise(detector_db, run_number)
+        sens_id                  = DB.DataPMT(detector_db, run_number).SensorID.values
+        self.feboxes             = lfn.pmt_feboxes(FE_mapping, sens_id[:self.n_pmts])
+
+    def charge_fluctuation(self, pmtrd):
+        """`charge_fluctuation` for all PMTs at once"""
+        sig_fl   = pmtrd.astype(float)
+        non_zero = np.nonzero(sig_fl > 0)
+        charge   = sig_fl[non_zero]
+        sigma    = np.sqrt(charge) * self.pe_resolution[non_zero[-2]]
+        ## This fluctuation can't give negative signal
+        sig_fl[non_zero] = np.clip(np.random.normal(charge, sigma), 0, None)
+        return sig_fl
+
+    def spe_pulses(self, pmtrd):
+        """`spe_pulse_from_vector` for all PMTs at once"""
+        spe = self.spe.spe
+        cnt = self.charge_fluctuation(pmtrd)
+        # the full convolution of the signal truncated to
+        # len(cnt) - len(spe) + 1 samples is a FIR filter
+        # applied to the signal with its tail set to zero
+        cnt[..., -len(spe) + 1:] = 0
+        signal_i  = signal.lfilter(spe, 1, cnt, axis=-1)
+        signal_i *= self.norm
+        return signal_i
+
+    def fee_response(self, signal_d):
+        """`signal_v_fee` for all PMTs at once, in adc"""
+        noise_FEEin = np.random.normal(0, self.fee.noise_FEEPMB_rms, signal_d.shape)
+        signal_in   = signal_d + noise_FEEin
+        signal_fee  = np.empty_like(signal_in)
+        for pmt, (b, a) in enumerate(self.fee_filters):
+            signal_fee[..., pmt, :] = signal.lfilter(b, a, signal_in[..., pmt, :], axis=-1)
+        return signal_fee * FE.v_to_adc()
+
+    def low_frequency_noise(self, n_events, buffer_length):
+        """Low frequency noise of each PMT for each event"""
+        return np.array([lfn.febox_noise(self.FE_data, buffer_length)[self.feboxes]
+                         for _ in range(n_events)])
+
+    def __call__(self, pmtrd):
+        signal_i   = self.spe_pulses(pmtrd)
+        # Decimate (DAQ decimation)
+        signal_d   = signal.decimate(signal_i, self.decimation, ftype='fir', zero_phase=True, axis=-1)
+        # Effect of FEE and transform to adc counts
+        signal_fee = self.fee_response(signal_d)
+        # add noise daq including the low frequency noise
+        noise_daq  = self.fee.DAQnoise_rms * FE.v_to_adc()
+        lowFreq    = self.low_frequency_noise(int(np.prod(pmtrd.shape[:-2])),
+                                              int(FE.f_sample * pmtrd.shape[-1] / FE.f_mc))
+        signal_daq = (signal_fee
+                      + np.random.normal(0, noise_daq, signal_fee.shape)
+                      - lowFreq.reshape(signal_fee.shape))
+        # signal blr is just pure MC decimated by adc in adc counts
+        signal_blr = signal.lfilter(*self.lpf_filter, signal_d, axis=-1) * FE.v_to_adc()
+        # raw waveform stored with negative sign and offset
+        # blr waveform stored with positive sign and no offset
+        return FE.OFFSET - signal_daq, signal_blr
+
+
 def simulate_sipm_response(sipmrd, sipms_noise_sampler, sipm_adc_to_pes, pe_resolution):
     """Add noise to the sipms with the NoiseSampler class and return
     the noisy waveform (in adc)."""
@@ -10,6 +10,7 @@ from .. database             import load_db
 
 from .  sensor_functions import convert_channel_id_to_IC_id
 from .  sensor_functions import simulate_pmt_response
+from .  sensor_functions import PMTElectronicsSimulator
 from .. calib            import calib_sensors_functions as csf
 from .. reco             import wfm_functions as wfm
 
@@ -41,6 +42,43 @@ def test_cwf_blr(dbnew, electron_MCRD_file):
                                    window_size = 500)
         assert diff[0] < 1
 
+def test_pmt_electronics_simulator_matches_simulate_pmt_response(dbnew, electron_MCRD_file):
+    """Without charge fluctuation the BLR waveforms are deterministic
+    and must be the same. The raw waveforms differ only by the noise."""
+    run_number    = 0
+    DataPMT       = load_db.DataPMT(dbnew, run_number)
+    adc_to_pes    = abs(DataPMT.adc_to_pes.values)
+    pe_resolution = np.zeros_like(adc_to_pes)
+
+    with tb.open_file(electron_MCRD_file, 'r') as h5in:
+        event    = 0
+        pmtrd    = h5in.root.pmtrd
+        old_rwf, old_blr = simulate_pmt_response(event, pmtrd, adc_to_pes, pe_resolution, dbnew, run_number)
+
+        simulate = PMTElectronicsSimulator(dbnew, run_number, adc_to_pes, pe_resolution)
+        new_rwf, new_blr = simulate(pmtrd[event])
+
+        assert new_rwf.shape == old_rwf.shape
+        assert np.allclose(new_blr, old_blr, rtol=1e-6, atol=1e-6)
+        assert np.all(np.abs(new_rwf.mean(axis=1) - old_rwf.mean(axis=1)) < old_rwf.std(axis=1))
+
+
+def test_pmt_electronics_simulator_batch_shape(dbnew, electron_MCRD_file):
+    run_number    = 0
+    DataPMT       = load_db.DataPMT(dbnew, run_number)
+    adc_to_pes    = abs(DataPMT.adc_to_pes.values)
+    single_pe_rms = abs(DataPMT.Sigma.values)
+
+    simulate = PMTElectronicsSimulator(dbnew, run_number, adc_to_pes, single_pe_rms)
+    with tb.open_file(electron_MCRD_file, 'r') as h5in:
+        pmtrd      = h5in.root.pmtrd[:2]
+        rwfs, blrs = simulate(pmtrd)
+        rwf , blr  = simulate(pmtrd[0])
+
+    assert rwfs.shape == blrs.shape == (2,) + rwf.shape
+    assert blr.shape  == rwf.shape
+
+
 @mark.slow
 def test_sipm_noise_sampler(dbnew, electron_MCRD_file):
     """This test checks that the number of SiPMs surviving a hard energy
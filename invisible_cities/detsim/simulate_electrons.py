@@ -39,7 +39,8 @@ def generate_ionization_electrons(energies    : np.ndarray,
 def drift_electrons(zs             : np.ndarray,
                     n_electrons    : np.ndarray,
                     lifetime       : float = 12 * units.ms,
-                    drift_velocity : float = 1  * units.mm / units.mus) -> np.ndarray:
+                    drift_velocity : float = 1  * units.mm / units.mus,
+                    per_electron   : bool  = False) -> np.ndarray:
     """ Returns number of electrons due to lifetime losses from secondary electrons
 
     Parameters:
@@ -51,16 +52,34 @@ def drift_electrons(zs             : np.ndarray,
             z coordinate of the ionization hits
         :electrons:
             Number of ionization electrons in each hit
+        :per_electron: bool
+            If True, sample the attachment time of each electron
+            individually instead of the number of surviving electrons
+            in each hit. Both give the same distribution, but the
+            former is much slower. Kept as a reference.
     Returns:
         :nes: np.ndarray
             Number of ionization electrons that reach the EL gap
-    """
-    @np.vectorize
-    def attachment(n_ie, t):
-        return np.count_nonzero(-lifetime * np.log(np.random.uniform(size=n_ie)) > t)
 
+    Comment:
+        Each electron survives the drift with probability exp(-t/lifetime),
+        so the number of electrons that reach the EL gap in each hit
+        follows a binomial distribution.
+    """
     ts  = zs / drift_velocity
-    return attachment(n_electrons, ts)
+
+    if per_electron:
+        @np.vectorize
+        def attachment(n_ie, t):
+            return np.count_nonzero(-lifetime * np.log(np.random.uniform(size=n_ie)) > t)
+
+        return attachment(n_electrons, ts)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        survival = np.exp(-np.divide(ts, lifetime))
+    # 0/0 (no drift, no lifetime) -> no survivors, as no attachment time is > 0
+    survival = np.clip(np.nan_to_num(survival, nan=0), 0, 1)
+    return np.random.binomial(n_electrons, survival)
 
 
 def diffuse_electrons(xs                     : np.ndarray,
@@ -4,6 +4,9 @@ from collections import namedtuple
 from operator    import itemgetter
 
 from pytest import fixture
+from pytest import approx
+from pytest import mark
+from scipy  import stats
 
 from .. core         import system_of_units as units
 from .. io.mcinfo_io import load_mchits_df
@@ -67,13 +70,14 @@ def test_generate_ionization_electrons_null_energies(MChits_and_detsim_params):
     assert np.all(n_electrons == np.zeros(10))
 
 
-def test_drift_electrons(MChits_and_detsim_params):
+@mark.parametrize("per_electron", (False, True))
+def test_drift_electrons(MChits_and_detsim_params, per_electron):
 
     f = MChits_and_detsim_params
 
     n_ie = np.mean(f.energies / f.wi)
     n_electrons = np.clip(np.random.normal(n_ie, n_ie**0.5, size=len(f.zs)), 0, None).astype(int)
-    drifted_electrons = drift_electrons(f.zs, n_electrons, f.lifetime, f.drift_velocity)
+    drifted_electrons = drift_electrons(f.zs, n_electrons, f.lifetime, f.drift_velocity, per_electron)
 
     # test all >= 0 and <= n_electrons
     assert np.all(drifted_electrons >= 0)
@@ -83,7 +87,8 @@ def test_drift_electrons(MChits_and_detsim_params):
     assert issubclass(drifted_electrons.dtype.type, (np.integer, int))
 
 
-def test_drift_electrons_extreme_lifetimes(MChits_and_detsim_params):
+@mark.parametrize("per_electron", (False, True))
+def test_drift_electrons_extreme_lifetimes(MChits_and_detsim_params, per_electron):
 
     f = MChits_and_detsim_params
 
@@ -91,14 +96,42 @@ def test_drift_electrons_extreme_lifetimes(MChits_and_detsim_params):
     n_electrons = np.clip(np.random.normal(n_ie, n_ie**0.5, size=len(f.zs)), 0, None).astype(int)
 
     # test lifetime = 0
-    drifted_electrons = drift_electrons(f.zs, n_electrons, 0, f.drift_velocity)
+    drifted_electrons = drift_electrons(f.zs, n_electrons, 0, f.drift_velocity, per_electron)
     assert np.all(drifted_electrons == 0)
 
     # test lifetime = inf
-    drifted_electrons = drift_electrons(f.zs, n_electrons, np.inf, f.drift_velocity)
+    drifted_electrons = drift_electrons(f.zs, n_electrons, np.inf, f.drift_velocity, per_electron)
     assert np.all(drifted_electrons == n_electrons)
 
 
+def test_drift_electrons_same_distribution_as_per_electron_sampling():
+    np.random.seed(123456)
+
+    n_hits         = 2000
+    lifetime       = 5 * units.ms
+    drift_velocity = 1 * units.mm / units.mus
+    zs             = np.repeat([100, 1000, 5000], n_hits) * units.mm
+    n_electrons    = np.full_like(zs, 200, dtype=int)
+
+    binomial     = drift_electrons(zs, n_electrons, lifetime, drift_velocity, per_electron=False)
+    per_electron = drift_electrons(zs, n_electrons, lifetime, drift_velocity, per_electron=True )
+
+    for z in np.unique(zs):
+        sel = zs == z
+        p   = np.exp(-z / drift_velocity / lifetime)
+        assert np.mean(binomial[sel]) == approx(200 * p          , rel=0.01)
+        assert np.var (binomial[sel]) == approx(200 * p * (1 - p), rel=0.1 )
+
+        # Both samples come from the same distribution
+        assert stats.ks_2samp(binomial[sel], per_electron[sel]).pvalue > 1e-3
+
+
+def test_drift_electrons_negative_z():
+    zs          = np.array([-10, -1]) * units.mm
+    n_electrons = np.array([100, 50])
+    assert np.all(drift_electrons(zs, n_electrons) == n_electrons)
+
+
 def test_diffuse_electrons(MChits_and_detsim_params):
 
     f = MChits_and_detsim_params
@@ -282,10 +282,72 @@ class TrackCollection(Event):
 
 
 class HitCollection(Event):
-    """A Collection of hits"""
+    """
+    A Collection of hits.
+
+    The hits can be given either as a list of `Hit` objects
+    or as one array per hit attribute (see `from_columns`).
+    In the latter case, the `Hit` objects are only built
+    when `hits` is accessed for the first time. From then on,
+    the list of hits is the only representation, since the
+    hits may be modified.
+    """
+    hit_columns = ( "npeak", "Xpeak", "Ypeak", "nsipm", "X", "Y", "Xrms", "Yrms"
+                  , "Z", "Q", "E", "Qc", "Ec", "track_id", "Ep")
+
     def __init__(self, event_number, event_time, hits=None):
         Event.__init__(self, event_number, event_time)
-        self.hits = [] if hits is None else hits
+        self._hits    = [] if hits is None else hits
+        self._columns = None
+
+    @classmethod
+    def from_columns(cls, event_number, event_time, columns):
+        """
+        Build a HitCollection from a mapping with a sequence
+        of values for each of the names in `hit_columns`.
+        """
+        hitc          = cls(event_number, event_time)
+        hitc._hits    = None
+        hitc._columns = {name: np.asarray(columns[name]) for name in cls.hit_columns}
+        return hitc
+
+    @property
+    def hits(self):
+        if self._hits is None:
+            self._hits    = self._make_hits()
+            self._columns = None
+        return self._hits
+
+    @hits.setter
+    def hits(self, hits):
+        self._hits    = hits
+        self._columns = None
+
+    def _make_hits(self):
+        columns = (self._columns[name].tolist() for name in self.hit_columns)
+        return [Hit(npeak,
+                    Cluster(Q, xy(X, Y), xy(Xrms**2, Yrms**2),
+                            nsipm=nsipm, z=Z, E=E, Qc=Qc),
+                    Z, E, xy(Xpeak, Ypeak),
+                    s2_energy_c=Ec, track_id=track_id, Ep=Ep)
+                for (npeak, Xpeak, Ypeak, nsipm, X, Y, Xrms, Yrms,
+                     Z, Q, E, Qc, Ec, track_id, Ep) in zip(*columns)]
+
+    @property
+    def number_of_hits(self):
+        if self._hits is None:
+            return len(self._columns["X"])
+        return len(self._hits)
+
+    def columns(self):
+        """
+        Returns a dictionary with an array of values for
+        each of the names in `hit_columns`.
+        """
+        if self._hits is None:
+            return dict(self._columns)
+        return {name: np.array([getattr(hit, name) for hit in self._hits])
+                for name in self.hit_columns}
 
     def store(self, table):
         row = table.row
@@ -163,6 +163,32 @@ def test_hit_collection_nonempty(hits):
     assert hc.hits == hits
 
 
+hit_attributes = HitCollection.hit_columns + ("R", "Phi", "XYZ")
+
+@given(lists(hits()))
+def test_hit_collection_from_columns_same_hits(hits):
+    columns = HitCollection(-1, -1, hits=hits).columns()
+    hc      = HitCollection.from_columns(-1, -1, columns)
+
+    assert hc.number_of_hits == len(hits)
+    assert len(hc.hits)      == len(hits)
+    for got, expected in zip(hc.hits, hits):
+        for attribute in hit_attributes:
+            assert np.allclose(getattr(got, attribute), getattr(expected, attribute))
+
+
+@given(lists(hits(), min_size=1))
+def test_hit_collection_columns_follow_hit_modifications(hits):
+    hc = HitCollection.from_columns(-1, -1, HitCollection(-1, -1, hits=hits).columns())
+    hc.hits[0].E = -123.
+    hc.hits.append(hits[0])
+
+    columns = hc.columns()
+    assert hc.number_of_hits == len(hits) + 1
+    assert columns["E"][ 0]  == -123.
+    assert columns["E"][-1]  == hits[0].E
+
+
 def test_kr_event_attributes():
     evt =  KrEvent(-1, -1)
 
@@ -122,6 +122,15 @@ class S2Si(tb.IsDescription):
     ene   = tb.Float32Col(pos=5) # energy in pes
 
 
+class EventRowRange(tb.IsDescription):
+    """Store the range of rows [start, stop) that each event
+    occupies in another table. Used to index the PMAPS tables.
+    """
+    event = tb.Int64Col(pos=0)
+    start = tb.Int64Col(pos=1)
+    stop  = tb.Int64Col(pos=2)
+
+
 class KrTable(tb.IsDescription):
     event   = tb.  Int64Col(pos= 0)
     time    = tb.Float64Col(pos= 1)
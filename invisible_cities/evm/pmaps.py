@@ -24,7 +24,32 @@ class PMap:
         return dedent(s)
 
 
+class _lazy:
+    """
+    Read-only attribute computed on first access and stored in the
+    slot named after it with a leading underscore. Works like
+    `functools.cached_property` for classes with `__slots__`.
+    """
+    def __init__(self, method):
+        self.method  = method
+        self.slot    = "_" + method.__name__
+        self.__doc__ = method.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None: return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            value = self.method(instance)
+            setattr(instance, self.slot, value)
+            return value
+
+
 class _Peak:
+    __slots__ = ( "times", "bin_widths", "pmts", "sipms"
+                , "_time_at_max_energy", "_height"
+                , "_total_energy", "_total_charge", "_width", "_rms")
+
     def __init__(self, times, bin_widths, pmts, sipms):
         self._check_valid_input(times, pmts, sipms)
 
@@ -33,13 +58,29 @@ class _Peak:
         self.pmts       = pmts
         self.sipms      = sipms
 
-        i_max                   = np.argmax(self.pmts.sum_over_sensors)
-        self.time_at_max_energy = self.times[i_max]
-        self.height             = np.max(self.pmts.sum_over_sensors)
-        self.total_energy       = self.energy_above_threshold(0)
-        self.total_charge       = self.charge_above_threshold(0)
-        self.width              = self. width_above_threshold(0)
-        self.rms                = self.   rms_above_threshold(0)
+    @_lazy
+    def time_at_max_energy(self):
+        return self.times[np.argmax(self.pmts.sum_over_sensors)]
+
+    @_lazy
+    def height(self):
+        return np.max(self.pmts.sum_over_sensors)
+
+    @_lazy
+    def total_energy(self):
+        return self.energy_above_threshold(0)
+
+    @_lazy
+    def total_charge(self):
+        return self.charge_above_threshold(0)
+
+    @_lazy
+    def width(self):
+        return self.width_above_threshold(0)
+
+    @_lazy
+    def rms(self):
+        return self.rms_above_threshold(0)
 
     def energy_above_threshold(self, thr):
         i_above_thr  = self.pmts.where_above_threshold(thr)
@@ -100,8 +141,11 @@ class _Peak:
             msg += f"sipms has length {length_sipms}\n"
             raise ValueError(msg)
 
-class S1(_Peak): pass
+class S1(_Peak):
+    __slots__ = ()
+
 class S2(_Peak):
+    __slots__ = ()
 
     def sipm_charge_array(self, noise_func, charge_type,
                           single_point=False):
@@ -130,18 +174,35 @@ class S2(_Peak):
 
 
 class _SensorResponses:
+    __slots__ = ( "ids", "all_waveforms"
+                , "_sum_over_sensors", "_sum_over_times", "_sorted_ids")
+
     def __init__(self, ids, wfs):
         self._check_valid_input(ids, wfs)
 
-        self.ids              = np.array(ids, copy=False, ndmin=1)
-        self.all_waveforms    = np.array(wfs, copy=False, ndmin=2)
-        self.sum_over_sensors = np.sum(self.all_waveforms, axis=0)
-        self.sum_over_times   = np.sum(self.all_waveforms, axis=1)
+        self.ids           = np.array(ids, copy=False, ndmin=1)
+        self.all_waveforms = np.array(wfs, copy=False, ndmin=2)
+
+    @_lazy
+    def sum_over_sensors(self):
+        return np.sum(self.all_waveforms, axis=0)
 
-        self._wfs_dict        = dict(zip(self.ids, self.all_waveforms))
+    @_lazy
+    def sum_over_times(self):
+        return np.sum(self.all_waveforms, axis=1)
 
     def waveform(self, sensor_id):
-        return self._wfs_dict[sensor_id]
+        try:
+            ids, order = self._sorted_ids
+        except AttributeError:
+            order            = np.argsort(self.ids, kind="stable")
+            ids              = self.ids[order]
+            self._sorted_ids = ids, order
+
+        i = np.searchsorted(ids, sensor_id)
+        if i == ids.size or ids[i] != sensor_id:
+            raise KeyError(sensor_id)
+        return self.all_waveforms[order[i]]
 
     def time_slice(self, slice_number):
         return self.all_waveforms[:, slice_number]
@@ -164,7 +225,7 @@ class _SensorResponses:
         sensors = [f"""
             | ID: {ID}
             | WF: {wf}
-            """ for ID, wf in self._wfs_dict.items()]
+            """ for ID, wf in zip(self.ids, self.all_waveforms)]
         return header + "".join(map(dedent, sensors))
 
     def _check_valid_input(self, ids, wfs):
@@ -175,5 +236,8 @@ class _SensorResponses:
             raise ValueError(msg)
 
 
-class PMTResponses (_SensorResponses): pass
-class SiPMResponses(_SensorResponses): pass
+class PMTResponses (_SensorResponses):
+    __slots__ = ()
+
+class SiPMResponses(_SensorResponses):
+    __slots__ = ()
@@ -108,6 +108,23 @@ def test_SensorResponses_waveform(srs):
         assert waveform == approx(sr.waveform(sensor_id))
 
 
+@mark.parametrize("SR", (PMTResponses, SiPMResponses))
+def test_SensorResponses_waveform_unsorted_ids(SR):
+    ids = np.array([7, 2, 9, 0])
+    wfs = np.arange(ids.size * 3).reshape(ids.size, 3)
+    sr  = SR(ids, wfs)
+    for sensor_id, waveform in zip(ids, wfs):
+        assert sr.waveform(sensor_id) == exactly(waveform)
+
+
+@mark.parametrize("SR", (PMTResponses, SiPMResponses))
+@mark.parametrize("sensor_id", (-1, 3, 10))
+def test_SensorResponses_waveform_raises_missing_id(SR, sensor_id):
+    sr = SR(np.array([7, 2, 9, 0]), np.ones((4, 3)))
+    with raises(KeyError):
+        sr.waveform(sensor_id)
+
+
 @given(sensor_responses())
 def test_SensorResponses_time_slice(srs):
     (_, all_waveforms), sr = srs
@@ -315,6 +332,22 @@ def test_Peak_rms_above_threshold_greater_than_equal_to_wf_max(pks):
     assert peak.rms_above_threshold(peak.height) == 0
 
 
+@mark.parametrize("PK", (S1, S2))
+def test_Peak_derived_quantities_are_computed_lazily(PK):
+    pmts  = PMTResponses (np.arange(3), np.ones((3, 4)))
+    sipms = SiPMResponses(np.arange(2), np.ones((2, 4)))
+    peak  = PK(np.arange(4), np.ones(4), pmts, sipms)
+
+    for name in "time_at_max_energy height total_energy total_charge width rms".split():
+        with raises(AttributeError):
+            getattr(peak, "_" + name)
+
+    assert peak.total_energy == 12
+    assert peak._total_energy == 12
+    assert not hasattr(peak, "__dict__")
+    assert not hasattr(pmts, "__dict__")
+
+
 @mark.parametrize("PK", (S1, S2))
 @given(sr1=sensor_responses(), sr2=sensor_responses())
 def test_Peak_raises_exception_when_shapes_dont_match(PK, sr1, sr2):
@@ -7,10 +7,7 @@ import pandas              as     pd
 
 from . dst_io              import load_dst
 from . dst_io              import df_writer
-from ..evm.event_model     import Hit
-from ..evm.event_model     import Cluster
 from ..evm.event_model     import HitCollection
-from .. types.ic_types     import xy
 from .  table_io           import make_table
 from .. evm .nh5           import HitsTable
 from .. types.ic_types     import NN
@@ -33,56 +30,51 @@ def hits_from_df (dst : pd.DataFrame, skip_NN : bool = False) -> Dict[int, HitCo
     ------
     Dictionary {event_number : HitCollection}
     """
+    if skip_NN:
+        Q   = dst.Q if 'Q' in dst else dst.E
+        dst = dst.loc[Q.values != NN]
+
+    columns = hit_columns_from_df(dst)
+    times   = getattr(dst, 'time', [-1]*len(dst))
+
     all_events = {}
-    times = getattr(dst, 'time', [-1]*len(dst))
-    for (event, time) , df in dst.groupby(['event', times]):
+    for (event, time), indices in dst.groupby(['event', times]).indices.items():
         #pandas is not consistent with numpy dtypes so we have to change it by hand
         event = np.int64(event)
-        hits  = []
-        for i, row in df.iterrows():
-            Q = getattr(row,'Q', row.E)
-            if skip_NN and Q == NN:
-                continue
-            if hasattr(row, 'Xrms'):
-                Xrms  = row.Xrms
-                Xrms2 = Xrms**2
-            else:
-                Xrms = Xrms2 = 0
-            if hasattr(row, 'Yrms'):
-                Yrms  = row.Yrms
-                Yrms2 = Yrms**2
-            else:
-                Yrms = Yrms2 = 0
-            nsipm   = getattr(row, 'nsipm'   , -1   )     # for backwards compatibility
-            Qc      = getattr(row, 'Qc'      , -1   )     # for backwards compatibility
-            Xpeak   = getattr(row, 'Xpeak'   , -1000)     # for backwards compatibility
-            Ypeak   = getattr(row, 'Ypeak'   , -1000)     # for backwards compatibility
-            Ec      = getattr(row, 'Ec'      , -1   )     # for backwards compatibility
-            trackID = getattr(row, 'track_id', -1   )     # for backwards compatibility
-            Ep      = getattr(row, "Ep"      , -1   )     # for backwards compatibility
-
-            hit = Hit(row.npeak            ,
-                      Cluster(Q               ,
-                              xy(row.X, row.Y),
-                              xy(Xrms2, Yrms2),
-                              nsipm = nsipm   ,
-                              z     = row.Z   ,
-                              E     = row.E   ,
-                              Qc    = Qc      ),
-                      row.Z                ,
-                      row.E                ,
-                      xy(Xpeak, Ypeak)     ,
-                      s2_energy_c = Ec     ,
-                      track_id    = trackID,
-                      Ep          = Ep     )
-
-            hits.append(hit)
-
-        if len(hits):
-            all_events[event] = HitCollection(event, time, hits=hits)
+        hits  = {name: values[indices] for name, values in columns.items()}
+        all_events[event] = HitCollection.from_columns(event, time, hits)
 
     return all_events
 
+
+def hit_columns_from_df(dst : pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Extracts the columns of `HitCollection.hit_columns` from
+    dst, filling in the default values of the missing ones.
+    See `hits_from_df`.
+    """
+    def column(name, default):
+        # default values for backwards compatibility
+        return dst[name].values if name in dst else np.full(len(dst), default)
+
+    Q = dst.Q.values if 'Q' in dst else dst.E.values
+    E = dst.E.values
+    return dict( npeak    = dst.npeak.values
+               , Xpeak    = column('Xpeak'   , -1000)
+               , Ypeak    = column('Ypeak'   , -1000)
+               , nsipm    = column('nsipm'   , -1   )
+               , X        = dst.X.values
+               , Y        = dst.Y.values
+               , Xrms     = column('Xrms'    ,  0.  )
+               , Yrms     = column('Yrms'    ,  0.  )
+               , Z        = dst.Z.values
+               , Q        = Q
+               , E        = np.where(E == NN, Q, E) # as in Cluster
+               , Qc       = column('Qc'      , -1   )
+               , Ec       = column('Ec'      , -1   )
+               , track_id = column('track_id', -1   )
+               , Ep       = column('Ep'      , -1   ))
+
 # reader
 def load_hits(DST_file_name : str, group_name : str = 'RECO', table_name : str = 'Events', skip_NN : bool = False
              )-> Dict[int, HitCollection]:
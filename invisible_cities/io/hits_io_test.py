@@ -13,6 +13,7 @@ from .. evm.event_model    import Hit
 from .. evm.event_model    import HitCollection
 from .  hits_io            import hits_writer
 from .  hits_io            import load_hits
+from .  hits_io            import hits_from_df
 from .. types.ic_types     import NN
 
 from .. core.testing_utils import assert_dataframes_close
@@ -79,6 +80,32 @@ def test_load_hits_double_ratio_e_q_equals_one_skipping_NN(TlMC_hits_skipping_NN
     np.isclose(r, 1, rtol=0.1)
 
 
+def test_hits_from_df_defaults_and_NN():
+    dst = pd.DataFrame(dict( event = [ 1,  1,  0]
+                           , npeak = [ 0,  1,  0]
+                           , X     = [1., 2., 3.]
+                           , Y     = [4., 5., 6.]
+                           , Z     = [7., 8., 9.]
+                           , Q     = [10., NN, 12.]
+                           , E     = [NN, 14., 15.]))
+
+    hits = hits_from_df(dst)
+    assert list(hits) == [0, 1]
+    assert all(hitc.time == -1 for hitc in hits.values())
+
+    hit0, hit1 = hits[1].hits
+    assert hit0.E      == 10     # Q replaces a NN energy
+    assert hit1.Q      == NN
+    assert hit0.Xpeak  == hit0.Ypeak == -1000
+    assert hit0.Xrms   == hit0.Yrms  == 0
+    assert hit0.nsipm  == hit0.Qc    == hit0.Ec == hit0.track_id == hit0.Ep == -1
+    assert hit1.XYZ    == (2, 5, 8)
+    assert hit1.npeak  == 1
+
+    hits = hits_from_df(dst, skip_NN=True)
+    assert [len(hitc.hits) for hitc in hits.values()] == [1, 1]
+
+
 def test_hits_writer_output_nodes(config_tmpdir, Th228_hits):
     output_file   = os.path.join(config_tmpdir, "test_hits.h5")
     original_hits = pd.read_hdf(Th228_hits, "/RECO/Events")
@@ -15,50 +15,152 @@ from .. evm                import nh5     as table_formats
 from .. core.tbl_functions import filters as tbl_filters
 
 
+def build_pmt_sum_records(peak, peak_number, event_number, dtype):
+    """
+    Build the records of the PMT-summed waveform of a peak as a
+    structured array with one row per time sample.
+    """
+    records           = np.empty(peak.times.size, dtype=dtype)
+    records['event' ] = event_number
+    records['peak'  ] = peak_number
+    records['time'  ] = peak.times
+    records['bwidth'] = peak.bin_widths
+    records['ene'   ] = peak.pmts.sum_over_sensors
+    return records
+
+
+def build_sensor_records(responses, sensor_field, peak_number, event_number, dtype):
+    """
+    Build the records of the individual sensor waveforms of a peak
+    as a structured array with one row per sensor and time sample,
+    sensor-major.
+    """
+    wfs                   = responses.all_waveforms
+    n_samples             = wfs.shape[1]
+    records               = np.empty(wfs.size, dtype=dtype)
+    records['event'     ] = event_number
+    records['peak'      ] = peak_number
+    records[sensor_field] = np.repeat(responses.ids, n_samples)
+    records['ene'       ] = wfs.ravel()
+    return records
+
+
+def build_peak_records(pmt_table, pmti_table, si_table,
+                       peak, peak_number, event_number):
+    pmt_records  = build_pmt_sum_records(peak, peak_number, event_number, pmt_table.dtype)
+    pmti_records = build_sensor_records (peak.pmts, 'npmt', peak_number, event_number, pmti_table.dtype)
+    if si_table is None:
+        return pmt_records, pmti_records, None
+
+    si_records   = build_sensor_records (peak.sipms, 'nsipm', peak_number, event_number, si_table.dtype)
+    return pmt_records, pmti_records, si_records
+
+
 def store_peak(pmt_table, pmti_table, si_table,
                peak, peak_number, event_number):
-    pmt_row  =  pmt_table.row
-    pmti_row = pmti_table.row
-
-    for i, t in enumerate(peak.times):
-        pmt_row['event' ] = event_number
-        pmt_row['peak'  ] = peak_number
-        pmt_row['time'  ] = t
-        pmt_row['bwidth'] = peak.bin_widths[i]
-        pmt_row['ene'   ] = peak.pmts.sum_over_sensors[i]
-        pmt_row.append()
-
-    for pmt_id in peak.pmts.ids:
-        for e in peak.pmts.waveform(pmt_id):
-            pmti_row['event'] = event_number
-            pmti_row['peak' ] =  peak_number
-            pmti_row['npmt' ] = pmt_id
-            pmti_row['ene'  ] = e
-            pmti_row.append()
-
-    if si_table is None: return
-
-    si_row = si_table.row
-    for sipm_id in peak.sipms.ids:
-        for q in peak.sipms.waveform(sipm_id):
-            si_row['event'] = event_number
-            si_row['peak' ] =  peak_number
-            si_row['nsipm'] = sipm_id
-            si_row['ene'  ] = q
-            si_row.append()
+    records = build_peak_records(pmt_table, pmti_table, si_table,
+                                 peak, peak_number, event_number)
+    for table, table_records in zip((pmt_table, pmti_table, si_table), records):
+        if table is None: continue
+        table.append(table_records)
 
 
-def store_pmap(tables, pmap, event_number):
+def build_pmap_records(tables, pmap, event_number):
+    """
+    Build the records of all the PMAPS tables for one event.
+
+    Returns
+    -------
+    A tuple with one structured array per table, in the same order as
+    `tables`: S1, S2, S2Si, S1Pmt, S2Pmt.
+    """
     s1_table, s2_table, si_table, s1i_table, s2i_table = tables
-    for peak_number, s1 in enumerate(pmap.s1s):
-        store_peak(s1_table, s1i_table,     None, s1, peak_number, event_number)
-    for peak_number, s2 in enumerate(pmap.s2s):
-        store_peak(s2_table, s2i_table, si_table, s2, peak_number, event_number)
+    s1s = [build_peak_records(s1_table, s1i_table,     None, s1, peak_number, event_number)
+           for peak_number, s1 in enumerate(pmap.s1s)]
+    s2s = [build_peak_records(s2_table, s2i_table, si_table, s2, peak_number, event_number)
+           for peak_number, s2 in enumerate(pmap.s2s)]
+
+    def concatenate(table, peak_records, i):
+        if not peak_records: return np.empty(0, dtype=table.dtype)
+        return np.concatenate([records[i] for records in peak_records])
+
+    return (concatenate( s1_table, s1s, 0),
+            concatenate( s2_table, s2s, 0),
+            concatenate( si_table, s2s, 2),
+            concatenate(s1i_table, s1s, 1),
+            concatenate(s2i_table, s2s, 1))
+
+
+def store_pmap(tables, pmap, event_number):
+    records = build_pmap_records(tables, pmap, event_number)
+    for table, table_records in zip(tables, records):
+        if table_records.size:
+            table.append(table_records)
+
+
+def pmap_writer(file, *, compression=None, buffer_size=1, event_index=False):
+    """
+    Define a PMap writer. Each event is converted to structured
+    arrays, one per table, that are appended in bulk.
+
+    Parameters
+    ----------
+    file: tb.File
+      Output file.
 
+    compression: str, optional
+      Compression filter for the PMAPS tables.
 
-def pmap_writer(file, *, compression=None):
-    tables = _make_tables(file, compression)
-    return partial(store_pmap, tables)
+    buffer_size: int, optional
+      Number of events accumulated in memory before being written
+      to disk (defaults to 1, i.e. write every event).
+
+    event_index: bool, optional
+      Whether to store the range of rows occupied by each event in
+      the PMAPSIndex group, which `read_event_index` uses (default
+      False). The PMAPS group is the same either way.
+
+    Returns
+    -------
+    write_pmap: Callable
+      Function that takes a PMap and an event number. Its attribute
+      `flush` writes any buffered events and must be called before
+      closing the file when `buffer_size` > 1 (see
+      `components.flushing_sink`).
+    """
+    if buffer_size < 1:
+        raise ValueError(f"buffer_size must be positive, got {buffer_size}")
+
+    tables       = _make_tables(file, compression)
+    index_tables = (_make_index_tables(file, tables, compression) if event_index else
+                    (None,) * len(tables))
+    buffers      = tuple([] for _ in tables)
+    n_buffered   = 0
+
+    def flush():
+        nonlocal n_buffered
+        for table, index_table, buffer in zip(tables, index_tables, buffers):
+            if buffer:
+                records = np.concatenate(buffer)
+                if index_table is not None:
+                    index_table.append(build_event_index(records["event"], table.nrows))
+                table.append(records)
+                buffer.clear()
+        n_buffered = 0
+
+    def write_pmap(pmap, event_number):
+        nonlocal n_buffered
+        records = build_pmap_records(tables, pmap, event_number)
+        for buffer, table_records in zip(buffers, records):
+            if table_records.size:
+                buffer.append(table_records)
+
+        n_buffered += 1
+        if n_buffered >= buffer_size:
+            flush()
+
+    write_pmap.flush = flush
+    return write_pmap
 
 
 def _make_tables(hdf5_file, compression):
@@ -80,6 +182,91 @@ def _make_tables(hdf5_file, compression):
     return pmp_tables
 
 
+def _make_index_tables(hdf5_file, tables, compression):
+    compr       = tbl_filters(compression)
+    index_group = hdf5_file.create_group(hdf5_file.root, 'PMAPSIndex')
+    make_table  = partial(hdf5_file.create_table, index_group, filters=compr)
+    return tuple(make_table(table.name, table_formats.EventRowRange, f"{table.name} event index")
+                 for table in tables)
+
+
+def build_event_index(events, offset=0):
+    """
+    Find the range of rows occupied by each event in a column of event
+    numbers.
+
+    Parameters
+    ----------
+    events: np.ndarray
+      Event number of each row.
+
+    offset: int, optional
+      Row number of the first element of `events` (default 0).
+
+    Returns
+    -------
+    index: np.ndarray or None
+      Structured array with fields `event`, `start` and `stop`, one
+      entry per event. None if the rows of some event are not
+      contiguous.
+    """
+    events = np.asarray(events)
+    dtype  = tb.description.dtype_from_descr(table_formats.EventRowRange)
+    if events.size == 0: return np.empty(0, dtype=dtype)
+
+    starts = np.flatnonzero(np.diff(events)) + 1
+    starts = np.concatenate([[0], starts])
+    stops  = np.append(starts[1:], events.size)
+    if np.unique(events[starts]).size != starts.size:
+        return None
+
+    index          = np.empty(starts.size, dtype=dtype)
+    index["event"] = events[starts]
+    index["start"] = starts + offset
+    index["stop" ] = stops  + offset
+    return index
+
+
+def read_event_index(table):
+    """
+    Map each event number to the range of rows (start, stop) it
+    occupies in a PMAPS table. The index stored in the PMAPSIndex
+    group by `pmap_writer` is used when available and consistent
+    with the table. Otherwise it is built from the event column in
+    one pass.
+
+    Returns
+    -------
+    A dictionary mapping event numbers to (start, stop) tuples or None
+    if the rows of some event are not contiguous.
+    """
+    root  = table._v_file.root
+    index = None
+    if "PMAPSIndex" in root and table.name in root.PMAPSIndex:
+        index    = getattr(root.PMAPSIndex, table.name).read()
+        last_row = index["stop"][-1] if index.size else 0
+        if last_row != table.nrows or np.unique(index["event"]).size != index.size:
+            index = None
+
+    if index is None:
+        index = build_event_index(table.col("event"))
+        if index is None: return None
+
+    ranges = zip(index["start"].tolist(), index["stop"].tolist())
+    return dict(zip(index["event"].tolist(), ranges))
+
+
+def read_event_rows(table, index, event):
+    """
+    Read the rows of `table` belonging to `event` using the
+    event index produced by `read_event_index`.
+    """
+    if index is None:
+        return table.read_where(f"event=={event}")
+    start, stop = index.get(event, (0, 0))
+    return table.read(start, stop)
+
+
 def check_file_integrity(file):
     events_run      = file.root.Run  .events.read(field="evt_number")
     events_pmaps_s1 = file.root.PMAPS.S1    .read(field="event")
@@ -117,7 +304,7 @@ def load_pmaps_as_df(filename, lazy=False, **kwargs):
     return loader(filename, **kwargs)
 
 
-def load_pmaps_as_df_eager(filename):
+def load_pmaps_as_df_eager(filename, events=None):
     """
     Read pmaps from file as dataframes eagerly.
 
@@ -126,6 +313,9 @@ def load_pmaps_as_df_eager(filename):
     filename: str
       Path to the file to be read.
 
+    events: sequence of int or None, optional
+      Event numbers to be read (defaults to all).
+
     Returns
     -------
       - S1 PMT sum
@@ -134,21 +324,35 @@ def load_pmaps_as_df_eager(filename):
       - S1 per PMT
       - S2 per PMT
     """
+    def read_table(table):
+        if events is None: return table.read()
+
+        index = read_event_index(table)
+        if index is None:
+            records = table.read()
+            return records[np.isin(records["event"], events)]
+
+        ranges = sorted(index[event] for event in set(events) if event in index)
+        if not ranges: return table.read(0, 0)
+        return np.concatenate([table.read(start, stop) for start, stop in ranges])
+
     with tb.open_file(filename, 'r') as h5f:
         check_file_integrity(h5f)
 
         pmap  = h5f.root.PMAPS
         to_df = pd.DataFrame.from_records
-        return (to_df(pmap.S1   .read()),
-                to_df(pmap.S2   .read()),
-                to_df(pmap.S2Si .read()),
-                to_df(pmap.S1Pmt.read()) if 'S1Pmt' in pmap else None,
-                to_df(pmap.S2Pmt.read()) if 'S2Pmt' in pmap else None)
+        return (to_df(read_table(pmap.S1   )),
+                to_df(read_table(pmap.S2   )),
+                to_df(read_table(pmap.S2Si )),
+                to_df(read_table(pmap.S1Pmt)) if 'S1Pmt' in pmap else None,
+                to_df(read_table(pmap.S2Pmt)) if 'S2Pmt' in pmap else None)
 
 
-def load_pmaps_as_df_lazy(filename, skip=0, n=None):
+def load_pmaps_as_df_lazy(filename, skip=0, n=None, events=None):
     """
-    Read pmaps from file as dataframes lazily.
+    Read pmaps from file as dataframes lazily. Each event is read as a
+    contiguous slice of rows of each table using the event index (see
+    `read_event_index`).
 
     Parameters
     ----------
@@ -161,6 +365,10 @@ def load_pmaps_as_df_lazy(filename, skip=0, n=None):
     n: int or None, optional
       How many events to read (defaults to all).
 
+    events: sequence of int or None, optional
+      Event numbers to be read (defaults to all). `skip` and `n` are
+      applied after the selection.
+
     Returns
     -------
     An iterator of tuples of dataframes.
@@ -171,21 +379,25 @@ def load_pmaps_as_df_lazy(filename, skip=0, n=None):
       - S1 per PMT
       - S2 per PMT
     """
-    def read_event(table, event):
+    def read_event(table, index, event):
         if table is None: return None
-        records = table.read_where(f"event=={event}")
+        records = read_event_rows(table, index, event)
         return pd.DataFrame.from_records(records)
 
     tables = "S1 S2 S2Si S1Pmt S2Pmt".split()
     with tb.open_file(filename, 'r') as h5f:
         check_file_integrity(h5f)
 
-        events = h5f.root.Run.events.read(field="evt_number")
-        tables = [getattr(h5f.root.PMAPS, table, None) for table in tables]
-        n = events.size if n is None else n
-        events = events[skip : skip+n]
-        for event in events:
-            yield tuple(read_event(table, event) for table in tables)
+        all_events = h5f.root.Run.events.read(field="evt_number")
+        if events is not None:
+            all_events = all_events[np.isin(all_events, events)]
+
+        tables  = [getattr(h5f.root.PMAPS, table, None) for table in tables]
+        indices = [read_event_index(table) if table is not None else None for table in tables]
+        n = all_events.size if n is None else n
+        all_events = all_events[skip : skip+n]
+        for event in all_events:
+            yield tuple(read_event(table, index, event) for table, index in zip(tables, indices))
 
 
 # Hack fix to allow loading pmaps without individual pmts. Used in load_pmaps
@@ -220,7 +432,7 @@ def load_pmaps(filename, lazy=False, **kwargs):
     return loader(filename, **kwargs)
 
 
-def load_pmaps_eager(filename):
+def load_pmaps_eager(filename, events=None):
     """
     Read pmaps from file eagerly (all at once).
 
@@ -229,55 +441,21 @@ def load_pmaps_eager(filename):
     filename: str
       Path to the file to be read.
 
+    events: sequence of int or None, optional
+      Event numbers to be read (defaults to all).
+
     Returns
     -------
     A dictionary mapping event numbers to PMaps.
     """
-    pmap_dict = {}
-    s1df, s2df, sidf, s1pmtdf, s2pmtdf = load_pmaps_as_df_eager(filename)
+    s1df, s2df, sidf, s1pmtdf, s2pmtdf = load_pmaps_as_df_eager(filename, events)
     # Hack fix to allow loading pmaps without individual pmts
     if s1pmtdf is None: s1pmtdf = _build_ipmtdf_from_sumdf(s1df)
     if s2pmtdf is None: s2pmtdf = _build_ipmtdf_from_sumdf(s2df)
-    event_numbers = set.union(set(s1df.event), set(s2df.event))
-    s1df_grouped   =s1df   .groupby('event')
-    s1pmtdf_grouped=s1pmtdf.groupby('event')
-    s2df_grouped   =s2df   .groupby('event')
-    s2pmtdf_grouped=s2pmtdf.groupby('event')
-    sidf_grouped   =sidf   .groupby('event')
-    for event_number in event_numbers:
-        try:
-            s1indx=s1df_grouped      .groups[event_number]
-        except KeyError:
-            s1indx=[]
-        try:
-            s1pmtindx=s1pmtdf_grouped.groups[event_number]
-        except KeyError:
-            s1pmtindx=[]
-        try:
-            s2indx=s2df_grouped      .groups[event_number]
-        except KeyError:
-            s2indx=[]
-        try:
-            s2pmtindx=s2pmtdf_grouped.groups[event_number]
-        except KeyError:
-            s2pmtindx=[]
-        try:
-            siindx=sidf_grouped      .groups[event_number]
-        except KeyError:
-            siindx=[]
-
-        s1s = s1s_from_df(s1df   .iloc   [s1indx   ],
-                          s1pmtdf.iloc   [s1pmtindx])
-        s2s = s2s_from_df(s2df   .iloc   [s2indx   ],
-                          s2pmtdf.iloc   [s2pmtindx],
-                          sidf   .iloc   [siindx   ])
-
-        pmap_dict[event_number] = PMap(s1s, s2s)
-
-    return pmap_dict
-
-
-def load_pmaps_lazy(filename, skip=0, n=None):
+    return pmaps_from_dfs(s1df, s2df, sidf, s1pmtdf, s2pmtdf)
+
+
+def load_pmaps_lazy(filename, skip=0, n=None, events=None):
     """
     Read pmaps from file lazily.
 
@@ -292,11 +470,15 @@ def load_pmaps_lazy(filename, skip=0, n=None):
     n: int or None, optional
       How many events to read (defaults to all).
 
+    events: sequence of int or None, optional
+      Event numbers to be read (defaults to all). `skip` and `n` are
+      applied after the selection.
+
     Returns
     -------
     An iterator of dict[event_number, PMap].
     """
-    for (s1df, s2df, sidf, s1pmtdf, s2pmtdf) in load_pmaps_as_df_lazy(filename, skip, n):
+    for (s1df, s2df, sidf, s1pmtdf, s2pmtdf) in load_pmaps_as_df_lazy(filename, skip, n, events):
         # Hack fix to allow loading pmaps without individual pmts
         if s1pmtdf is None: s1pmtdf = _build_ipmtdf_from_sumdf(s1df)
         if s2pmtdf is None: s2pmtdf = _build_ipmtdf_from_sumdf(s2df)
@@ -308,62 +490,149 @@ def load_pmaps_lazy(filename, skip=0, n=None):
         yield event_number, PMap(s1s, s2s)
 
 
-def build_pmt_responses(pmtdf, ipmtdf):
-    times = pmtdf.time.values
-    try:
-        widths = pmtdf.bwidth.values
-    except AttributeError:
-        ## Old file without bin widths saved
-        ## Calculate 'fake' widths from times
-        time_diff = np.diff(times)
-        if len(time_diff) == 0:
-            widths = np.full(1, 1000)
-        elif np.all(time_diff == time_diff[0]):
-            ## S1-like
-            widths = np.full(times.shape, time_diff[0])
-        else:
-            ## S2-like, round to closest mus
-            binw = time_diff.max().round(-3)
-            widths = np.full(times.shape, binw)
-    pmt_ids = pd.unique(ipmtdf.npmt.values)
-    enes    =           ipmtdf.ene .values.reshape(pmt_ids.size,
-                                                     times.size)
-    return times, widths, PMTResponses(pmt_ids, enes)
+def _fake_bin_widths(times):
+    ## Old file without bin widths saved
+    ## Calculate 'fake' widths from times
+    time_diff = np.diff(times)
+    if len(time_diff) == 0:
+        return np.full(1, 1000)
+    elif np.all(time_diff == time_diff[0]):
+        ## S1-like
+        return np.full(times.shape, time_diff[0])
+    else:
+        ## S2-like, round to closest mus
+        binw = time_diff.max().round(-3)
+        return np.full(times.shape, binw)
 
 
-def build_sipm_responses(sidf):
-    if len(sidf) == 0: return SiPMResponses.build_empty_instance()
+def _pmt_responses(pmt_ids, enes, n_times):
+    pmt_ids = pd.unique(pmt_ids)
+    enes    = enes.reshape(pmt_ids.size, n_times)
+    return PMTResponses(pmt_ids, enes)
+
 
-    sipm_ids = pd.unique(sidf.nsipm.values)
-    enes     =           sidf.ene  .values
+def _sipm_responses(sipm_ids, enes):
+    if enes.size == 0: return SiPMResponses.build_empty_instance()
+
+    sipm_ids = pd.unique(sipm_ids)
     n_times  = enes.size // sipm_ids.size
     enes     = enes.reshape(sipm_ids.size, n_times)
     return SiPMResponses(sipm_ids, enes)
 
 
-def s1s_from_df(s1df, s1pmtdf):
-    s1s = []
-    peak_numbers = set(s1df.peak)
-    for peak_number in peak_numbers:
-        (times ,
-         widths,
-         pmt_r ) = build_pmt_responses(s1df   [s1df   .peak == peak_number],
-                                       s1pmtdf[s1pmtdf.peak == peak_number])
-        s1s.append(S1(times, widths,
-                      pmt_r, SiPMResponses.build_empty_instance()))
+def build_pmt_responses(pmtdf, ipmtdf):
+    times  = pmtdf.time.values
+    widths = pmtdf.bwidth.values if "bwidth" in pmtdf else _fake_bin_widths(times)
+    pmt_r  = _pmt_responses(ipmtdf.npmt.values, ipmtdf.ene.values, times.size)
+    return times, widths, pmt_r
+
+
+def build_sipm_responses(sidf):
+    return _sipm_responses(sidf.nsipm.values, sidf.ene.values)
 
-    return s1s
+
+def split_by_event_and_peak(df):
+    """
+    Sort the rows of a PMap dataframe by event and peak, keeping the
+    order of the rows within each peak, and find the rows belonging
+    to each peak. No copy is made if the rows are already sorted,
+    which is the case for files written by `pmap_writer`.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+      Dataframe with, at least, columns `event` and `peak`.
+
+    Returns
+    -------
+    columns: dict
+      Maps each column name to the array of sorted values.
+
+    rows: dict
+      Maps each (event, peak) pair to the slice of `columns` that
+      contains its rows.
+    """
+    events  = df.event.values
+    peaks   = df.peak .values.astype(np.int64)
+    d_event = np.diff(events)
+    d_peak  = np.diff(peaks)
+    if np.all((d_event > 0) | ((d_event == 0) & (d_peak >= 0))):
+        columns = {name: df[name].values for name in df.columns}
+    else:
+        order   = np.lexsort((peaks, events))
+        columns = {name: df[name].values[order] for name in df.columns}
+        events  = events[order]
+        peaks   = peaks [order]
+        d_event = np.diff(events)
+        d_peak  = np.diff(peaks)
+
+    if events.size == 0: return columns, {}
+
+    starts = np.flatnonzero((d_event != 0) | (d_peak != 0)) + 1
+    starts = np.concatenate([[0], starts])
+    stops  = np.append(starts[1:], events.size)
+    keys   = zip(events[starts].tolist(), peaks[starts].tolist())
+    rows   = {key: slice(start, stop) for key, start, stop in zip(keys, starts, stops)}
+    return columns, rows
+
+
+def peaks_from_dfs(peak_type, sumdf, pmtdf, sidf=None):
+    """
+    Build the peaks of type `peak_type` contained in the PMAPS
+    dataframes. Each peak is built from slices of the sorted columns.
+
+    Returns
+    -------
+    A dictionary mapping each event number to its list of peaks,
+    ordered by peak number.
+    """
+    sum_columns, sum_rows = split_by_event_and_peak(sumdf)
+    pmt_columns, pmt_rows = split_by_event_and_peak(pmtdf)
+    if sidf is not None:
+        si_columns, si_rows = split_by_event_and_peak(sidf)
+
+    no_rows = slice(0, 0)
+    peaks   = {}
+    for (event, peak), rows in sum_rows.items():
+        times    = sum_columns["time"][rows]
+        widths   = (sum_columns["bwidth"][rows] if "bwidth" in sum_columns else
+                    _fake_bin_widths(times))
+
+        rows     = pmt_rows.get((event, peak), no_rows)
+        pmt_r    = _pmt_responses(pmt_columns["npmt"][rows],
+                                  pmt_columns["ene" ][rows],
+                                  times.size)
+
+        if sidf is None:
+            sipm_r = SiPMResponses.build_empty_instance()
+        else:
+            rows   = si_rows.get((event, peak), no_rows)
+            sipm_r = _sipm_responses(si_columns["nsipm"][rows],
+                                     si_columns["ene"  ][rows])
+
+        peaks.setdefault(event, []).append(peak_type(times, widths, pmt_r, sipm_r))
+    return peaks
+
+
+def pmaps_from_dfs(s1df, s2df, sidf, s1pmtdf, s2pmtdf):
+    """
+    Build PMaps from the PMAPS dataframes of any number of events.
+
+    Returns
+    -------
+    A dictionary mapping event numbers to PMaps, sorted by event number.
+    """
+    s1s    = peaks_from_dfs(S1, s1df, s1pmtdf)
+    s2s    = peaks_from_dfs(S2, s2df, s2pmtdf, sidf)
+    events = sorted(set(s1s) | set(s2s))
+    return {event: PMap(s1s.get(event, ()), s2s.get(event, ())) for event in events}
+
+
+def s1s_from_df(s1df, s1pmtdf):
+    s1s = peaks_from_dfs(S1, s1df, s1pmtdf)
+    return [s1 for event in sorted(s1s) for s1 in s1s[event]]
 
 
 def s2s_from_df(s2df, s2pmtdf, sidf):
-    s2s = []
-    peak_numbers = set(s2df.peak)
-    for peak_number in peak_numbers:
-        (times,
-         widths,
-         pmt_r ) = build_pmt_responses (s2df   [s2df   .peak == peak_number],
-                                        s2pmtdf[s2pmtdf.peak == peak_number])
-        sipm_r   = build_sipm_responses(sidf   [sidf   .peak == peak_number])
-        s2s.append(S2(times, widths, pmt_r, sipm_r))
-
-    return s2s
+    s2s = peaks_from_dfs(S2, s2df, s2pmtdf, sidf)
+    return [s2 for event in sorted(s2s) for s2 in s2s[event]]
@@ -282,6 +282,149 @@ def test_store_pmap(output_tmpdir, KrMC_pmaps_dict):
         assert cols.ene  [:] == approx (s2_data.enes_sipm)
 
 
+@mark.parametrize("buffer_size", (1, 2, 3))
+def test_pmap_writer_buffered(output_tmpdir, two_pmaps_evm, buffer_size):
+    output_filename = os.path.join(output_tmpdir, f"pmap_writer_buffered_{buffer_size}.h5")
+    reference_filename = os.path.join(output_tmpdir, "pmap_writer_reference.h5")
+
+    with tb.open_file(reference_filename, "w") as h5f:
+        tables = pmpio._make_tables(h5f, None)
+        for evt_number, pmap in two_pmaps_evm.items():
+            for peak_number, s1 in enumerate(pmap.s1s):
+                pmpio.store_peak(tables[0], tables[3], None, s1, peak_number, evt_number)
+            for peak_number, s2 in enumerate(pmap.s2s):
+                pmpio.store_peak(tables[1], tables[4], tables[2], s2, peak_number, evt_number)
+        expected = {table.name: table.read() for table in tables}
+
+    with tb.open_file(output_filename, "w") as h5f:
+        write_pmap = pmpio.pmap_writer(h5f, buffer_size=buffer_size)
+        for evt_number, pmap in two_pmaps_evm.items():
+            write_pmap(pmap, evt_number)
+
+        n_written = h5f.root.PMAPS.S1.nrows
+        if buffer_size > len(two_pmaps_evm): assert n_written == 0
+        else                               : assert n_written  > 0
+
+        write_pmap.flush()
+        for name, records in expected.items():
+            table = getattr(h5f.root.PMAPS, name)
+            assert table.dtype == records.dtype
+            assert np.all(table.read() == records)
+
+
+@mark.parametrize("buffer_size", (2, 3))
+def test_pmap_writer_flush_writes_incomplete_buffer(output_tmpdir, two_pmaps_evm, buffer_size):
+    pmaps  = list(two_pmaps_evm.values())
+    events = range(5) # not a multiple of buffer_size
+
+    def write(filename, buffer_size):
+        with tb.open_file(filename, "w") as h5f:
+            write_pmap = pmpio.pmap_writer(h5f, buffer_size=buffer_size)
+            for event in events:
+                write_pmap(pmaps[event % len(pmaps)], event)
+            write_pmap.flush()
+
+    filename           = os.path.join(output_tmpdir, f"pmap_writer_flush_{buffer_size}.h5")
+    reference_filename = os.path.join(output_tmpdir, f"pmap_writer_flush_reference.h5")
+    write(          filename, buffer_size)
+    write(reference_filename,           1)
+
+    with tb.open_file(filename) as h5f, tb.open_file(reference_filename) as reference:
+        for name in "S1 S2 S2Si S1Pmt S2Pmt".split():
+            got      = getattr(h5f      .root.PMAPS, name).read()
+            expected = getattr(reference.root.PMAPS, name).read()
+            assert set(expected["event"]) == set(events)
+            assert np.all(got == expected)
+
+
+def test_pmap_writer_raises_invalid_buffer_size(output_tmpdir):
+    output_filename = os.path.join(output_tmpdir, "pmap_writer_invalid_buffer.h5")
+    with tb.open_file(output_filename, "w") as h5f:
+        with raises(ValueError):
+            pmpio.pmap_writer(h5f, buffer_size=0)
+
+
+def test_build_event_index():
+    events = np.array([3, 3, 3, 1, 1, 7, 7, 7, 7])
+    index  = pmpio.build_event_index(events, offset=10)
+    assert index["event"] == exactly([ 3,  1,  7])
+    assert index["start"] == exactly([10, 13, 15])
+    assert index["stop" ] == exactly([13, 15, 19])
+
+
+def test_build_event_index_empty():
+    index = pmpio.build_event_index(np.empty(0, dtype=int))
+    assert index.size == 0
+    assert index.dtype.names == ("event", "start", "stop")
+
+
+def test_build_event_index_non_contiguous():
+    events = np.array([3, 3, 1, 1, 3])
+    assert pmpio.build_event_index(events) is None
+
+
+@fixture(scope="session")
+def two_pmaps_with_index(two_pmaps_evm, output_tmpdir):
+    pmap_filename = os.path.join(output_tmpdir, "two_pmaps_with_index.h5")
+    with tb.open_file(pmap_filename, "w") as output_file:
+        write_pmap = pmpio.pmap_writer(output_file, event_index=True)
+        for event_number, pmap in two_pmaps_evm.items():
+            write_pmap(pmap, event_number)
+    return pmap_filename
+
+
+@mark.parametrize("with_index", (False, True))
+def test_pmap_writer_pmaps_group_layout(two_pmaps, two_pmaps_with_index, with_index):
+    filename = two_pmaps_with_index if with_index else two_pmaps[0]
+    with tb.open_file(filename) as h5f:
+        assert sorted(h5f.root.PMAPS._v_children) == sorted("S1 S2 S2Si S1Pmt S2Pmt".split())
+        assert ("PMAPSIndex" in h5f.root) == with_index
+
+
+def test_pmap_writer_stores_event_index(two_pmaps_with_index):
+    with tb.open_file(two_pmaps_with_index) as h5f:
+        for table in h5f.root.PMAPS:
+            stored   = getattr(h5f.root.PMAPSIndex, table.name).read()
+            expected = pmpio.build_event_index(table.col("event"))
+            assert np.all(stored == expected)
+
+
+def test_read_event_index_without_stored_index(two_pmaps_with_index, output_tmpdir):
+    copy_filename  = os.path.join(output_tmpdir, "read_event_index_without_stored_index.h5")
+    shutil.copy(two_pmaps_with_index, copy_filename)
+    with tb.open_file(copy_filename, "r+") as h5f:
+        stored_index = {table.name: pmpio.read_event_index(table) for table in h5f.root.PMAPS}
+        h5f.remove_node(h5f.root.PMAPSIndex, recursive=True)
+        built_index  = {table.name: pmpio.read_event_index(table) for table in h5f.root.PMAPS}
+
+    assert stored_index == built_index
+
+
+@mark.parametrize("lazy", (False, True))
+def test_load_pmaps_event_selection(two_pmaps, lazy):
+    filename, true_pmaps, _ = two_pmaps
+    selected = list(true_pmaps)[1:]
+    read_pmaps = pmpio.load_pmaps(filename, lazy=lazy, events=selected)
+    read_pmaps = dict(read_pmaps)
+
+    assert sorted(read_pmaps) == sorted(selected)
+    for evt, pmap in read_pmaps.items():
+        assert_PMap_equality(pmap, true_pmaps[evt])
+
+
+@mark.parametrize("lazy", (False, True))
+def test_load_pmaps_as_df_event_selection(two_pmaps, lazy):
+    filename, true_pmaps, true_dfs = two_pmaps
+    selected = list(true_pmaps)[:1]
+    read_dfs = pmpio.load_pmaps_as_df(filename, lazy=lazy, events=selected)
+    if lazy:
+        read_dfs = [pd.concat(node_dfs, ignore_index=True) for node_dfs in zip(*read_dfs)]
+
+    for read_df, true_df in zip(read_dfs, true_dfs):
+        true_df = true_df[true_df.event.isin(selected)].reset_index(drop=True)
+        assert_dataframes_equal(read_df, true_df)
+
+
 def test_check_file_integrity_ok(KrMC_pmaps_filename):
     """For a file with no problems (like the input here), this test should pass."""
     # just check that it doesn't raise an exception
@@ -467,3 +610,38 @@ def test_build_sipm_responses_unordered():
         sipm_r = pmpio.build_sipm_responses(peak)
         assert sipm_r.ids                     == exactly(expected_sipms)
         assert sipm_r.all_waveforms.flatten() == exactly(expected_enes)
+
+
+def test_split_by_event_and_peak():
+    df = pd.DataFrame(dict( event = np.array([2, 2, 1, 1, 2, 1])
+                          , peak  = np.array([1, 1, 0, 0, 0, 1], dtype=np.uint8)
+                          , ene   = np.arange(6)
+                          ))
+    columns, rows = pmpio.split_by_event_and_peak(df)
+
+    assert list(rows) == [(1, 0), (1, 1), (2, 0), (2, 1)]
+    assert columns["ene"][rows[1, 0]] == exactly([2, 3])
+    assert columns["ene"][rows[1, 1]] == exactly([5])
+    assert columns["ene"][rows[2, 0]] == exactly([4])
+    assert columns["ene"][rows[2, 1]] == exactly([0, 1])
+
+
+def test_split_by_event_and_peak_sorted_input_is_not_copied(two_pmaps_dfs):
+    s1, *_ = two_pmaps_dfs
+    columns, _ = pmpio.split_by_event_and_peak(s1)
+    assert np.shares_memory(columns["ene"], s1.ene.values)
+
+
+@mark.parametrize("shuffle", (False, True))
+def test_pmaps_from_dfs(two_pmaps_evm, two_pmaps_dfs, shuffle):
+    dfs = two_pmaps_dfs
+    if shuffle:
+        # reverse the order of events and peaks, keeping the order of
+        # the rows within each peak
+        dfs = [df.sort_values(["event", "peak"], ascending=False, kind="stable")
+               for df in dfs]
+
+    pmaps = pmpio.pmaps_from_dfs(*dfs)
+    assert list(pmaps) == sorted(two_pmaps_evm)
+    for evt, pmap in pmaps.items():
+        assert_PMap_equality(pmap, two_pmaps_evm[evt])
@@ -6,6 +6,7 @@ import pytest
 
 from pytest                       import mark
 from pytest                       import raises
+from pytest                       import warns
 from pytest                       import fixture
 
 from hypothesis                   import given
@@ -18,9 +19,15 @@ from .. reco    .deconv_functions import cut_and_redistribute_df
 from .. reco    .deconv_functions import drop_isolated_sensors
 from .. reco    .deconv_functions import drop_isolated_clusters
 from .. reco    .deconv_functions import interpolate_signal
+from .. reco    .deconv_functions import interpolate_signal_grid
 from .. reco    .deconv_functions import deconvolution_input
 from .. reco    .deconv_functions import deconvolve
+from .. reco    .deconv_functions import deconvolve_slices
 from .. reco    .deconv_functions import richardson_lucy
+from .. reco    .deconv_functions import richardson_lucy_stack
+from .. reco    .deconv_functions import psf_transforms
+from .. reco    .deconv_functions import find_nearest
+from .. reco    .deconv_functions import PSFLibrary
 from .. reco    .deconv_functions import generate_satellite_mask
 from .. reco    .deconv_functions import collect_component_sizes
 from .. reco    .deconv_functions import no_satellite_killer
@@ -28,6 +35,7 @@ from .. reco    .deconv_functions import no_satellite_killer
 from .. core    .core_functions   import in_range
 from .. core    .core_functions   import shift_to_bin_centers
 from .. core    .testing_utils    import assert_dataframes_close
+from .. core    .testing_utils    import assert_dataframes_equal
 
 from .. io      .dst_io           import load_dst
 
@@ -150,6 +158,56 @@ def test_drop_isolated_clusters_retains_cluster():
 
 
 
+@fixture
+def grouped_hits():
+    rng = np.random.default_rng(9876)
+    dfs = []
+    for event in (2, 1):
+        for npeak in (1, 0):
+            for z in np.arange(5) * 4. + event * 100:
+                n  = rng.integers(1, 15)
+                xy = rng.integers(-3, 4, (n, 2)) * 10. + 5
+                dfs.append(pd.DataFrame(dict( event = event, npeak = npeak
+                                            , X = xy[:, 0], Y = xy[:, 1], Z = z
+                                            , E = rng.uniform(0, 100, n), Ec = rng.uniform(0, 100, n))))
+    return pd.concat(dfs, ignore_index=True).drop_duplicates(['event', 'npeak', 'X', 'Y', 'Z'])
+
+
+def test_drop_isolated_sensors_by_group_same_as_apply(grouped_hits):
+    variables = ['E', 'Ec']
+    expected  = grouped_hits.groupby(['event', 'npeak']).apply(drop_isolated_sensors([10., 10.], variables))
+    got       = drop_isolated_sensors([10., 10.], variables, ['event', 'npeak'])(grouped_hits)
+
+    assert len(got) < len(grouped_hits)
+    assert_dataframes_equal(got.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_drop_isolated_sensors_ignores_hits_at_the_same_position():
+    df     = pd.DataFrame(dict( X = [0., 0., 0., 50.], Y = [0., 0., 10., 50.]
+                              , Z = [1., 2., 1.,  1.], E = [1., 2., 3.,  4.]))
+    df_cut = drop_isolated_sensors([10., 10.], ['E'])(df)
+    assert df_cut.index.tolist() == [0, 1, 2]
+
+    df_cut = drop_isolated_sensors([10., 10.], ['E'])(df.iloc[[0, 1, 3]])
+    assert len(df_cut) == 0
+
+
+def test_drop_isolated_clusters_by_group_same_as_apply(grouped_hits):
+    variables = ['E', 'Ec']
+    drop      = drop_isolated_clusters([10., 10., 4.], 3, variables)
+    expected  = grouped_hits.groupby(['event', 'npeak']).apply(drop)
+    got       = drop_isolated_clusters([10., 10., 4.], 3, variables, ['event', 'npeak'])(grouped_hits)
+
+    assert len(got) < len(grouped_hits)
+    assert_dataframes_close(got.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_drop_isolated_clusters_without_clusters():
+    df     = pd.DataFrame(dict(X = [0., 100.], Y = [0., 100.], Z = [0., 100.], E = [1., 2.]))
+    df_cut = drop_isolated_clusters([10., 10., 4.], 1, ['E'])(df)
+    assert len(df_cut) == 0
+
+
 def test_interpolate_signal():
     ref_interpolation = np.array([0.   , 0.   , 0.   , 0.   , 0.   , 0    , 0.   , 0.   , 0.   ,
                                   0.   , 0.   , 0.   , 0.   , 0.17 , 0.183, 0.188, 0.195, 0.202,
@@ -188,6 +246,67 @@ def test_interpolate_signal():
     assert np.allclose(grid             , sorted(set(inter_position[1])))
 
 
+@fixture
+def regular_grid_signal():
+    centers  = [np.arange(-35., 36., 10.), np.arange(-25., 26., 10.)]
+    xx, yy   = np.meshgrid(*centers, indexing='ij')
+    Hs       = multivariate_normal((3., -4.), (400., 300.)).pdf(np.stack([xx, yy], axis=-1))
+    edges    = [[-50., 50.], [-40., 40.]]
+    det_grid = [np.arange(-59.5, 60, 1.)] * 2
+    return Hs, centers, (xx.flatten(), yy.flatten()), edges, det_grid
+
+
+@mark.parametrize("inter_method tolerance".split(), ((InterpolationMethod.nearest, 0   ),
+                                                     (InterpolationMethod.linear , 0.03),
+                                                     (InterpolationMethod.cubic  , 0.03)))
+def test_interpolate_signal_grid_close_to_griddata(regular_grid_signal, inter_method, tolerance):
+    Hs, centers, points, edges, det_grid = regular_grid_signal
+
+    expected, expected_pos = interpolate_signal     (Hs, points , edges, det_grid, inter_method)
+    got     , got_pos      = interpolate_signal_grid(Hs, centers, edges, det_grid, inter_method)
+
+    assert got.shape == expected.shape
+    assert np.all(got >= 0)
+    assert np.all((got == 0) == (expected == 0))
+    assert np.allclose(got, expected, rtol=0, atol=tolerance * expected.max())
+    for p, expected_p in zip(got_pos, expected_pos):
+        assert np.all(p == expected_p)
+
+
+@mark.parametrize("inter_method", (InterpolationMethod.linear, InterpolationMethod.cubic))
+def test_interpolate_signal_grid_exact_for_linear_signal(regular_grid_signal, inter_method):
+    _, centers, _, edges, det_grid = regular_grid_signal
+    xx, yy   = np.meshgrid(*centers, indexing='ij')
+    Hs       = 100 + 2 * xx - yy
+
+    got, pos = interpolate_signal_grid(Hs, centers, edges, det_grid, inter_method)
+    x  , y   = pos
+    inside   = in_range(x, centers[0][0], centers[0][-1]) & in_range(y, centers[1][0], centers[1][-1])
+    assert np.allclose(got.flatten()[inside], 100 + 2 * x[inside] - y[inside])
+    assert np.all     (got.flatten()[~in_range(x, centers[0][0], centers[0][-1] + 1e-6)] == 0)
+
+
+@mark.parametrize("inter_method", (InterpolationMethod.nearest, InterpolationMethod.linear, InterpolationMethod.cubic))
+def test_interpolate_signal_grid_uses_precomputed_mesh(regular_grid_signal, inter_method):
+    Hs, centers, _, edges, det_grid = regular_grid_signal
+    det_mesh = np.meshgrid(*det_grid, indexing='ij')
+
+    expected = interpolate_signal_grid(Hs, centers, edges, det_grid, inter_method)
+    got      = interpolate_signal_grid(Hs, centers, edges, det_grid, inter_method, det_mesh)
+    assert np.all(got[0] == expected[0])
+    for p, expected_p in zip(got[1], expected[1]):
+        assert np.all(p == expected_p)
+
+
+def test_deconvolution_input_validate_warns(regular_grid_signal):
+    _, _, points, _, det_grid = regular_grid_signal
+    weights      = np.arange(len(points[0]), dtype=float)
+    interpolator = deconvolution_input([10., 10.], det_grid, InterpolationMethod.cubic,
+                                       regular_grid=True, validate=True)
+    with warns(UserWarning, match="differs from griddata"):
+        interpolator(points, weights)
+
+
 @fixture(scope="session")
 def new_grid_1mm():
     bin_sizes = (1., 1.)
@@ -532,3 +651,160 @@ def test_generate_satellite_mask_doesnt_modify_input(sat_arr, cut_type):
 
     generate_satellite_mask(sat_arr, satellite_max_size = 3, e_cut = 0.5, cut_type = cut_type)
     assert np.allclose(sat_arr, sat_arr_original)
+
+
+def gaussian_blobs(shape, n_blobs, rng):
+    grid  = np.meshgrid(*map(np.arange, shape), indexing='ij')
+    image = np.zeros(shape)
+    for _ in range(n_blobs):
+        centre = [rng.uniform(n/4, 3*n/4) for n in shape]
+        sigma  = rng.uniform(2, 4)
+        dist2  = sum((g - c)**2 for g, c in zip(grid, centre))
+        image += rng.uniform(1, 3) * np.exp(-dist2 / (2 * sigma**2))
+    return image
+
+
+def gaussian_psf(shape, sigma):
+    grid  = np.meshgrid(*[np.arange(n) - (n - 1) / 2 for n in shape], indexing='ij')
+    psf   = np.exp(-sum(g**2 for g in grid) / (2 * sigma**2))
+    return psf / psf.sum()
+
+
+@mark.parametrize("satellite_params", ( no_satellite_killer
+                                      , dict(satellite_start_iter=3, satellite_max_size=3, e_cut=0.2, cut_type=CutType.rel)))
+def test_richardson_lucy_stack_matches_richardson_lucy(satellite_params):
+    rng    = np.random.default_rng(1234)
+    images = [gaussian_blobs(shape, 3, rng) for shape in [(30, 30), (25, 34), (41, 28), (30, 30)]]
+    psfs   = [gaussian_psf((21, 21), sigma) for sigma in (2, 3, 2.5, 4)]
+
+    kwargs = dict(iterations=30, iter_thr=1e-4, **satellite_params)
+    got    = richardson_lucy_stack(images, psfs, **kwargs)
+
+    assert len(got) == len(images)
+    for image, psf, deco in zip(images, psfs, got):
+        expected = richardson_lucy(image, psf, **kwargs)
+        assert deco.shape == image.shape
+        assert np.allclose(deco, expected, rtol=0, atol=1e-9 * expected.max())
+
+
+@mark.parametrize("shapes psf_shape".split(), ( ([(20, 20), (14, 23)]          , (11, 11))
+                                              , ([(12, 10,  8), ( 9, 12, 10)], ( 7,  5,  6))))
+def test_richardson_lucy_stack_common_psf(shapes, psf_shape):
+    rng    = np.random.default_rng(4321)
+    images = [gaussian_blobs(shape, 2, rng) for shape in shapes]
+    psf    = gaussian_psf(psf_shape, 1.5)
+
+    got    = richardson_lucy_stack(images, psf, iterations=20, **no_satellite_killer)
+    for image, deco in zip(images, got):
+        expected = richardson_lucy(image, psf, iterations=20, **no_satellite_killer)
+        assert np.allclose(deco, expected, rtol=0, atol=1e-9 * expected.max())
+
+
+def test_richardson_lucy_stack_stops_each_image_independently():
+    rng      = np.random.default_rng(2468)
+    psf      = gaussian_psf((11, 11), 2)
+    images   = [gaussian_blobs((30, 30), 3, rng), gaussian_psf((30, 30), 6)]
+
+    # the images reach the threshold after 50 and 86 iterations
+    iter_thr = 1e-3
+    got      = richardson_lucy_stack(images, psf, iterations=100, iter_thr=iter_thr, **no_satellite_killer)
+    for image, deco in zip(images, got):
+        expected = richardson_lucy(image, psf, iterations=100, iter_thr=iter_thr, **no_satellite_killer)
+        assert np.allclose(deco, expected, rtol=0, atol=1e-9 * expected.max())
+
+
+@fixture
+def psf_table():
+    xr       = np.linspace(-24.5, 24.5, 50)
+    xxr, yyr = map(np.ravel, np.meshgrid(xr, xr, indexing='ij'))
+    sectors  = []
+    for x in (-100., 100.):
+        for y in (-100., 100.):
+            for z in (50., 150., 250.):
+                factor = multivariate_normal([0., 0.], [5 + z / 50] * 2).pdf(np.stack([xxr, yyr], axis=1))
+                sectors.append(pd.DataFrame(dict( xr = xxr, yr = yyr, zr = 0.
+                                                , x  = x  , y  = y  , z  = z
+                                                , factor = factor, nevt = 1)))
+    # same row ordering as in the tables written by Eutropia
+    return pd.concat(sectors).sort_values(['xr', 'yr', 'zr', 'x', 'y', 'z'], ignore_index=True)
+
+
+@mark.parametrize("x y z".split(), ((-80., -120.,   0.),
+                                    ( 10.,  -10., 180.),
+                                    ( 99.,   99., 999.)))
+def test_psf_library_kernel_matches_table(psf_table, x, y, z):
+    library  = PSFLibrary(psf_table)
+    psf      = psf_table.loc[(psf_table.z == find_nearest(psf_table.z, z)) &
+                             (psf_table.x == find_nearest(psf_table.x, x)) &
+                             (psf_table.y == find_nearest(psf_table.y, y)) , :]
+    expected = psf.factor.values.reshape(psf.loc[:, ['xr', 'yr']].nunique().values)
+
+    sector   = library.sector(x, y, z)
+    kernel   = library.kernel([sector])
+    assert kernel.shape == (1,) + expected.shape
+    assert np.all(kernel[0] == expected)
+    assert np.all(library.coordinates(sector) == psf.loc[:, ['xr', 'yr']].values)
+
+
+def test_psf_library_raises_ValueError_with_different_grids(psf_table):
+    # drop the outer row of the grid of one sector
+    sector    = (psf_table.x == 100) & (psf_table.y == 100) & (psf_table.z == 50)
+    psf_table = psf_table.loc[~(sector & (psf_table.xr == psf_table.xr.max()))]
+    with raises(ValueError):
+        PSFLibrary(psf_table)
+
+
+def test_psf_library_transforms(psf_table):
+    library     = PSFLibrary(psf_table)
+    sectors     = [library.sector(-100, -100, z) for z in (50, 150, 250)]
+    fshape      = (80, 81)
+
+    psf_fft, mirror_fft = library.transforms(sectors, fshape)
+    expected            = psf_transforms(library.kernel(sectors), fshape)
+    assert np.allclose(psf_fft   , expected[0])
+    assert np.allclose(mirror_fft, expected[1])
+
+    # repeated sectors are only transformed once
+    psf_fft, mirror_fft = library.transforms(sectors[:1] * 4, fshape)
+    assert psf_fft.shape == mirror_fft.shape == (1, 80, 41)
+
+
+def test_psf_library_transforms_cache_is_bounded(psf_table):
+    library = PSFLibrary(psf_table, max_transforms=2)
+    sectors = [library.sector(-100, -100, z) for z in (50, 150, 250)]
+
+    first   = library._transforms(sectors[0], (64, 64))
+    assert library._transforms(sectors[0], (64, 64)) is first
+
+    library.transforms(sectors, (64, 64))
+    assert library._transforms.cache_info().currsize == 2
+    assert library._transforms(sectors[0], (64, 64)) is not first
+
+
+def test_deconvolve_slices_matches_deconvolve(psf_table):
+    rng       = np.random.default_rng(1357)
+    det_grid  = [np.arange(-99.5, 100, 1.)] * 2
+    sensors   = np.arange(-100, 101, 10.)
+    xs, ys    = map(np.ravel, np.meshgrid(sensors, sensors))
+    library   = PSFLibrary(psf_table)
+
+    data, weights, sectors = [], [], []
+    for z in (50, 150, 250, 150):
+        centre = rng.uniform(-30, 30, 2)
+        q      = np.exp(-((xs - centre[0])**2 + (ys - centre[1])**2) / (2 * 15**2))
+        sel    = q > 1e-2
+        data   .append((xs[sel], ys[sel]))
+        weights.append(q[sel])
+        sectors.append(library.sector(*centre, z))
+
+    params      = (20, 1e-4, [10., 10.], det_grid)
+    deconvolver = deconvolve       (*params, **no_satellite_killer)
+    images, pos = deconvolve_slices(*params, **no_satellite_killer)(data, weights, library, sectors)
+
+    assert len(images) == len(pos) == len(data)
+    for d, w, sector, image, p in zip(data, weights, sectors, images, pos):
+        x, y, z        = next(k for k, v in library.index.items() if v == sector)
+        psf            = psf_table[(psf_table.x == x) & (psf_table.y == y) & (psf_table.z == z)]
+        expected_image, expected_pos = deconvolver(d, w, psf)
+        assert np.allclose(image, expected_image, rtol=0, atol=1e-9 * expected_image.max())
+        assert all(np.all(pi == epi) for pi, epi in zip(p, expected_pos))
@@ -108,30 +108,85 @@ def merge_NN_hits(hits: pd.DataFrame, same_peak: bool = True) -> pd.DataFrame:
     - If a `NN` hit does not have any neighbours, the `NN` hit is effectively
       dropped.
     """
-    sel = hits.Q == NN
+    sel = hits.Q.values == NN
     if not np.any(sel): return hits # save some time
 
     nn_hits = hits.loc[ sel]
     hits    = hits.loc[~sel].copy()
-
-    corrections = pd.DataFrame(dict(E=0, Ec=0), index=hits.index.values)
-    for _, nn_hit in nn_hits.iterrows():
-        candidates = hits.loc[hits.npeak == nn_hit.npeak] if same_peak else hits
-        if len(candidates) == 0: continue # drop hit !!! dangerous
-
-        # find closest hit or hits
-        dz      = np.abs(candidates.Z - nn_hit.Z)
-        closest = candidates.loc[np.isclose(dz, dz.min())]
-        index   = closest.index
-
-        # redistribute energy proportionally to the receiving hits' energy
-        # corrections are accumulated to make this process order insentitive
-        corr_e  = nn_hit.E  * closest.E  / closest.E .sum()
-        corr_ec = nn_hit.Ec * closest.Ec / closest.Ec.sum()
-        corrections.loc[index, "E Ec".split()] += np.stack([corr_e, corr_ec], axis=1)
+    if hits.empty: return hits
+
+    # receiving candidates are grouped by peak (or all together) and
+    # sorted by Z, so that each Z slice is a contiguous block
+    group    = hits   .npeak.values if same_peak else np.zeros(len(hits   ), dtype=int)
+    nn_group = nn_hits.npeak.values if same_peak else np.zeros(len(nn_hits), dtype=int)
+    z, nn_z  = hits.Z.values, nn_hits.Z.values
+
+    order     = np.lexsort((z, group))
+    g_sorted  = group[order]
+    z_sorted  = z    [order]
+    new_slice = np.ones(len(order), dtype=bool)
+    new_slice[1:] = (g_sorted[1:] != g_sorted[:-1]) | (z_sorted[1:] != z_sorted[:-1])
+
+    bounds      = np.append(np.flatnonzero(new_slice), len(order))
+    slice_group = g_sorted[bounds[:-1]]
+    slice_z     = z_sorted[bounds[:-1]]
+    n_slices    = len(slice_z)
+
+    # locate all NN hits among the slices at once using integer keys
+    # that preserve the (peak, Z) ordering
+    _, z_rank = np.unique(np.concatenate([slice_z    ,  nn_z   ]), return_inverse=True)
+    _, g_rank = np.unique(np.concatenate([slice_group,  nn_group]), return_inverse=True)
+    key       = g_rank.astype(np.int64) * (z_rank.max() + 1) + z_rank
+    pos       = np.searchsorted(key[:n_slices], key[n_slices:])
+    first     = np.searchsorted(slice_group, nn_group, side="left" )
+    last      = np.searchsorted(slice_group, nn_group, side="right")
+
+    def distance(i):
+        return np.abs(slice_z[np.clip(i, 0, max(n_slices - 1, 0))] - nn_z)
+
+    below  = np.where(pos > first, distance(pos - 1), np.inf)
+    above  = np.where(pos < last , distance(pos    ), np.inf)
+    dz_min = np.fmin(below, above)
+
+    # extend the selection to all slices at the minimum distance
+    lo, hi = pos.copy(), pos.copy()
+    while True:
+        extend = (lo > first) & np.isclose(distance(lo - 1), dz_min)
+        if not np.any(extend): break
+        lo -= extend
+    while True:
+        extend = (hi < last ) & np.isclose(distance(hi    ), dz_min)
+        if not np.any(extend): break
+        hi += extend
+
+    # NN hits without candidates are dropped
+    start, stop = bounds[lo], bounds[hi]
+    merged      = stop > start
+    start, stop = start[merged], stop[merged]
+    size        = stop - start
+
+    # the receiving hits of each NN hit, in the same order as the NN hits
+    nn_index  = np.repeat(np.arange(len(size)), size)
+    offset    = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+    receivers = order[start[nn_index] + offset]
+
+    # NN hits sharing the same receiving hits share the normalization
+    sets, set_index = np.unique(np.stack([start, stop], axis=1), axis=0, return_inverse=True)
+    set_hits        = [np.sort(order[a:b]) for a, b in sets]
+
+    # redistribute energy proportionally to the receiving hits' energy
+    # corrections are accumulated to make this process order insentitive
+    corrections = np.zeros((len(hits), 2))
+    for i, column in enumerate("E Ec".split()):
+        energy    = hits   [column].values
+        nn_energy = nn_hits[column].values[merged]
+        total     = np.array([energy[idx].sum() for idx in set_hits])[set_index]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr  = nn_energy[nn_index] * energy[receivers] / total[nn_index]
+        np.add.at(corrections[:, i], receivers, corr)
 
     # apply correction factors based on original charge values
-    hits.loc[:, "E Ec".split()] += corrections.values
+    hits.loc[:, "E Ec".split()] += corrections
     return hits
 
 
@@ -156,6 +156,54 @@ def test_merge_nn_hits_does_not_leave_nn_hits(hits):
     assert all(hits_merged.Q != NN)
 
 
+def test_merge_nn_hits_splits_between_equidistant_slices():
+    hits = pd.DataFrame(dict( npeak = [ 0,  0,  0,  0,  0]
+                            , Z     = [10, 10, 20, 30, 30]
+                            , Q     = [ 1,  1, NN,  1,  1]
+                            , E     = [ 1,  3,  8,  2,  2]
+                            , Ec    = [ 2,  2,  4,  1,  3]))
+    hits_merged = merge_NN_hits(hits)
+
+    assert hits_merged.index.tolist() == [0, 1, 3, 4]
+    assert_almost_equal(hits_merged.E .values, [2, 6, 4, 4])
+    assert_almost_equal(hits_merged.Ec.values, [3, 3, 1.5, 4.5])
+
+
+@mark.parametrize("same_peak", (False, True))
+def test_merge_nn_hits_same_peak(same_peak):
+    hits = pd.DataFrame(dict( npeak = [ 0,  1,  1,  2]
+                            , Z     = [10, 30, 50, 50]
+                            , Q     = [ 1,  1, NN, NN]
+                            , E     = [ 1,  1,  1,  1]
+                            , Ec    = [ 1,  1,  1,  1]))
+    hits_merged = merge_NN_hits(hits, same_peak=same_peak)
+
+    # NN hits without candidates in their peak are dropped
+    expected = [1, 2] if same_peak else [1, 3]
+    assert hits_merged.index.tolist() == [0, 1]
+    assert_almost_equal(hits_merged.E .values, expected)
+    assert_almost_equal(hits_merged.Ec.values, expected)
+
+
+@mark.parametrize("same_peak", (False, True))
+def test_merge_nn_hits_large_event(same_peak):
+    rng  = np.random.default_rng(123456789)
+    size = 5000
+    Q    = rng.uniform(1, 10, size)
+    Q[rng.uniform(size=size) < 0.3] = NN
+    hits = pd.DataFrame(dict( npeak = rng.integers(0, 3, size)
+                            , Z     = rng.integers(0, 200, size) * 2.
+                            , Q     = Q
+                            , E     = rng.uniform(0, 5, size)
+                            , Ec    = rng.uniform(0, 5, size)))
+    hits_merged = merge_NN_hits(hits, same_peak=same_peak)
+
+    assert np.all(hits_merged.Q != NN)
+    assert np.all(hits_merged.E >= hits.E[hits.Q != NN])
+    assert_almost_equal(hits.E .sum(), hits_merged.E .sum())
+    assert_almost_equal(hits.Ec.sum(), hits_merged.Ec.sum())
+
+
 @given(list_of_hits(), floats())
 def test_threshold_hits_does_not_modify_input(hits, th):
     hits_org = deepcopy(hits)
@@ -7,6 +7,9 @@ import numpy    as np
 import networkx as nx
 
 from networkx           import Graph
+from scipy.spatial      import cKDTree
+from scipy.sparse       import csr_matrix
+from scipy.sparse       import csgraph
 from .. evm.event_model import Voxel
 from .. core.exceptions import NoHits
 from .. core.exceptions import NoVoxels
@@ -22,6 +25,7 @@ from typing import Sequence
 from typing import List
 from typing import Tuple
 from typing import Dict
+from typing import Optional
 
 MAX3D = np.array([float(' inf')] * 3)
 MIN3D = np.array([float('-inf')] * 3)
@@ -42,7 +46,10 @@ def voxelize_hits(hits             : Sequence[BHit],
     # 3. Calculate voxel energies by summing energies of hits within each sub-box.
     if not hits:
         raise NoHits
-    hlo, hhi = bounding_box(hits)
+    hit_data = np.array([(h.X, h.Y, h.Z, getattr(h, energy_type.value)) for h in hits], dtype=np.float64)
+    hit_positions, hit_energies = hit_data[:, :3], hit_data[:, 3]
+
+    hlo, hhi = hit_positions.min(axis=0), hit_positions.max(axis=0)
     bounding_box_centre = (hhi + hlo) / 2
     bounding_box_size   =  hhi - hlo
     number_of_voxels = np.ceil(bounding_box_size / voxel_dimensions).astype(int)
@@ -58,8 +65,6 @@ def voxelize_hits(hits             : Sequence[BHit],
     voxel_edges_lo -= eps
     voxel_edges_hi += eps
 
-    hit_positions = np.array([h.pos                   for h in hits]).astype('float64')
-    hit_energies  =          [getattr(h, energy_type.value) for h in hits]
     E, edges = np.histogramdd(hit_positions,
                               bins    = number_of_voxels,
                               range   = tuple(zip(voxel_edges_lo, voxel_edges_hi)),
@@ -76,28 +81,31 @@ def voxelize_hits(hits             : Sequence[BHit],
     nz = np.nonzero(E)
     true_dimensions = np.array([size_x[0], size_y[0], size_z[0]])
 
-    hit_x = np.array([h.X for h in hits])
-    hit_y = np.array([h.Y for h in hits])
-    hit_z = np.array([h.Z for h in hits])
-    hit_coordinates = [hit_x, hit_y, hit_z]
-
     indx_coordinates = []
     for i in range(3):
         # find the bins where hits fall into
         # numpy.histogramdd() uses [,) intervals...
-        index = np.digitize(hit_coordinates[i], edges[i], right=False) - 1
+        index = np.digitize(hit_positions[:, i], edges[i], right=False) - 1
         # ...except for the last one, which is [,]: hits on the last edge,
         # if any, must fall into the last bin
         index[index == number_of_voxels[i]] = number_of_voxels[i] - 1
         indx_coordinates.append(index)
 
-    h_indices = np.array([(i, j, k) for i, j, k in zip(indx_coordinates[0], indx_coordinates[1], indx_coordinates[2])])
+    # Group the hits by voxel sorting them by linear voxel index.
+    # The stable sort keeps the original order of the hits within each voxel.
+    hit_voxel   = np.ravel_multi_index(indx_coordinates, number_of_voxels)
+    hit_order   = np.argsort(hit_voxel, kind="stable")
+    hit_voxel   = hit_voxel[hit_order]
+    voxel_ids, first_hit = np.unique(hit_voxel, return_index=True)
+    last_hit    = np.append(first_hit[1:], hit_voxel.size)
 
     voxels = []
-    for (x,y,z) in np.stack(nz).T:
-
-        indx_comp = (h_indices == (x, y, z))
-        hits_in_bin = list(h for i, h in zip(indx_comp, hits) if all(i))
+    for (x,y,z), voxel_id in zip(np.stack(nz).T, np.ravel_multi_index(nz, E.shape)):
+        i = np.searchsorted(voxel_ids, voxel_id)
+        if i < voxel_ids.size and voxel_ids[i] == voxel_id:
+            hits_in_bin = [hits[j] for j in hit_order[first_hit[i]:last_hit[i]]]
+        else:
+            hits_in_bin = []
 
         voxels.append(Voxel(cx[x], cy[y], cz[z], E[x,y,z], true_dimensions, hits_in_bin, energy_type))
 
@@ -108,6 +116,52 @@ def neighbours(va : Voxel, vb : Voxel, contiguity : Contiguity = Contiguity.CORN
     return np.linalg.norm((va.pos - vb.pos) / va.size) < contiguity.value
 
 
+def neighbour_pairs(voxels     : Sequence[Voxel],
+                    contiguity : Contiguity = Contiguity.CORNER) -> Tuple[np.ndarray, np.ndarray]:
+    """Find all pairs of neighbour voxels, with the same criterion as
+    `neighbours`. When all voxels have the same size the candidates
+    are found with a k-d tree over the positions normalized to the
+    voxel size instead of testing every pair.
+
+    Returns the indices of the voxels in each pair (i, j), with i < j
+    and sorted lexicographically, and the distance between them.
+    """
+    if len(voxels) < 2:
+        return np.empty((0, 2), dtype=int), np.empty(0)
+
+    positions = np.array([v.pos  for v in voxels], dtype=float)
+    sizes     = np.array([np.broadcast_to(v.size, 3) for v in voxels], dtype=float)
+    if np.all(sizes == sizes[0]):
+        # Slightly larger radius to be sure that no pair is lost to
+        # rounding errors. The exact criterion is applied below.
+        radius = contiguity.value * (1 + 1e-6)
+        pairs  = cKDTree(positions / sizes[0]).query_pairs(radius, output_type="ndarray")
+        pairs  = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    else:
+        pairs  = np.array(list(combinations(range(len(voxels)), 2)))
+
+    first, second  = pairs.T
+    separation     = positions[first] - positions[second]
+    are_neighbours = np.linalg.norm(separation / sizes[first], axis=1) < contiguity.value
+    distances      = np.linalg.norm(separation[are_neighbours], axis=1)
+    return pairs[are_neighbours], distances
+
+
+def make_voxel_graph(voxels     : Sequence[Voxel],
+                     contiguity : Contiguity = Contiguity.CORNER) -> Graph:
+    """Create a graph where the voxels are the nodes and the edges are any
+    pair of neighbour voxel, weighted by their distance.
+    """
+    voxels = list(voxels)
+    pairs, distances = neighbour_pairs(voxels, contiguity)
+
+    voxel_graph = nx.Graph()
+    voxel_graph.add_nodes_from(voxels)
+    voxel_graph.add_edges_from((voxels[i], voxels[j], dict(distance=d))
+                               for (i, j), d in zip(pairs.tolist(), distances))
+    return voxel_graph
+
+
 def make_track_graphs(voxels           : Sequence[Voxel],
                       contiguity       : Contiguity = Contiguity.CORNER) -> Sequence[Graph]:
     """Create a graph where the voxels are the nodes and the edges are any
@@ -115,13 +169,7 @@ def make_track_graphs(voxels           : Sequence[Voxel],
     neighbours if their distance normalized to their size is smaller
     than a contiguity factor.
     """
-
-    voxel_graph = nx.Graph()
-    voxel_graph.add_nodes_from(voxels)
-    for va, vb in combinations(voxels, 2):
-        if neighbours(va, vb, contiguity):
-            voxel_graph.add_edge(va, vb, distance = np.linalg.norm(va.pos - vb.pos))
-
+    voxel_graph = make_voxel_graph(voxels, contiguity)
     return tuple(connected_component_subgraphs(voxel_graph))
 
 
@@ -134,18 +182,97 @@ def voxels_from_track_graph(track: Graph) -> List[Voxel]:
     return track.nodes()
 
 
+class TrackDistances:
+    """Shortest path lengths along the edges of a track graph, computed
+    with scipy.sparse.csgraph.
+
+    The voxels are sorted by position, so the results are reproducible.
+    The full distance matrix is only computed when the exact extrema
+    are requested. Otherwise, only the distances from the voxels that
+    are needed are computed.
+
+    The distances are computed for the track as it is at construction,
+    so a new instance is needed if the track is modified. The same
+    instance can be passed to the functions below to share the
+    distances of a track.
+    """
+
+    def __init__(self, track_graph : Graph):
+        voxels = list(track_graph.nodes())
+        if not voxels:
+            raise NoVoxels
+
+        positions   = np.array([v.pos for v in voxels], dtype=float).reshape(len(voxels), -1)
+        order       = np.lexsort(positions.T[::-1])
+        self.voxels = [voxels[i] for i in order]
+        self.index  = {v: i for i, v in enumerate(self.voxels)}
+
+        edges = np.array([(self.index[va], self.index[vb], d)
+                          for va, vb, d in track_graph.edges(data='distance', default=1)],
+                         dtype=float).reshape(-1, 3)
+        n     = len(self.voxels)
+        self.graph = csr_matrix((edges[:, 2], (edges[:, 0].astype(int), edges[:, 1].astype(int))), shape=(n, n))
+
+        self._matrix  = None
+        self._rows    = {}
+        self._extrema = {}
+
+    def matrix(self) -> np.ndarray:
+        """Distances between all pairs of voxels."""
+        if self._matrix is None:
+            self._matrix = csgraph.dijkstra(self.graph, directed=False)
+        return self._matrix
+
+    def from_voxel(self, voxel : Voxel) -> np.ndarray:
+        """Distances from `voxel` to all the voxels in the track."""
+        i = self.index[voxel]
+        if self._matrix is not None:
+            return self._matrix[i]
+        if i not in self._rows:
+            self._rows[i] = csgraph.dijkstra(self.graph, directed=False, indices=i)
+        return self._rows[i]
+
+    def extrema_and_length(self, exact : bool = True) -> Tuple[Voxel, Voxel, float]:
+        """Find the pair of voxels separated by the greatest distance
+        along the track. If `exact` is false, the extrema are found with
+        a double sweep: the farthest voxel from an arbitrary one is
+        taken as the first extreme and the farthest voxel from it as
+        the second one. This is exact for tree-like tracks and avoids
+        the full distance matrix.
+        """
+        if exact not in self._extrema:
+            if len(self.voxels) == 1:
+                only_voxel = self.voxels[0]
+                extrema    = only_voxel, only_voxel, 0.
+            elif exact:
+                # Upper triangle only: the first pair found with the
+                # largest distance is the same as in a loop over the
+                # pairs of voxels in order
+                distances = np.triu(self.matrix(), k=1)
+                i, j      = np.unravel_index(np.argmax(distances), distances.shape)
+                extrema   = self.voxels[i], self.voxels[j], distances[i, j]
+            else:
+                a       = np.argmax(self.from_voxel(self.voxels[0]))
+                d       = self.from_voxel(self.voxels[a])
+                b       = np.argmax(d)
+                i, j    = sorted((a, b))
+                extrema = self.voxels[i], self.voxels[j], d[b]
+            self._extrema[exact] = extrema
+        return self._extrema[exact]
+
+
 def shortest_paths(track_graph : Graph) -> Dict[Voxel, Dict[Voxel, float]]:
     """Compute shortest path lengths between all nodes in a weighted graph."""
-    def voxel_pos(x):
-        return x[0].pos.tolist()
+    if not track_graph:
+        return {}
 
-    distances = dict(nx.all_pairs_dijkstra_path_length(track_graph, weight='distance'))
-
-    # sort the output so the result is reproducible
-    distances = { v1 : {v2:d for v2, d in sorted(dmap.items(), key=voxel_pos)}
-                  for v1, dmap in sorted(distances.items(), key=voxel_pos)}
-    return distances
+    distances = TrackDistances(track_graph)
+    voxels    = distances.voxels
+    matrix    = distances.matrix()
 
+    # the voxels are sorted so the result is reproducible
+    return { v1 : {v2:d for v2, d in zip(voxels, row.tolist()) if d < np.inf}
+             for v1, row in zip(voxels, matrix)}
 
 
 def find_extrema_and_length(distance : Dict[Voxel, Dict[Voxel, float]]) -> Tuple[Voxel, Voxel, float]:
@@ -163,19 +290,34 @@ def find_extrema_and_length(distance : Dict[Voxel, Dict[Voxel, float]]) -> Tuple
     return first, last, max_distance
 
 
-def find_extrema(track: Graph) -> Tuple[Voxel, Voxel]:
+def track_extrema_and_length(track_graph          : Graph,
+                             max_voxels_all_pairs : Optional[int]            = None,
+                             distances            : Optional[TrackDistances] = None) -> Tuple[Voxel, Voxel, float]:
+    """Find the extrema and the length of a track. By default, they are
+    found from the distances between all pairs of voxels. If
+    `max_voxels_all_pairs` is given, tracks with more voxels use the
+    double sweep of `TrackDistances.extrema_and_length`, which does not
+    need the full distance matrix but is only exact for tree-like tracks.
+    """
+    if distances is None:
+        distances = TrackDistances(track_graph)
+    exact = max_voxels_all_pairs is None or len(track_graph) <= max_voxels_all_pairs
+    return distances.extrema_and_length(exact)
+
+
+def find_extrema(track                : Graph,
+                 max_voxels_all_pairs : Optional[int] = None) -> Tuple[Voxel, Voxel]:
     """Find the pair of voxels separated by the greatest geometric
       distance along the track.
     """
-    distances = shortest_paths(track)
-    extremum_a, extremum_b, _ = find_extrema_and_length(distances)
+    extremum_a, extremum_b, _ = track_extrema_and_length(track, max_voxels_all_pairs)
     return extremum_a, extremum_b
 
 
-def length(track: Graph) -> float:
+def length(track                : Graph,
+           max_voxels_all_pairs : Optional[int] = None) -> float:
     """Calculate the length of a track."""
-    distances = shortest_paths(track)
-    _, _, length = find_extrema_and_length(distances)
+    _, _, length = track_extrema_and_length(track, max_voxels_all_pairs)
     return length
 
 
@@ -203,10 +345,12 @@ def blob_centre(voxel: Voxel) -> Tuple[float, float, float]:
 
 def hits_in_blob(track_graph : Graph,
                  radius      : float,
-                 extreme     : Voxel) -> Sequence[BHit]:
+                 extreme     : Voxel,
+                 distances   : Optional[TrackDistances] = None) -> Sequence[BHit]:
     """Returns the hits that belong to a blob."""
-    distances         = shortest_paths(track_graph)
-    dist_from_extreme = distances[extreme]
+    if distances is None:
+        distances     = TrackDistances(track_graph)
+    dist_from_extreme = distances.from_voxel(extreme)
     blob_pos          = blob_centre(extreme)
     diag              = np.linalg.norm(extreme.size)
 
@@ -216,7 +360,7 @@ def hits_in_blob(track_graph : Graph,
     # the centres of the voxels, and not the hits. In the second step we will refine the
     # selection, using the euclidean distance between the blob position and the hits.
     for v in track_graph.nodes():
-        voxel_distance = dist_from_extreme[v]
+        voxel_distance = dist_from_extreme[distances.index[v]]
         if voxel_distance < radius + diag:
             for h in v.hits:
                 hit_distance = np.linalg.norm(blob_pos - h.pos)
@@ -226,13 +370,17 @@ def hits_in_blob(track_graph : Graph,
     return blob_hits
 
 
-def blob_energies_hits_and_centres(track_graph : Graph, radius : float) -> Tuple[float, float, Sequence[BHit], Sequence[BHit], Tuple[float, float, float], Tuple[float, float, float]]:
+def blob_energies_hits_and_centres(track_graph          : Graph,
+                                   radius               : float,
+                                   max_voxels_all_pairs : Optional[int]            = None,
+                                   distances            : Optional[TrackDistances] = None) -> Tuple[float, float, Sequence[BHit], Sequence[BHit], Tuple[float, float, float], Tuple[float, float, float]]:
     """Return the energies, the hits and the positions of the blobs.
        For each pair of observables, the one of the blob of largest energy is returned first."""
-    distances = shortest_paths(track_graph)
-    a, b, _   = find_extrema_and_length(distances)
-    ha = hits_in_blob(track_graph, radius, a)
-    hb = hits_in_blob(track_graph, radius, b)
+    if distances is None:
+        distances = TrackDistances(track_graph)
+    a, b, _   = track_extrema_and_length(track_graph, max_voxels_all_pairs, distances)
+    ha = hits_in_blob(track_graph, radius, a, distances)
+    hb = hits_in_blob(track_graph, radius, b, distances)
 
     voxels = list(track_graph.nodes())
     e_type = voxels[0].Etype
@@ -241,8 +389,8 @@ def blob_energies_hits_and_centres(track_graph : Graph, radius : float) -> Tuple
 
     # Consider the case where voxels are built without associated hits
     if len(ha) == 0 and len(hb) == 0 :
-        Ea = energy_of_voxels_within_radius(distances[a], radius)
-        Eb = energy_of_voxels_within_radius(distances[b], radius)
+        Ea = energy_of_voxels_within_radius(dict(zip(distances.voxels, distances.from_voxel(a))), radius)
+        Eb = energy_of_voxels_within_radius(dict(zip(distances.voxels, distances.from_voxel(b))), radius)
 
     ca = blob_centre(a)
     cb = blob_centre(b)
@@ -288,8 +436,7 @@ def make_tracks(evt_number       : float,
     tc = TrackCollection(evt_number, evt_time) # type: TrackCollection
     track_graphs = make_track_graphs(voxels, contiguity) # type: Sequence[Graph]
     for trk in track_graphs:
-        energy_a, energy_b, hits_a, hits_b = blob_energies_and_hits(trk, blob_radius)
-        a, b                               = blob_centres(trk, blob_radius)
+        energy_a, energy_b, hits_a, hits_b, a, b = blob_energies_hits_and_centres(trk, blob_radius)
         blob_a = Blob(a, hits_a, blob_radius, energy_type) # type: Blob
         blob_b = Blob(b, hits_b, blob_radius, energy_type)
         blobs = (blob_a, blob_b)
@@ -308,12 +455,10 @@ def drop_end_point_voxels(voxels           : Sequence[Voxel],
 
     e_type = voxels[0].Etype
 
-    def drop_voxel(voxels: Sequence[Voxel], the_vox: Voxel, contiguity: Contiguity = Contiguity.CORNER) -> int:
+    def drop_voxel(the_neighbour_voxels: Sequence[Voxel], the_vox: Voxel) -> int:
         """Eliminate an individual voxel from a set of voxels and give its energy to the hit
            that is closest to the barycenter of the eliminated voxel hits, provided that it
            belongs to a neighbour voxel."""
-        the_neighbour_voxels = [v for v in voxels if neighbours(the_vox, v, contiguity)]
-
         pos = [h.pos              for h in the_vox.hits]
         qs  = [getattr(h, e_type) for h in the_vox.hits]
 
@@ -352,27 +497,43 @@ def drop_end_point_voxels(voxels           : Sequence[Voxel],
     mod_voxels     = copy.deepcopy(voxels)
     dropped_voxels = []
 
-    modified = True
-    while modified:
-        modified = False
-        trks = make_track_graphs(mod_voxels, contiguity)
-
-        for t in trks:
-            if len(t.nodes()) < min_vxls:
+    # The voxel graph is built once and the dropped voxels are removed
+    # from it. Dropping a voxel only modifies its neighbours, which
+    # belong to the same track, so only the tracks that have been
+    # modified in a pass need to be checked again in the next one.
+    # They are visited in the order of their first voxel, as if the
+    # track graphs were rebuilt from the remaining voxels.
+    order        = {v: i for i, v in enumerate(mod_voxels)}
+    voxel_graph  = make_voxel_graph(mod_voxels, contiguity)
+    first_voxel  = lambda track: min(map(order.get, track))
+    active_trks  = sorted(nx.connected_components(voxel_graph), key=first_voxel)
+
+    while active_trks:
+        modified_trks = []
+        for t in active_trks:
+            if len(t) < min_vxls:
                 continue
 
-            for extreme in find_extrema(t):
+            modified = False
+            for extreme in find_extrema(voxel_graph.subgraph(t)):
                 if extreme.E < energy_threshold:
                     ### be sure that the voxel to be eliminated has at least one neighbour
                     ### beyond itself
-                    n_neighbours = sum(neighbours(extreme, v, contiguity) for v in mod_voxels)
-                    if n_neighbours > 1:
-                        mod_voxels    .remove(extreme)
-                        dropped_voxels.append(extreme)
-                        drop_voxel(mod_voxels, extreme)
+                    if extreme in t and voxel_graph.degree(extreme) > 0:
+                        the_neighbours = sorted(voxel_graph.neighbors(extreme), key=order.get)
+                        voxel_graph   .remove_node(extreme)
+                        t             .remove     (extreme)
+                        dropped_voxels.append     (extreme)
+                        drop_voxel(the_neighbours, extreme)
                         nan_energy(extreme)
                         modified = True
 
+            if modified:
+                modified_trks.extend(nx.connected_components(voxel_graph.subgraph(t)))
+
+        active_trks = sorted(modified_trks, key=first_voxel)
+
+    mod_voxels = [v for v in mod_voxels if v in voxel_graph]
     return mod_voxels, dropped_voxels
 
 
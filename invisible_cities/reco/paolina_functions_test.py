@@ -44,8 +44,12 @@ from . paolina_functions import hits_in_blob
 from . paolina_functions import voxelize_hits
 from . paolina_functions import shortest_paths
 from . paolina_functions import make_track_graphs
+from . paolina_functions import neighbours
+from . paolina_functions import neighbour_pairs
 from . paolina_functions import voxels_from_track_graph
 from . paolina_functions import length
+from . paolina_functions import TrackDistances
+from . paolina_functions import track_extrema_and_length
 from . paolina_functions import drop_end_point_voxels
 from . paolina_functions import make_tracks
 from . paolina_functions import get_track_energy
@@ -270,6 +274,18 @@ def test_voxel_hits_are_same_as_original_ones(hits, requested_voxel_dimensions):
     assert  hits_read_from_voxels_s_all == hits_s_all
 
 
+@given(bunch_of_hits, box_sizes)
+def test_voxel_hits_keep_original_order(hits, requested_voxel_dimensions):
+    voxels = voxelize_hits(hits, requested_voxel_dimensions, strict_voxel_size=False)
+    position_in_input = {id(h): i for i, h in enumerate(hits)}
+
+    for v in voxels:
+        positions = [position_in_input[id(h)] for h in v.hits]
+        assert positions == sorted(positions)
+        for h in v.hits:
+            assert np.all(np.abs(h.pos - v.pos) <= v.size / 2 + 1e-9)
+
+
 def test_hits_on_border_are_assigned_to_correct_voxel():
     z = 10.
     energy = 1.
@@ -429,6 +445,69 @@ def test_length_cuts_corners(contiguity, expected_length):
     assert track_length == approx(expected_length)
 
 
+@given(bunch_of_hits, box_sizes)
+def test_track_extrema_and_length_same_as_all_pairs_dijkstra(hits, voxel_dimensions):
+    voxels = voxelize_hits(hits, voxel_dimensions)
+    for track in make_track_graphs(voxels):
+        distances = dict(nx.all_pairs_dijkstra_path_length(track, weight='distance'))
+        expected_length = max(max(d.values()) for d in distances.values())
+
+        a, b, track_length = track_extrema_and_length(track)
+        assert track_length        == approx(expected_length)
+        assert distances[a][b]     == approx(expected_length)
+        assert find_extrema(track) == (a, b)
+        assert length      (track) == track_length
+
+
+def test_track_extrema_and_length_approximate_search_exact_in_tree():
+    voxel_spec = ((0,0,0),
+                  (1,0,0),
+                  (1,1,0),
+                  (1,2,0),
+                  (0,2,0),
+                  (2,1,0))
+    vox_size = np.array([1,1,1])
+    voxels = [Voxel(x,y,z, 1, vox_size) for x,y,z in voxel_spec]
+    tracks = make_track_graphs(voxels, contiguity=Contiguity.FACE)
+    assert len(tracks) == 1
+
+    exact       = track_extrema_and_length(tracks[0])
+    approximate = track_extrema_and_length(tracks[0], max_voxels_all_pairs=0)
+    assert approximate[:2] == exact[:2]
+    assert approximate[ 2] == approx(exact[2])
+    assert exact      [ 2] == approx(4)
+
+
+def test_track_extrema_and_length_exact_by_default():
+    # the double sweep from the first voxel misses the longest path
+    voxel_spec = ((0,2,0),
+                  (0,3,0),
+                  (1,2,0),
+                  (1,3,0),
+                  (2,2,0))
+    vox_size = np.array([1,1,1])
+    voxels = [Voxel(x,y,z, 1, vox_size) for x,y,z in voxel_spec]
+    track, = make_track_graphs(voxels, contiguity=Contiguity.FACE)
+
+    assert track_extrema_and_length(track                                 )[2] == approx(3)
+    assert track_extrema_and_length(track, max_voxels_all_pairs=len(track))[2] == approx(3)
+    assert track_extrema_and_length(track, max_voxels_all_pairs=0         )[2] == approx(2)
+
+
+def test_track_distances_shared_between_functions():
+    vox_size = np.array([1,1,1])
+    voxels = [Voxel(x,0,0, 1, vox_size) for x in range(4)]
+    track, = make_track_graphs(voxels)
+
+    distances = TrackDistances(track)
+    assert track_extrema_and_length(track, distances=distances) == track_extrema_and_length(track)
+    assert length(track) == approx(3)
+
+    # the distances are not reused once the track is modified
+    track.remove_node(voxels[-1])
+    assert length(track) == approx(2)
+
+
 
 FACE, EDGE, CORNER = Contiguity
 @parametrize('contiguity,  proximity,          are_neighbours',
@@ -467,6 +546,24 @@ def test_contiguity(proximity, contiguity, are_neighbours):
     assert len(tracks) == expected_number_of_tracks
 
 
+@parametrize("contiguity", Contiguity)
+@parametrize("same_size" , (True, False))
+@given(hits=bunch_of_hits, voxel_dimensions=box_sizes)
+def test_neighbour_pairs_same_as_all_pairs(hits, voxel_dimensions, contiguity, same_size):
+    voxels = voxelize_hits(hits, voxel_dimensions)
+    if not same_size:
+        for i, v in enumerate(voxels):
+            v._size = v.size * (1 + i % 2)
+
+    pairs, distances = neighbour_pairs(voxels, contiguity)
+
+    expected_pairs     = [(i, j) for (i, va), (j, vb) in combinations(enumerate(voxels), 2)
+                          if neighbours(va, vb, contiguity)]
+    expected_distances = [np.linalg.norm(voxels[i].pos - voxels[j].pos) for i, j in expected_pairs]
+    assert pairs.tolist() == list(map(list, expected_pairs))
+    assert distances      == approx(expected_distances)
+
+
 @given(bunch_of_hits, box_sizes, min_n_of_voxels, fraction_zero_one)
 def test_energy_is_conserved_with_dropped_voxels(hits, requested_voxel_dimensions, min_voxels, fraction_zero_one):
     tot_initial_energy = sum(h.E for h in hits)
@@ -641,6 +738,29 @@ def test_drop_voxels_deterministic(ICDATADIR):
         assert np.isclose(v1.E, v2.E)
 
 
+def test_drop_end_point_voxels_tracks_are_independent():
+    vox_size = np.array([1,1,1])
+    def make_track(x0, energies):
+        return [Voxel(x0 + i, 0, 0, e, vox_size) for i, e in enumerate(energies)]
+
+    energies_1 = 0.1, 0.2, 5, 5, 5, 0.3
+    energies_2 = 0.4, 5, 5, 0.1, 0.2
+    e_thr      = 1
+    min_voxels = 3
+
+    mod_1, dropped_1 = drop_end_point_voxels(make_track( 0, energies_1), e_thr, min_voxels)
+    mod_2, dropped_2 = drop_end_point_voxels(make_track(10, energies_2), e_thr, min_voxels)
+    mod  , dropped   = drop_end_point_voxels(make_track( 0, energies_1) +
+                                             make_track(10, energies_2), e_thr, min_voxels)
+
+    assert [v.XYZ for v in mod    ] == [v.XYZ for v in mod_1 + mod_2]
+    assert [v.E   for v in mod    ] == approx([v.E for v in mod_1 + mod_2])
+    assert sorted(v.XYZ for v in dropped) == sorted(v.XYZ for v in dropped_1 + dropped_2)
+    assert len(mod_1) == 3
+    assert len(mod_2) == 2
+    assert sum(v.E for v in mod) == approx(sum(energies_1) + sum(energies_2))
+
+
 def test_voxel_drop_in_short_tracks():
     hits = [BHit(10, 10, 10, 1), BHit(26, 10, 10, 1)]
     voxels = voxelize_hits(hits, [15,15,15], strict_voxel_size=True)
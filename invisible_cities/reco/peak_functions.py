@@ -155,14 +155,23 @@ def get_pmap(ccwf, s1_indx, s2_indx, sipm_zs_wf,
                            **s2_params))
 
 
-def rebin_times_and_waveforms(times, widths, waveforms,
-                              rebin_stride=2, slices=None):
-    if rebin_stride < 2: return times, widths, waveforms
-
-    if slices is None:
-        n_bins = int(np.ceil(len(times) / rebin_stride))
-        reb    = rebin_stride
-        slices = [slice(reb * i, reb * (i + 1)) for i in range(n_bins)]
+def _slice_boundaries(slices, size):
+    """
+    Return the first index of each slice if `slices` is a partition
+    of a sequence of length `size` into consecutive, non-empty slices
+    (possibly skipping the first samples). Return None otherwise.
+    """
+    starts = np.array([0 if sl.start is None else sl.start for sl in slices])
+    stops  = np.array([sl.stop for sl in slices[:-1]])
+    last   = slices[-1].stop
+    if (starts[0] < 0 or np.any(stops != starts[1:]) or np.any(np.diff(starts) <= 0) or
+        starts[-1] >= size or (last is not None and last < size) or
+        any(sl.step not in (None, 1) for sl in slices)):
+        return None
+    return starts
+
+
+def _rebin_slice_by_slice(times, widths, waveforms, slices):
     n_sensors = waveforms.shape[0]
 
     rebinned_times  = np.zeros(            len(slices) )
@@ -181,3 +190,59 @@ def rebin_times_and_waveforms(times, widths, waveforms,
         rebinned_widths[   i] = np.sum    (  widths[sl])
         rebinned_wfs   [:, i] = np.sum    (e,    axis=1)
     return rebinned_times, rebinned_widths, rebinned_wfs
+
+
+def rebin_times_and_waveforms(times, widths, waveforms,
+                              rebin_stride=2, slices=None):
+    """
+    Merge consecutive samples of a set of waveforms. Each new sample
+    contains the sum of the merged samples for each sensor, the sum
+    of their widths and their average time weighted with the (positive
+    part of the) charge summed over sensors. The average is unweighted
+    if no charge is positive.
+
+    The samples are merged either in groups of `rebin_stride` or as
+    given by `slices`. When the slices are consecutive (as those
+    produced by `pmaps_functions.get_even_slices` and
+    `get_threshold_slices`) all of them are computed at once with
+    `np.add.reduceat`. Otherwise each slice is processed separately.
+    """
+    if rebin_stride < 2: return times, widths, waveforms
+
+    times     = np.asarray(times)
+    widths    = np.asarray(widths)
+    n_sensors = waveforms.shape[0]
+    if slices is None:
+        n_bins = int(np.ceil(len(times) / rebin_stride))
+        starts = np.arange(n_bins) * rebin_stride
+        end    = n_bins * rebin_stride
+    elif len(slices):
+        starts = _slice_boundaries(slices, len(times))
+        end    = slices[-1].stop
+        if starts is None:
+            return _rebin_slice_by_slice(times, widths, waveforms, slices)
+    else:
+        starts = np.empty(0, dtype=int)
+
+    if starts.size == 0:
+        return np.zeros(0), np.zeros(0), np.zeros((n_sensors, 0))
+
+    first           = starts[0]
+    rel_starts      = starts - first
+    times           = times    [   first:end]
+    widths          = widths   [   first:end]
+    waveforms       = waveforms[:, first:end]
+    n_samples       = np.diff(np.append(rel_starts, times.size))
+
+    ## Weight with the charge sum per slice
+    ## if positive and unweighted if all
+    ## negative.
+    charge          = np.sum(waveforms, axis=0).clip(0)
+    sum_charge      = np.add.reduceat(charge        , rel_starts, dtype=np.float64)
+    sum_times       = np.add.reduceat(charge * times, rel_starts, dtype=np.float64)
+    unweighted      = np.add.reduceat(times         , rel_starts, dtype=np.float64) / n_samples
+    weighted        = sum_charge > 0
+    rebinned_times  = np.where(weighted, sum_times / np.where(weighted, sum_charge, 1), unweighted)
+    rebinned_widths = np.add.reduceat(widths   , rel_starts,         dtype=np.float64)
+    rebinned_wfs    = np.add.reduceat(waveforms, rel_starts, axis=1).astype(np.float64, copy=False)
+    return rebinned_times, rebinned_widths, rebinned_wfs
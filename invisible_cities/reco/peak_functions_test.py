@@ -614,3 +614,41 @@ def test_rebin_times_and_waveforms_negative_bins(ICDATADIR):
     pf.rebin_times_and_waveforms(s2.times             ,
                                  s2.bin_widths        ,
                                  s2.pmts.all_waveforms)
+
+
+@given(times_and_waveforms(), integers(2, 10), floats(-wf_max, 0))
+def test_rebin_times_and_waveforms_same_as_slice_by_slice(t_and_wf, stride, offset):
+    times, wfs = t_and_wf
+    wfs        = wfs + offset # allow negative samples
+    widths     = np.full(times.size, 1.)
+    slices     = [slice(i, i + stride) for i in range(0, times.size, stride)]
+
+    expected = pf._rebin_slice_by_slice    (times, widths, wfs, slices)
+    got      = pf.rebin_times_and_waveforms(times, widths, wfs, stride)
+    for value, expected_value in zip(got, expected):
+        assert value == approx(expected_value)
+
+
+def test_rebin_times_and_waveforms_all_negative_is_unweighted():
+    times  = np.arange(6.)
+    widths = np.ones  (6)
+    wfs    = np.array([[1, 3, -1, -2, -1, -2]])
+
+    rb_times, rb_widths, rb_wfs = pf.rebin_times_and_waveforms(times, widths, wfs, 3)
+    assert rb_times  == approx([3 / 4, 4])
+    assert rb_widths == approx([3, 3])
+    assert rb_wfs    == approx(np.array([[3, -5]]))
+
+
+@mark.parametrize("slices", ( [slice(0, 2), slice(3, 5)]    # gap
+                            , [slice(0, 3), slice(2, 5)]    # overlap
+                            , [slice(2, 5), slice(0, 2)] )) # unordered
+def test_rebin_times_and_waveforms_arbitrary_slices(slices):
+    times  = np.arange(5.)
+    widths = np.ones  (5)
+    wfs    = np.arange(10.).reshape(2, 5)
+
+    expected = pf._rebin_slice_by_slice    (times, widths, wfs, slices)
+    got      = pf.rebin_times_and_waveforms(times, widths, wfs, slices=slices)
+    for value, expected_value in zip(got, expected):
+        assert value == approx(expected_value)
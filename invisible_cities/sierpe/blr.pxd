@@ -17,6 +17,15 @@ acum_discharge_length: length to dicharge the accumulator in the absence
                        of signal.
 
 
+deconvolve_signals applies deconvolve_signal to several signals (one per PMT)
+at once, without the GIL.
+input:
+signals_daq: the raw signals, one per row (in doubles)
+coeff_clean, coeff_blr: one coefficient per signal
+thr_trigger, accum_discharge_length: as above
+out: optional preallocated output with the shape of signals_daq
+
+
 deconv_pmt performs the deconvolution for the PMTs of the energy plane
 input:
 pmtrwf:    the raw waveform for all the PMTs (shorts)
@@ -32,4 +41,11 @@ cpdef deconvolve_signal(double [:] signal_daq,
                         double     coeff_clean     = *,
                         double     coeff_blr       = *,
                         double     thr_trigger     = *,
-                        int accum_discharge_length = *)
\ No newline at end of file
+                        int accum_discharge_length = *)
+
+cpdef deconvolve_signals(double [:, :] signals_daq,
+                         double [:]    coeff_clean,
+                         double [:]    coeff_blr  ,
+                         double        thr_trigger            = *,
+                         int           accum_discharge_length = *,
+                         double [:, :] out                    = *)
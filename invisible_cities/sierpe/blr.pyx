@@ -1,5 +1,7 @@
 import  numpy as np
 cimport numpy as np
+cimport cython
+from libc.math       cimport sqrt
 from scipy import signal as SGN
 
 cpdef deconvolve_signal(double [:] signal_daq,
@@ -70,4 +72,95 @@ cpdef deconvolve_signal(double [:] signal_daq,
                 acum[k] = 0
                 j = 0
     # return recovered signal
-    return np.asarray(signal_r)
\ No newline at end of file
+    return np.asarray(signal_r)
+
+
+# Coefficients (b0, b1, a1) of the first order high-pass Butterworth
+# filter used to clean the signal, by cleaning coefficient
+_cleaning_filters = {}
+
+cdef _cleaning_filter(double coeff_clean):
+    if coeff_clean not in _cleaning_filters:
+        b_cf, a_cf = SGN.butter(1, coeff_clean, 'high', analog=False)
+        _cleaning_filters[coeff_clean] = b_cf[0] / a_cf[0], b_cf[1] / a_cf[0], a_cf[1] / a_cf[0]
+    return _cleaning_filters[coeff_clean]
+
+
+# The caller ensures that the signal is not empty and coef is not
+# zero: errors raised here could not be propagated.
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _deconvolve_one(double [:] signal_daq,
+                          double [:] signal_r  ,
+                          double b0, double b1, double a1,
+                          double coef, double thr_trigger) nogil:
+    cdef int    len_signal_daq = signal_daq.shape[0]
+    cdef int    nn             = min(400, len_signal_daq) # fixed at 10 mus
+    cdef double thr_acum       = thr_trigger / coef
+    cdef double noise          = 0
+    cdef int    k
+
+    for k in range(nn):
+        noise += signal_daq[k] * signal_daq[k]
+    noise /= nn
+    cdef double trigger_line = thr_trigger * sqrt(noise)
+
+    # The cleaning filter is applied sample by sample, in the same
+    # order of operations as scipy.signal.lfilter
+    cdef double clean      = b0 * signal_daq[0]
+    cdef double clean_prev
+    cdef double acum_prev  = 0
+    cdef double acum
+
+    signal_r[0] = clean
+    for k in range(1, len_signal_daq):
+        clean_prev = clean
+        clean      = b0 * signal_daq[k] + (b1 * signal_daq[k-1] - a1 * clean_prev)
+
+        # always update signal and accumulator
+        signal_r[k] = clean + clean * (coef / 2) + coef * acum_prev
+        acum        = acum_prev + clean
+
+        if (clean < trigger_line) and (acum_prev < thr_acum):
+            # discharge accumulator
+            if acum_prev > 1: acum = acum_prev * (1 - coef)
+            else            : acum = 0
+        acum_prev = acum
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef deconvolve_signals(double [:, :] signals_daq,
+                         double [:]    coeff_clean,
+                         double [:]    coeff_blr  ,
+                         double        thr_trigger            =     5,
+                         int           accum_discharge_length =  5000,
+                         double [:, :] out                    = None):
+    """
+    Apply `deconvolve_signal` to each row of `signals_daq` (one per
+    PMT) with the corresponding coefficients. The filter coefficients
+    are computed once per cleaning coefficient and the deconvolution
+    of all PMTs runs without the GIL. The result is written into `out`
+    if given.
+    """
+    cdef int n_pmts = signals_daq.shape[0]
+    if coeff_clean.shape[0] != n_pmts or coeff_blr.shape[0] != n_pmts:
+        raise ValueError("deconvolve_signals requires one pair of coefficients per signal")
+    if n_pmts and signals_daq.shape[1] == 0:
+        raise ValueError("deconvolve_signals requires non-empty signals")
+    if np.any(np.asarray(coeff_blr) == 0):
+        raise ValueError("deconvolve_signals requires non-zero coeff_blr")
+    if out is None:
+        out = np.empty((n_pmts, signals_daq.shape[1]), dtype=np.double)
+    elif out.shape[0] != n_pmts or out.shape[1] != signals_daq.shape[1]:
+        raise ValueError("deconvolve_signals: `out` must have the same shape as `signals_daq`")
+
+    cdef double [:, :] filters = np.array([_cleaning_filter(c) for c in coeff_clean], dtype=np.double).reshape(n_pmts, 3)
+    cdef int i
+    with nogil:
+        for i in range(n_pmts):
+            _deconvolve_one(signals_daq[i], out[i],
+                            filters[i, 0], filters[i, 1], filters[i, 2],
+                            coeff_blr[i], thr_trigger)
+    return np.asarray(out)
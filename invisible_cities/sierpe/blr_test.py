@@ -5,6 +5,7 @@ import tables as tb
 
 from pytest import fixture
 from pytest import mark
+from pytest import raises
 from flaky  import flaky
 
 from .. calib import calib_sensors_functions as csf
@@ -144,3 +145,43 @@ def test_deconv_pmt_ad_hoc_signals_dead_sensors(ad_hoc_blr_signals):
                                   rep_thr              , rep_acc             )))
 
     np.allclose(blr_wfs, evt_true_blr_wfs[pmt_active])
+
+
+def test_deconvolve_signals_same_as_deconvolve_signal(sin_wf_params):
+    n_baseline, params = sin_wf_params
+    n_pmts      = 5
+    wfs         = np.random.normal(0, 2, size=(n_pmts, 3 * n_baseline))
+    wfs[:, 600:800] += np.random.uniform(10, 100, size=(n_pmts, 1))
+    coeff_clean = np.random.uniform(0.5, 2, n_pmts) * params.coeff_clean
+    coeff_blr   = np.random.uniform(0.5, 2, n_pmts) * params.coeff_blr
+
+    got = blr.deconvolve_signals(wfs, coeff_clean, coeff_blr,
+                                 thr_trigger            = params.thr_trigger,
+                                 accum_discharge_length = params.accum_discharge_length)
+
+    for wf, c_clean, c_blr, got_wf in zip(wfs, coeff_clean, coeff_blr, got):
+        expected = blr.deconvolve_signal(wf, c_clean, c_blr,
+                                         thr_trigger            = params.thr_trigger,
+                                         accum_discharge_length = params.accum_discharge_length)
+        assert np.array_equal(got_wf, expected)
+
+
+def test_deconvolve_signals_writes_into_out():
+    wfs = np.random.normal(0, 2, size=(3, 1000))
+    out = np.empty_like(wfs)
+    got = blr.deconvolve_signals(wfs, np.full(3, 1e-6), np.full(3, 1e-3), out=out)
+    assert np.shares_memory(got, out)
+
+
+@mark.parametrize("n_coeff_clean n_coeff_blr".split(), ((2, 3), (3, 2)))
+def test_deconvolve_signals_raises_ValueError_with_wrong_number_of_coefficients(n_coeff_clean, n_coeff_blr):
+    wfs = np.zeros((3, 1000))
+    with raises(ValueError):
+        blr.deconvolve_signals(wfs, np.full(n_coeff_clean, 1e-6), np.full(n_coeff_blr, 1e-3))
+
+
+@mark.parametrize("wfs coeff_blr".split(), ((np.zeros((2,    0)), np.full(2, 1e-3)),
+                                            (np.zeros((2, 1000)), np.array([1e-3, 0]))))
+def test_deconvolve_signals_raises_ValueError_with_invalid_input(wfs, coeff_blr):
+    with raises(ValueError):
+        blr.deconvolve_signals(wfs, np.full(2, 1e-6), coeff_blr)
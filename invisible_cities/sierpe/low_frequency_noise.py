@@ -51,6 +51,51 @@ def buffer_and_limits(buffer_length, buffer_bin_width, FE_data):
     return freq_contribution, frequency_low, frequency_high
 
 
+def febox_noise(FE_data, buffer_length, buffer_bin_width=25e-9):
+    """
+    Randomises frequencies, magnitudes and phases and
+    returns the simulated low frequency noise of each
+    front-end box.
+
+    Parameters
+    ----------
+    FE_data          : np.ndarray with the frequencies (first column)
+                       and the magnitudes for each box (other columns)
+    buffer_length    : length of buffer to be simulated in no. samples
+    buffer_bin_width : sample width in buffer
+
+    Returns
+    -------
+    np.ndarray with shape (number of boxes, buffer_length)
+    """
+    n_febox = FE_data.shape[1] - 1
+    times   = buffer_bin_width * np.arange(buffer_length)
+
+    _, frequency_low, frequency_high = buffer_and_limits(buffer_length,
+                                                         buffer_bin_width,
+                                                         FE_data[:, 0])
+
+    ## Randomise frequencies
+    rot_frequencies = 2 * np.pi * np.random.uniform(frequency_low, frequency_high)
+
+    ## Randomise magnitudes and phases. mag_rms ~ 0.5 * mag_mean
+    magnitudes = np.random.normal(FE_data[:, 1:], FE_data[:, 1:] * 0.5).T
+    phases     = np.random.uniform(-np.pi, np.pi, magnitudes.shape)
+
+    ## Sum of the contributions of all frequencies, one box at a time
+    noise = np.empty((n_febox, buffer_length))
+    for febox in range(n_febox):
+        oscillations = np.cos(np.multiply.outer(rot_frequencies, times) + phases[febox][:, np.newaxis])
+        noise[febox] = 2 * magnitudes[febox] @ oscillations
+    return noise
+
+
+def pmt_feboxes(FE_mapping, sens_id):
+    """ Front-end box of each PMT, given their sensor ids """
+    febox = dict(zip(FE_mapping.SensorID, FE_mapping.FEBox))
+    return np.array([febox[i] for i in sens_id])
+
+
 def low_frequency_noise(detector_db, run_number, buffer_length, buffer_bin_width=25e-9):
     """
     Randomises frequencies, magnitudes and phases and
@@ -63,31 +108,7 @@ def low_frequency_noise(detector_db, run_number, buffer_length, buffer_bin_width
     ## Need to protect for old runs where PMT indx != sensorID
     sens_id       = DB.DataPMT(detector_db, run_number).SensorID.values
 
-    n_febox       = FE_data.shape[1] - 1
-    n_frequencies = FE_data.shape[0]
-
-    freq_contrib, freq_low, freq_high = buffer_and_limits(buffer_length,
-                                                          buffer_bin_width,
-                                                          FE_data[:, 0])
-
-    ## Randomise frequencies
-    rot_frequencies = 2 * np.pi * np.random.uniform(freq_low, freq_high)
-    rot_frequencies = np.tile(rot_frequencies, n_febox)
-
-    ## Randomise magnitudes and phases. mag_rms ~ 0.5 * mag_mean
-    magnitudes = np.array(tuple(map(np.random.normal    ,
-                                    FE_data[:, 1:]      ,
-                                    FE_data[:, 1:] * 0.5)))
-    ## Reshape to ease mapping
-    magnitudes = magnitudes.T.reshape(magnitudes.size,)
-
-    phases     = np.random.uniform(-np.pi, np.pi, magnitudes.shape)
-
-    noise = np.array(tuple(map(freq_contrib   ,
-                               rot_frequencies,
-                               magnitudes     ,
-                               phases         )))
-    noise = noise.reshape(n_febox, n_frequencies, buffer_length).sum(axis=1)
+    noise = febox_noise(FE_data, buffer_length, buffer_bin_width)
 
     def get_low_frequency_noise(indx_pmt):
         """ Returns the appropriate vector """
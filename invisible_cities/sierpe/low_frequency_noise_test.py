@@ -1,4 +1,5 @@
-import numpy as np
+import numpy  as np
+import pandas as pd
 
 from numpy.testing import assert_allclose
 
@@ -53,3 +54,25 @@ def test_low_frequency_noise(dbnew):
     assert np.any(np.diff(pmt_noise, axis = 0))
     ## then that not all are
     assert not np.all(np.diff(pmt_noise, axis = 0))
+
+
+def test_febox_noise_shape_and_boxes():
+    buffer_len  = 400
+    frequencies = np.arange(15000, 20000, 500.)
+    magnitudes  = np.zeros((len(frequencies), 3))
+    magnitudes[:, 1] = 1e-3
+    FE_data     = np.column_stack([frequencies, magnitudes])
+
+    noise = lfn.febox_noise(FE_data, buffer_len)
+
+    assert noise.shape == (3, buffer_len)
+    ## Boxes without magnitude get no noise
+    assert not np.any(noise[[0, 2]])
+    assert     np.any(noise[1])
+
+
+def test_pmt_feboxes():
+    FE_mapping = pd.DataFrame(dict(SensorID = [ 0, 1, 2, 3],
+                                   FEBox    = [ 1, 0, 2, 1]))
+
+    assert np.array_equal(lfn.pmt_feboxes(FE_mapping, [3, 1, 2]), [1, 0, 2])